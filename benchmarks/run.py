@@ -0,0 +1,227 @@
+"""Benchmarks of the collection wrapper and the AG Grid query builder
+
+    python benchmarks/run.py                        # against mongomock, compared to benchmarks/baseline.json
+    python benchmarks/run.py --uri mongodb://localhost:27017
+    python benchmarks/run.py --save                 # store the results as the new baseline
+
+Every benchmark reports the best time per operation over `--repeat` runs. A benchmark slower than its baseline
+by more than `--threshold` is a regression, and the script exits with status 1. Baselines are only comparable
+on the machine and backend they were recorded on, so `--baseline` can point to one file per environment.
+The "overhead" benchmarks time each wrapper method next to the raw pymongo call it makes.
+"""
+
+import argparse
+import importlib.util
+import io
+import json
+import sys
+import timeit
+from collections.abc import Callable
+from pathlib import Path
+
+from pymongo_util.mongo_tools.base_models import AGGridTableRequest
+from pymongo_util.mongo_tools.mongo_util import MongoConnect
+from pymongo_util.mongo_tools.query_buidler import AGGridMongoQueryUtil
+
+BASELINE = Path(__file__).with_name("baseline.json")
+DATABASE = "pymongo_util_benchmarks"
+
+
+def make_client(uri: str | None):
+    if uri:
+        from pymongo import MongoClient
+
+        return MongoClient(uri)
+    import mongomock
+
+    return mongomock.MongoClient()
+
+
+def filter_model(columns: int) -> dict:
+    """A realistic filter model, mixing set, text, number and combined filters over `columns` columns"""
+    kinds = [
+        lambda i: {"filterType": "set", "values": [f"v{i}", f"w{i}"]},
+        lambda i: {"filterType": "text", "type": "startsWith", "filter": f"name{i}"},
+        lambda i: {
+            "filterType": "number",
+            "type": "inRange",
+            "filter": i,
+            "filterTo": i + 10,
+        },
+        lambda i: {
+            "filterType": "number",
+            "operator": "OR",
+            "conditions": [
+                {"type": "lessThan", "filter": i},
+                {"type": "greaterThan", "filter": i * 10},
+            ],
+        },
+    ]
+    return {f"col{i}": kinds[i % len(kinds)](i) for i in range(columns)}
+
+
+def grid_request(columns: int, start_row: int = 0) -> AGGridTableRequest:
+    return AGGridTableRequest.model_validate(
+        {
+            "startRow": start_row,
+            "endRow": start_row + 100,
+            "filters": {
+                "filterModel": filter_model(columns),
+                "sortModel": [{"colId": "col0", "sort": "asc"}],
+            },
+        }
+    )
+
+
+def overhead_benchmarks(coll, raw, inserts, raw_inserts) -> dict[str, Callable]:
+    # inserts go to their own collection, so that the other benchmarks read a collection of constant size
+    return {
+        "overhead.insert_one.wrapper": lambda: inserts.insert_one({"k": 1}),
+        "overhead.insert_one.raw": lambda: raw_inserts.insert_one({"k": 1}),
+        "overhead.find_one.wrapper": lambda: coll.find_one({"i": 500}),
+        "overhead.find_one.raw": lambda: raw.find_one({"i": 500}, {"_id": 0}),
+        "overhead.find.wrapper": lambda: list(coll.find({"g": 3}, limit=20)),
+        "overhead.find.raw": lambda: list(raw.find({"g": 3}, {"_id": 0}).limit(20)),
+        "overhead.update_one.wrapper": lambda: coll.update_one({"i": 1}, {"v": 2}),
+        "overhead.update_one.raw": lambda: raw.update_one({"i": 1}, {"$set": {"v": 2}}),
+        "overhead.find_count.wrapper": lambda: coll.find_count({"g": 3}),
+        "overhead.find_count.raw": lambda: raw.count_documents({"g": 3}),
+        "overhead.distinct.wrapper": lambda: coll.distinct("g"),
+        "overhead.distinct.raw": lambda: raw.distinct("g", {}),
+        "overhead.aggregate.wrapper": lambda: list(
+            coll.aggregate([{"$match": {"g": 3}}, {"$limit": 20}])
+        ),
+        "overhead.aggregate.raw": lambda: list(
+            raw.aggregate([{"$match": {"g": 3}}, {"$limit": 20}])
+        ),
+    }
+
+
+def builder_benchmarks() -> dict[str, Callable]:
+    benchmarks = {}
+    for columns in (1, 5, 20, 50):
+        requests = [
+            grid_request(columns, start_row) for start_row in range(0, 1000, 100)
+        ]
+        cold = AGGridMongoQueryUtil()
+        warm = AGGridMongoQueryUtil(cache_size=256)
+
+        def run(util=cold, requests=requests):
+            for request in requests:
+                util.build_query(request)
+
+        benchmarks[f"build_query.{columns}_columns.uncached"] = run
+        benchmarks[f"build_query.{columns}_columns.cached"] = lambda r=run, w=warm: r(w)
+    return benchmarks
+
+
+def throughput_benchmarks(base_class, client) -> dict[str, Callable]:
+    documents = [
+        {"i": i, "g": i % 10, "nested": {"a": i, "b": str(i)}} for i in range(5000)
+    ]
+    source = base_class(client, DATABASE, "export", soft_delete=False)
+    source.client[DATABASE]["export"].drop()
+    source.insert_many([dict(document) for document in documents])
+
+    def insert(**kwargs):
+        target = base_class(client, DATABASE, "insert", soft_delete=False)
+        target.client[DATABASE]["insert"].drop()
+        target.insert_many(iter(dict(document) for document in documents), **kwargs)
+
+    benchmarks = {
+        "insert_many.5000_docs": lambda: insert(),
+        "insert_many.5000_docs.chunked_500": lambda: insert(chunk_size=500),
+        "export.ndjson.5000_docs": lambda: source.export(io.BytesIO(), "ndjson"),
+        "export.csv.5000_docs": lambda: source.export(io.BytesIO(), "csv"),
+    }
+    if importlib.util.find_spec("numpy"):
+        schema = {"i": "int64", "g": "int32", "nested.a": "float64"}
+        benchmarks["find_columnar.5000_docs"] = lambda: source.find_columnar({}, schema)
+    return benchmarks
+
+
+def measure(benchmarks: dict[str, Callable], repeat: int) -> dict[str, float]:
+    results = {}
+    for name, func in benchmarks.items():
+        number, _ = timeit.Timer(func).autorange()
+        best = min(timeit.repeat(func, number=number, repeat=repeat))
+        results[name] = best / number
+        print(f"{name:55} {results[name] * 1e6:12.1f} us")
+    return results
+
+
+def compare(
+    results: dict[str, float], baseline: dict[str, float], threshold: float
+) -> list[str]:
+    regressions = []
+    for name, seconds in results.items():
+        if (reference := baseline.get(name)) and seconds > reference * (1 + threshold):
+            regressions.append(
+                f"{name}: {seconds * 1e6:.1f} us, baseline {reference * 1e6:.1f} us "
+                f"(+{(seconds / reference - 1) * 100:.0f}%)"
+            )
+    return regressions
+
+
+def run(
+    uri: str | None = None, repeat: int = 5, only: str | None = None
+) -> dict[str, float]:
+    client = make_client(uri)
+    base_class = MongoConnect(client=client).get_base_class()
+    coll = base_class(client, DATABASE, "overhead", soft_delete=False)
+    raw = client[DATABASE]["overhead"]
+    raw.drop()
+    raw.insert_many([{"i": i, "g": i % 10} for i in range(1000)])
+    inserts = base_class(client, DATABASE, "inserts", soft_delete=False)
+    benchmarks = (
+        overhead_benchmarks(coll, raw, inserts, client[DATABASE]["inserts"])
+        | builder_benchmarks()
+        | throughput_benchmarks(base_class, client)
+    )
+    if only:
+        benchmarks = {name: func for name, func in benchmarks.items() if only in name}
+    try:
+        return measure(benchmarks, repeat)
+    finally:
+        client.drop_database(DATABASE)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--uri", help="mongod to run against, mongomock when not given")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument(
+        "--threshold", type=float, default=0.25, help="allowed slowdown, 0.25 is 25%%"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", help="run the benchmarks whose name contains this")
+    parser.add_argument(
+        "--save", action="store_true", help="store the results as the baseline"
+    )
+    args = parser.parse_args()
+
+    results = run(args.uri, args.repeat, args.only)
+    if args.save:
+        baseline = (
+            json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+        )
+        args.baseline.write_text(
+            json.dumps(baseline | results, indent=2, sort_keys=True) + "\n"
+        )
+        print(f"baseline saved to {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        print(f"no baseline at {args.baseline}, run with --save to create one")
+        return 0
+    regressions = compare(
+        results, json.loads(args.baseline.read_text()), args.threshold
+    )
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
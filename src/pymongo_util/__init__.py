@@ -34,15 +34,73 @@ Example:
     def list_registered_plugins(self, skip: int, limit: int, filters: dict) -> CursorType:
         return self.find(query=filters, skip=skip, limit=limit)
     ```
+
+3. For asyncio applications inherit `AsyncCollectionBaseClass` instead and pass `mongo_obj.async_client`.
+   The methods are the same, but they must be awaited (`find` returns an `AsyncCursor` for `async for`).
+
+The attributes below are resolved on first access: importing the package reads no configuration, creates no
+client and does not import pymongo nor pydantic.
 """
 
-from .mongo_tools.mongo_util import MongoConnect
-from .mongo_tools.util_configs import MongoConfig
+import os
+import threading
+
+_lock = threading.RLock()
+
+
+def _resolve(name: str):
+    if name == "MongoConfig":
+        from .mongo_tools.util_configs import MongoConfig
+
+        return MongoConfig
+    if name == "mongo_obj":
+        from .mongo_tools.mongo_util import MongoConnect
+
+        return MongoConnect()
+    mongo_obj = __getattr__("mongo_obj")
+    if name == "mongo_client":
+        return mongo_obj()
+    if name == "CollectionBaseClass":
+        return mongo_obj.get_base_class()
+    return mongo_obj.get_async_base_class()
+
+
+def __getattr__(name: str):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _lock:
+        # another thread may have resolved it while this one waited
+        if name not in globals():
+            globals()[name] = _resolve(name)
+    return globals()[name]
+
+
+def _after_fork() -> None:
+    # the client resolved in the parent is not usable in a forked child, resolve it again on next access
+    global _lock
+    _lock = threading.RLock()
+    globals().pop("mongo_client", None)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
+
 
-mongo_obj = MongoConnect()
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
 
-mongo_client = mongo_obj()
 
-CollectionBaseClass = mongo_obj.get_base_class()
+_LAZY_ATTRIBUTES = (
+    "mongo_obj",
+    "mongo_client",
+    "CollectionBaseClass",
+    "AsyncCollectionBaseClass",
+    "MongoConfig",
+)
 
-__all__ = ["mongo_client", "CollectionBaseClass", "MongoConfig"]
+__all__ = [
+    "mongo_client",
+    "CollectionBaseClass",
+    "AsyncCollectionBaseClass",
+    "MongoConfig",
+]
@@ -1,2 +1,6 @@
 class QueryFormationError(Exception):
     """raises when there is an issue in Query formation"""
+
+
+class InvalidCursorError(QueryFormationError):
+    """raises when a pagination cursor is malformed or was issued for another query"""
@@ -11,8 +11,8 @@ class AGGridFilterModel(BaseModel):
     filter_model: dict = {}
     value_cols: list = []
     pivot_cols: list = []
-    pivot_mode: str | None = None
-    quick_filter: bool = False
+    pivot_mode: bool | str | None = None
+    quick_filter: bool | str = False
     flag_columns: list = []
     flag_filters: list = []
 
@@ -26,6 +26,16 @@ class AGGridTableRequest(BaseModel):
     global_filters: dict = {}
     start_row: int = 0
     end_row: int = 100
+    cursor: str | None = None
 
 
-__all__ = ["AGGridTableRequest", "AGGridFilterModel"]
+class AGGridTableResponse(BaseModel):
+    model_config = ConfigDict(alias_generator=to_camel, populate_by_name=True)
+
+    row_data: list = []
+    last_row: int | None = None
+    cursor: str | None = None
+    pivot_result_fields: list[str] | None = None
+
+
+__all__ = ["AGGridTableRequest", "AGGridFilterModel", "AGGridTableResponse"]
@@ -0,0 +1,255 @@
+"""Batching loaders
+Single document lookups on the same field, e.g. `find_one({"registered_plugin_id": x})` once per reference,
+are collected for a short window and sent as a single `find({field: {"$in": keys}})`. Every caller gets the
+document of its own key, or None, as `find_one` would have returned it.
+
+Keys must be hashable. When several documents share a key, the first one returned is used, as `find_one` does.
+Callers of the same key get their own copy of the document, so they can modify it.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, Any, Hashable, Iterable
+
+from .query_cache import _copy
+
+if TYPE_CHECKING:
+    from .mongo_async import AsyncMongoCollectionBaseClass
+    from .mongo_sync import MongoCollectionBaseClass
+
+_MISSING = object()
+
+
+def _lookup_projection(field: str, filter_dict: dict | None) -> tuple[dict, bool]:
+    """
+    Projection of the batched query, which must return `field` to map documents back to their keys
+    :return: the projection, and whether `field` has to be removed from the documents returned to callers
+    """
+    projection = dict({"_id": 0} if filter_dict is None else filter_dict)
+    if field in projection:
+        if projection[field]:
+            return projection, False
+        del projection[field]
+        return projection, True
+    # `_id` is returned unless excluded, other fields are left out by an inclusion projection
+    inclusion = any(value for key, value in projection.items() if key != "_id")
+    if inclusion and field != "_id":
+        projection[field] = 1
+        return projection, True
+    return projection, False
+
+
+def _get_path(document: dict, field: str) -> Any:
+    value: Any = document
+    for part in field.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _pop_path(document: dict, field: str) -> None:
+    *parents, last = field.split(".")
+    for part in parents:
+        document = document.get(part)
+        if not isinstance(document, dict):
+            return
+    document.pop(last, None)
+
+
+def _map_documents(
+    documents: Iterable[dict], field: str, strip: bool
+) -> dict[Hashable, dict]:
+    found: dict[Hashable, dict] = {}
+    for document in documents:
+        key = _get_path(document, field)
+        if strip:
+            _pop_path(document, field)
+        # an array field matches `$in` on any of its elements
+        for value in key if isinstance(key, list) else [key]:
+            if value is not _MISSING and value not in found:
+                found[value] = document
+    return found
+
+
+def _set_results(futures: list, document: dict | None) -> None:
+    """Resolves the futures of a key still awaited, the first with the document and the others with copies"""
+    waiting = [future for future in futures if not future.done()]
+    for i, future in enumerate(waiting):
+        future.set_result(document if i == 0 else _copy(document))
+
+
+class BatchLoader:
+    """
+    Coalesces `load` calls made from several threads within `window` seconds into one `$in` query.
+    The first call of a window starts a timer, the calls that follow wait for the same query.
+
+    Example:
+        loader = plugins.loader("registered_plugin_id")
+        with ThreadPoolExecutor() as pool:
+            documents = list(pool.map(loader.load, plugin_ids))
+        # or, when all the keys are known upfront
+        documents = loader.load_many(plugin_ids)
+    """
+
+    def __init__(
+        self,
+        collection: "MongoCollectionBaseClass",
+        field: str = "_id",
+        filter_dict: dict | None = None,
+        window: float = 0.002,
+        max_batch_size: int = 1000,
+    ) -> None:
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be a positive integer")
+        self.collection = collection
+        self.field = field
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._projection, self._strip = _lookup_projection(field, filter_dict)
+        self._pending: dict[Hashable, list[Future]] = {}
+        self._timer: threading.Timer | None = None
+        self._lock = threading.Lock()
+
+    def load(self, key: Hashable) -> dict | None:
+        """The document of `key`, waits for the batch it was added to"""
+        return self.load_future(key).result()
+
+    def load_future(self, key: Hashable) -> Future:
+        """Adds `key` to the next batch, a key already pending is sent once but each call gets its own future"""
+        future: Future = Future()
+        with self._lock:
+            if (futures := self._pending.get(key)) is not None:
+                futures.append(future)
+                return future
+            self._pending[key] = [future]
+            full = len(self._pending) >= self.max_batch_size
+            if not full and self._timer is None:
+                self._timer = threading.Timer(self.window, self.dispatch)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.dispatch()
+        return future
+
+    def load_many(self, keys: Iterable[Hashable]) -> list[dict | None]:
+        """Documents of `keys`, in order, sent without waiting for the window"""
+        futures = [self.load_future(key) for key in keys]
+        self.dispatch()
+        return [future.result() for future in futures]
+
+    def dispatch(self) -> None:
+        """Sends the pending keys now"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return
+        try:
+            found = _map_documents(
+                self.collection.find(
+                    {self.field: {"$in": list(pending)}}, self._projection, raw=False
+                ),
+                self.field,
+                self._strip,
+            )
+        except Exception as e:
+            for futures in pending.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+        for key, futures in pending.items():
+            _set_results(futures, found.get(key))
+
+
+class AsyncBatchLoader:
+    """
+    Coalesces the `load` calls awaited within `window` seconds on the running event loop into one `$in`
+    query. With the default window of 0 the batch holds the keys requested before the loop next runs the
+    loader, e.g. all the lookups started by one `asyncio.gather`.
+
+    Example:
+        loader = plugins.loader("registered_plugin_id")
+        documents = await asyncio.gather(*(loader.load(i) for i in plugin_ids))
+    """
+
+    def __init__(
+        self,
+        collection: "AsyncMongoCollectionBaseClass",
+        field: str = "_id",
+        filter_dict: dict | None = None,
+        window: float = 0,
+        max_batch_size: int = 1000,
+    ) -> None:
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be a positive integer")
+        self.collection = collection
+        self.field = field
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._projection, self._strip = _lookup_projection(field, filter_dict)
+        self._pending: dict[Hashable, list[asyncio.Future]] = {}
+        self._scheduled: asyncio.Task | None = None
+        # dispatches of full batches, referenced until they finish
+        self._dispatching: set[asyncio.Task] = set()
+
+    async def load(self, key: Hashable) -> dict | None:
+        """The document of `key`, waits for the batch it was added to"""
+        # every caller awaits its own future, cancelling one leaves the others of the key waiting
+        future = asyncio.get_running_loop().create_future()
+        if (futures := self._pending.get(key)) is not None:
+            futures.append(future)
+        else:
+            self._pending[key] = [future]
+            if len(self._pending) >= self.max_batch_size:
+                # in a task of its own, which runs to the end even if this caller is cancelled
+                task = asyncio.create_task(self.dispatch())
+                self._dispatching.add(task)
+                task.add_done_callback(self._dispatching.discard)
+            elif self._scheduled is None:
+                self._scheduled = asyncio.create_task(self._dispatch_later())
+        return await future
+
+    async def load_many(self, keys: Iterable[Hashable]) -> list[dict | None]:
+        """Documents of `keys`, in order"""
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    async def _dispatch_later(self) -> None:
+        try:
+            await asyncio.sleep(self.window)
+        finally:
+            self._scheduled = None
+        await self.dispatch()
+
+    async def dispatch(self) -> None:
+        """Sends the pending keys now"""
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            documents = await self.collection.find(
+                {self.field: {"$in": list(pending)}}, self._projection
+            ).to_list()
+            found = _map_documents(documents, self.field, self._strip)
+        except BaseException as e:
+            # a failed query fails its callers, a cancelled one cancels them, none is left waiting
+            for futures in pending.values():
+                for future in futures:
+                    if future.done():
+                        continue
+                    if isinstance(e, Exception):
+                        future.set_exception(e)
+                    else:
+                        future.cancel()
+            if not isinstance(e, Exception):
+                raise
+            return
+        for key, futures in pending.items():
+            _set_results(futures, found.get(key))
+
+
+__all__ = ["AsyncBatchLoader", "BatchLoader"]
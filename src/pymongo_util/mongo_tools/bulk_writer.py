@@ -0,0 +1,258 @@
+import sys
+import threading
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Mapping, Sequence
+
+try:
+    from pymongo import (
+        DeleteMany,
+        DeleteOne,
+        InsertOne,
+        ReplaceOne,
+        UpdateMany,
+        UpdateOne,
+    )
+    from pymongo.errors import BulkWriteError, PyMongoError
+except ImportError:  # pragma: no cover
+    sys.stderr.write("PyMongo not installed, run pip install pymongo")
+    raise
+
+if TYPE_CHECKING:
+    from .mongo_sync import MongoCollectionBaseClass
+
+
+@dataclass
+class BulkWriteSummary:
+    """Counts and errors aggregated over every batch sent by a `BulkWriter`"""
+
+    inserted_count: int = 0
+    matched_count: int = 0
+    modified_count: int = 0
+    deleted_count: int = 0
+    upserted_count: int = 0
+    upserted_ids: dict[int, Any] = field(default_factory=dict)
+    errors: list[dict] = field(default_factory=list)
+    batches: int = 0
+
+    def add(self, raw_result: Mapping[str, Any], positions: Sequence[int]) -> None:
+        """
+        Merge a raw bulk write result (`BulkWriteResult.bulk_api_result` or `BulkWriteError.details`)
+        :param raw_result: the raw result of a single `bulk_write` call
+        :param positions: position of each of the call's operations in the whole run, so that
+                indexes refer to the order in which operations were added to the writer
+        """
+        self.inserted_count += raw_result.get("nInserted", 0)
+        self.matched_count += raw_result.get("nMatched", 0)
+        self.modified_count += raw_result.get("nModified", 0)
+        self.deleted_count += raw_result.get("nRemoved", 0)
+        self.upserted_count += raw_result.get("nUpserted", 0)
+        for upserted in raw_result.get("upserted", []):
+            self.upserted_ids[positions[upserted["index"]]] = upserted["_id"]
+        for error in raw_result.get("writeErrors", []):
+            self.errors.append(error | {"index": positions[error["index"]]})
+
+    @property
+    def has_errors(self) -> bool:
+        return bool(self.errors)
+
+
+def upsert_operation(
+    document: Mapping[str, Any], key_fields: Sequence[str], strategy: str = "$set"
+) -> UpdateOne | ReplaceOne:
+    """
+    Upsert of a document on its natural key
+    :param document: the document, it must hold every key field
+    :param key_fields: fields identifying the document, dotted names reach into embedded documents
+    :param strategy: an update operator applied to the document ("$set", "$setOnInsert", ...) or
+            "replace" to replace the whole stored document
+    :return: the pymongo operation
+    """
+    query = {}
+    for key in key_fields:
+        value: Any = document
+        for part in key.split("."):
+            if not isinstance(value, Mapping) or part not in value:
+                raise ValueError(f"Document has no value for key field {key!r}")
+            value = value[part]
+        query[key] = value
+    if strategy == "replace":
+        return ReplaceOne(query, document, upsert=True)
+    if not strategy.startswith("$"):
+        raise ValueError(f"Unknown upsert strategy {strategy!r}")
+    return UpdateOne(query, {strategy: document}, upsert=True)
+
+
+class BulkWriter:
+    """
+    Buffers write operations of a collection class and sends them as unordered `bulk_write` batches.
+    A batch is flushed once `batch_size` operations are buffered, once the oldest buffered operation
+    is `max_age` seconds old, by a timer thread, and when the writer is closed. A flush that fails with an
+    error other than a write error puts the operations it did not send back in the buffer, for the next flush
+    to retry; the error of a timer flush is raised again by the next write.
+    When the collection soft deletes, buffered deletes go through its `delete_one`/`delete_many` instead,
+    so exactly the deleted documents are archived. Each of them runs at its position in the batch: the writes
+    buffered before it are sent first, in their own `bulk_write`.
+
+    Example:
+        with collection.bulk(batch_size=500) as writer:
+            for row in rows:
+                writer.update_one(query={"id": row["id"]}, data=row, upsert=True)
+        print(writer.summary.modified_count)
+    """
+
+    def __init__(
+        self,
+        collection: "MongoCollectionBaseClass",
+        batch_size: int = 1000,
+        max_age: float | None = None,
+        ordered: bool = False,
+    ) -> None:
+        if batch_size < 1:
+            raise ValueError("batch_size must be a positive integer")
+        self.collection = collection
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.ordered = ordered
+        self.summary = BulkWriteSummary()
+        self._operations: list[tuple[Any, dict | None]] = []
+        self._timer: threading.Timer | None = None
+        self._timer_error: Exception | None = None
+        self._sent = 0
+        self._lock = threading.RLock()
+
+    def __enter__(self) -> "BulkWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        # Buffered operations were requested before the failure, the same way unbuffered calls would
+        # already have been applied, so they are flushed regardless of how the block exits.
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self._operations)
+
+    def insert_one(self, data: dict) -> None:
+        self._add(InsertOne(data))
+
+    def update_one(
+        self, query: dict, data: dict, upsert: bool = False, strategy: str = "$set"
+    ) -> None:
+        self._add(UpdateOne(query, {strategy: data}, upsert=upsert))
+
+    def update_to_set(
+        self, query: dict, param: str, data: Any, upsert: bool = False
+    ) -> None:
+        self._add(UpdateOne(query, {"$addToSet": {param: data}}, upsert=upsert))
+
+    def update_many(self, query: dict, data: dict, upsert: bool = False) -> None:
+        self._add(UpdateMany(query, {"$set": data}, upsert=upsert))
+
+    def delete_one(self, query: dict) -> None:
+        self._add(DeleteOne(query), delete_query=query)
+
+    def delete_many(self, query: dict) -> None:
+        self._add(DeleteMany(query), delete_query=query)
+
+    def flush(self) -> BulkWriteSummary:
+        """
+        Sends every buffered operation to the server
+        :return: the summary aggregated over all flushes so far
+        """
+        with self._lock:
+            # the operations of a failed timer flush are back in the buffer, they are retried here
+            self._timer_error = None
+            operations, self._operations = self._operations, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not operations:
+                return self.summary
+            self.summary.batches += 1
+            # operations handed to the server, the others go back to the buffer when the flush fails
+            sent = 0
+            writes = []
+            try:
+                for index, (operation, delete_query) in enumerate(operations):
+                    position = self._sent + index
+                    if delete_query is None or not self.collection.soft_delete:
+                        writes.append((position, operation))
+                        continue
+                    # the delete must see the writes buffered before it
+                    if writes and not self._bulk_write(writes) and self.ordered:
+                        sent = len(operations)
+                        return self.summary
+                    sent = index
+                    writes = []
+                    self._soft_delete(position, operation, delete_query)
+                    sent = index + 1
+                if writes:
+                    self._bulk_write(writes)
+                sent = len(operations)
+            finally:
+                self._operations[:0] = operations[sent:]
+                self._sent += sent
+                self.collection.invalidate_cache()
+            return self.summary
+
+    def close(self) -> BulkWriteSummary:
+        return self.flush()
+
+    def _bulk_write(self, writes: list[tuple[int, Any]]) -> bool:
+        """:return: whether every write succeeded"""
+        database_name = self.collection.database
+        collection_name = self.collection.collection
+        db = self.collection.client[database_name]
+        collection = db[collection_name]
+        positions = [position for position, _ in writes]
+        try:
+            result = collection.bulk_write(
+                [operation for _, operation in writes], ordered=self.ordered
+            )
+            self.summary.add(result.bulk_api_result, positions)
+        except BulkWriteError as e:
+            self.summary.add(e.details, positions)
+            return False
+        return True
+
+    def _soft_delete(self, position: int, operation, query: dict) -> None:
+        try:
+            if isinstance(operation, DeleteOne):
+                result = self.collection.delete_one(query)
+            else:
+                result = self.collection.delete_many(query)
+            self.summary.deleted_count += result.deleted_count
+        except PyMongoError as e:
+            self.summary.errors.append(
+                {"index": position, "errmsg": str(e), "op": query}
+            )
+
+    def _raise_timer_error(self) -> None:
+        if (error := self._timer_error) is not None:
+            self._timer_error = None
+            raise error
+
+    def _flush_expired(self) -> None:
+        with self._lock:
+            if self._timer is not threading.current_thread():
+                # cancelled, or replaced after a flush, while waiting for the lock
+                return
+            self._timer = None
+            try:
+                self.flush()
+            except Exception as e:
+                self._timer_error = e
+
+    def _add(self, operation, delete_query: dict | None = None) -> None:
+        with self._lock:
+            self._raise_timer_error()
+            self._operations.append((operation, delete_query))
+            if len(self._operations) >= self.batch_size:
+                self.flush()
+            elif self.max_age is not None and self._timer is None:
+                # started by the oldest buffered operation
+                self._timer = threading.Timer(self.max_age, self._flush_expired)
+                self._timer.daemon = True
+                self._timer.start()
+
+
+__all__ = ["BulkWriteSummary", "BulkWriter", "upsert_operation"]
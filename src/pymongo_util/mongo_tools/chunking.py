@@ -0,0 +1,99 @@
+import sys
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, TypeVar
+
+try:
+    import bson
+except ImportError:  # pragma: no cover
+    sys.stderr.write("PyMongo not installed, run pip install pymongo")
+    raise
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+@dataclass
+class ChunkedInsertResult:
+    """
+    Merged result of an `insert_many` call that was sent in several chunks. Write errors are reported in
+    `errors`, with the position of their document in the input as `index`.
+    """
+
+    inserted_count: int = 0
+    inserted_ids: list[Any] = field(default_factory=list)
+    chunks: int = 0
+    acknowledged: bool = True
+    errors: list[dict] = field(default_factory=list)
+
+    @property
+    def has_errors(self) -> bool:
+        return bool(self.errors)
+
+
+def iter_chunks(
+    documents: Iterable[dict],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    max_chunk_bytes: int | None = None,
+) -> Iterator[list[dict]]:
+    """
+    Lazily splits an iterable of documents into lists bounded by document count and encoded BSON size
+    :param documents: Any iterable of documents, generators are consumed one chunk at a time
+    :param chunk_size: Maximum number of documents per chunk
+    :param max_chunk_bytes: Maximum encoded size of a chunk. A single larger document becomes a chunk of its own.
+            Sizes are only computed when this is set, as it costs one extra BSON encode per document.
+    :return: chunks of documents
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be a positive integer")
+    chunk: list[dict] = []
+    chunk_bytes = 0
+    for document in documents:
+        if max_chunk_bytes is not None:
+            size = len(bson.encode(document))
+            if chunk and chunk_bytes + size > max_chunk_bytes:
+                yield chunk
+                chunk, chunk_bytes = [], 0
+            chunk_bytes += size
+        chunk.append(document)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk, chunk_bytes = [], 0
+    if chunk:
+        yield chunk
+
+
+def map_chunks(
+    func: Callable[[T], R], chunks: Iterable[T], max_workers: int | None = None
+) -> Iterator[R]:
+    """
+    Applies `func` to every chunk, optionally over a thread pool, yielding results in submission order.
+    At most `2 * max_workers` chunks are in flight, so memory stays bounded for lazy inputs.
+    :param func: function sending a single chunk
+    :param chunks: iterable of chunks
+    :param max_workers: Number of threads. None or 1 runs the chunks sequentially in the calling thread
+    :return: results of `func`
+    """
+    if not max_workers or max_workers == 1:
+        for chunk in chunks:
+            yield func(chunk)
+        return
+    in_flight = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            for chunk in chunks:
+                in_flight.append(executor.submit(func, chunk))
+                if len(in_flight) >= 2 * max_workers:
+                    yield in_flight.popleft().result()
+            while in_flight:
+                yield in_flight.popleft().result()
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+
+__all__ = ["ChunkedInsertResult", "iter_chunks", "map_chunks"]
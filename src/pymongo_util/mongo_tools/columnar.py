@@ -0,0 +1,169 @@
+"""Columnar results
+Query results decoded into one NumPy array per field instead of one dict per document. Only the fields of
+the schema are fetched, through a projection, and the values of every cursor batch are written into
+pre-allocated arrays that double in size when full. NumPy is an optional dependency, install it with
+`pip install pymongo-util[numpy]`; the collection classes only import this module when a columnar method
+is called.
+"""
+
+import sys
+from collections.abc import Iterable, Mapping
+from typing import Any
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    sys.stderr.write("NumPy not installed, run pip install pymongo-util[numpy]")
+    raise
+
+DEFAULT_CAPACITY = 1024
+# rows buffered in lists before being written to the arrays, a slice assignment converts them in C
+FLUSH_SIZE = 1000
+
+
+def _fill_value(dtype) -> Any:
+    """Placeholder stored under masked values"""
+    if dtype.kind in "fc":
+        return np.nan
+    if dtype.kind in "mM":
+        return np.array(["NaT"], dtype=dtype)[0]
+    return np.zeros(1, dtype=dtype)[0]
+
+
+def schema_projection(schema: Mapping[str, Any]) -> dict:
+    """Projection fetching only the fields of a schema"""
+    projection = {field: 1 for field in schema}
+    if "_id" not in schema:
+        projection["_id"] = 0
+    return projection
+
+
+class ColumnarBuilder:
+    """
+    Appends documents to growable NumPy columns, one per field of the schema. Missing and null values are
+    masked. A value that cannot be converted to its column's dtype raises ValueError, so does a string longer
+    than the width of a "U"/"S" dtype, which NumPy would silently truncate.
+
+    Example:
+        builder = ColumnarBuilder({"price": "float64", "qty": "int32", "sku": "U16"})
+        builder.extend(documents)
+        columns = builder.columns()  # {"price": MaskedArray, ...}
+    """
+
+    def __init__(
+        self, schema: Mapping[str, Any], capacity: int = DEFAULT_CAPACITY
+    ) -> None:
+        """
+        :param schema: field name, dotted names reach into embedded documents, to NumPy dtype
+        :param capacity: rows allocated upfront, grown by doubling
+        """
+        if not schema:
+            raise ValueError("schema must name at least one field")
+        self.schema = {field: np.dtype(dtype) for field, dtype in schema.items()}
+        self._paths = {field: field.split(".") for field in self.schema}
+        self._fill = {field: _fill_value(dtype) for field, dtype in self.schema.items()}
+        self._capacity = max(capacity, 1)
+        self._values = {
+            field: np.empty(self._capacity, dtype=dtype)
+            for field, dtype in self.schema.items()
+        }
+        self._mask = {
+            field: np.zeros(self._capacity, dtype=bool) for field in self.schema
+        }
+        self._size = 0
+        self._pending: list[Mapping[str, Any]] = []
+
+    def __len__(self) -> int:
+        return self._size + len(self._pending)
+
+    def append(self, document: Mapping[str, Any]) -> None:
+        self._pending.append(document)
+        if len(self._pending) >= FLUSH_SIZE:
+            self._flush()
+
+    def extend(self, documents: Iterable[Mapping[str, Any]]) -> None:
+        pending = self._pending
+        for document in documents:
+            pending.append(document)
+            if len(pending) >= FLUSH_SIZE:
+                self._flush()
+
+    def _column_values(self, field: str) -> list:
+        path = self._paths[field]
+        if len(path) == 1:
+            return [document.get(field) for document in self._pending]
+        values = []
+        for document in self._pending:
+            value: Any = document
+            for part in path:
+                value = value.get(part) if isinstance(value, dict) else None
+            values.append(value)
+        return values
+
+    def _flush(self) -> None:
+        # documents are buffered and written a field at a time, one comprehension and one slice assignment
+        # per field and batch, which converts the values in C
+        if not self._pending:
+            return
+        end = self._size + len(self._pending)
+        if end > self._capacity:
+            self._grow(end)
+        for field, dtype in self.schema.items():
+            values = self._column_values(field)
+            mask = [value is None for value in values]
+            if any(mask):
+                fill = self._fill[field]
+                values = [fill if value is None else value for value in values]
+                self._mask[field][self._size : end] = mask
+            if dtype.kind in "US":
+                self._check_width(field, values)
+            try:
+                if dtype.kind == "O":
+                    # element by element, a slice assignment would unpack list values
+                    column = self._values[field]
+                    for offset, value in enumerate(values, self._size):
+                        column[offset] = value
+                else:
+                    self._values[field][self._size : end] = values
+            except (TypeError, ValueError) as e:
+                raise ValueError(
+                    f"Values of {field!r} do not fit dtype {dtype}: {e}"
+                ) from e
+        self._pending.clear()
+        self._size = end
+
+    def _check_width(self, field: str, values: list) -> None:
+        dtype = self._values[field].dtype
+        width = dtype.itemsize // 4 if dtype.kind == "U" else dtype.itemsize
+        for value in values:
+            if len(value if isinstance(value, (str, bytes)) else str(value)) > width:
+                raise ValueError(
+                    f"Value {value!r} of {field!r} is longer than dtype {dtype} allows"
+                )
+
+    def _grow(self, needed: int) -> None:
+        capacity = self._capacity
+        while capacity < needed:
+            capacity *= 2
+        for field in self.schema:
+            # the arrays are owned by the builder, they are reallocated in place when possible
+            self._values[field].resize(capacity, refcheck=False)
+            self._mask[field].resize(capacity, refcheck=False)
+        self._capacity = capacity
+
+    def columns(self) -> dict[str, "np.ma.MaskedArray"]:
+        """
+        The columns built so far, trimmed to the number of rows. The builder must not be used afterwards.
+        :return: field name to masked array, masked where the document had no value
+        """
+        self._flush()
+        columns = {}
+        for field in self.schema:
+            values, mask = self._values[field], self._mask[field]
+            values.resize(self._size, refcheck=False)
+            mask.resize(self._size, refcheck=False)
+            columns[field] = np.ma.MaskedArray(values, mask=mask)
+        return columns
+
+
+__all__ = ["DEFAULT_CAPACITY", "ColumnarBuilder", "schema_projection"]
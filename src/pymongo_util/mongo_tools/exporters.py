@@ -0,0 +1,161 @@
+"""Streaming exports
+Documents are encoded in batches of `batch_size` as they come out of the cursor, so memory stays bounded by
+a single batch whatever the size of the export. Each batch becomes one chunk of bytes, optionally gzipped,
+which is written to a file or yielded to an HTTP streaming response.
+"""
+
+import csv
+import io
+import os
+import sys
+import zlib
+from datetime import datetime
+from typing import IO, Any, Callable, Iterable, Iterator
+
+try:
+    import bson
+    from bson import json_util
+    from bson.raw_bson import RawBSONDocument
+except ImportError:  # pragma: no cover
+    sys.stderr.write("PyMongo not installed, run pip install pymongo")
+    raise
+
+EXPORT_FORMATS = ("ndjson", "csv", "bson")
+DEFAULT_EXPORT_BATCH_SIZE = 1000
+
+
+def flatten(document: dict, prefix: str = "") -> dict:
+    """Flattens nested documents into dotted keys, `{"a": {"b": 1}}` becomes `{"a.b": 1}`"""
+    flat = {}
+    for key, value in document.items():
+        if isinstance(value, dict):
+            flat |= flatten(value, f"{prefix}{key}.")
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def _csv_value(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (list, tuple)):
+        return json_util.dumps(value)
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def _encode_ndjson(documents: list) -> bytes:
+    return "".join(json_util.dumps(document) + "\n" for document in documents).encode()
+
+
+def _encode_bson(documents: list) -> bytes:
+    return b"".join(
+        document.raw if isinstance(document, RawBSONDocument) else bson.encode(document)
+        for document in documents
+    )
+
+
+def _csv_encoder(columns: list[str] | None) -> Callable[[list], bytes]:
+    # columns are fixed by the first document unless given, later unknown fields are dropped
+    state = {"columns": columns, "header": False}
+
+    def encode(documents: list) -> bytes:
+        buffer = io.StringIO()
+        rows = [flatten(document) for document in documents]
+        if state["columns"] is None:
+            state["columns"] = list(rows[0]) if rows else []
+        if not state["header"]:
+            csv.writer(buffer).writerow(state["columns"])
+            state["header"] = True
+        writer = csv.DictWriter(
+            buffer, fieldnames=state["columns"], extrasaction="ignore"
+        )
+        for row in rows:
+            writer.writerow({key: _csv_value(value) for key, value in row.items()})
+        return buffer.getvalue().encode()
+
+    return encode
+
+
+def iter_export(
+    documents: Iterable,
+    fmt: str = "ndjson",
+    batch_size: int = DEFAULT_EXPORT_BATCH_SIZE,
+    gzip: bool = False,
+    columns: list[str] | None = None,
+) -> Iterator[bytes]:
+    """
+    Encodes documents as they are iterated, yielding one chunk of bytes per batch
+    :param documents: a cursor, or any iterable of documents
+    :param fmt: "ndjson" (extended JSON lines), "csv" (flattened dotted columns, with a header) or
+            "bson" (concatenated documents, as mongodump writes them)
+    :param batch_size: number of documents per chunk
+    :param gzip: gzip the stream, the chunks concatenate to a single gzip file
+    :param columns: csv columns, taken from the first document when not given
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Invalid export format: {fmt}")
+    if batch_size < 1:
+        raise ValueError("batch_size must be a positive integer")
+    encode = {
+        "ndjson": _encode_ndjson,
+        "bson": _encode_bson,
+    }.get(fmt) or _csv_encoder(columns)
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) if gzip else None
+
+    def emit(data: bytes) -> bytes:
+        return compressor.compress(data) if compressor else data
+
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) >= batch_size:
+            if chunk := emit(encode(batch)):
+                yield chunk
+            batch = []
+    if batch or (fmt == "csv" and columns is not None):
+        if chunk := emit(encode(batch)):
+            yield chunk
+    if compressor:
+        yield compressor.flush()
+
+
+def write_export(
+    documents: Iterable,
+    destination: str | os.PathLike | IO[bytes],
+    fmt: str = "ndjson",
+    batch_size: int = DEFAULT_EXPORT_BATCH_SIZE,
+    gzip: bool = False,
+    columns: list[str] | None = None,
+) -> int:
+    """
+    Writes `iter_export` chunks to a path or a binary file-like object
+    :return: number of exported documents
+    """
+    count = 0
+
+    def counted() -> Iterator:
+        nonlocal count
+        for document in documents:
+            count += 1
+            yield document
+
+    chunks = iter_export(counted(), fmt, batch_size, gzip, columns)
+    if isinstance(destination, (str, os.PathLike)):
+        with open(destination, "wb") as fp:
+            fp.writelines(chunks)
+    else:
+        destination.writelines(chunks)
+    return count
+
+
+__all__ = [
+    "DEFAULT_EXPORT_BATCH_SIZE",
+    "EXPORT_FORMATS",
+    "flatten",
+    "iter_export",
+    "write_export",
+]
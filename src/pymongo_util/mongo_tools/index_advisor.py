@@ -0,0 +1,139 @@
+"""Query shape index advisor
+Records the shapes of the queries sent by collection classes and reports those that none of the declared
+indexes serves. A shape is split according to the equality, sort, range rule: an index serves a query when
+its keys start with the equality fields, in any order, followed by the sort fields, in order (or all
+reversed), followed by the range fields.
+"""
+
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Iterable, Sequence
+
+# operators matching a single value, which an index seeks to like an equality
+_EQUALITY_OPERATORS = {"$eq", "$in"}
+_LOGICAL_OPERATORS = {"$or", "$nor", "$and"}
+
+
+@dataclass(frozen=True)
+class QueryShape:
+    equality: frozenset[str]
+    sort: tuple[tuple[str, int], ...]
+    range: frozenset[str]
+
+    def served_by(self, keys: Sequence[tuple[str, Any]]) -> bool:
+        """True when an index with these keys serves the shape, see the module docstring"""
+        fields = [key for key, _ in keys]
+        position = len(self.equality)
+        if set(fields[:position]) != self.equality:
+            return False
+        if self.sort:
+            directions = dict(keys)
+            sort_fields = fields[position : position + len(self.sort)]
+            if sort_fields != [field for field, _ in self.sort]:
+                return False
+            same = [directions[field] == order for field, order in self.sort]
+            if not (all(same) or not any(same)):
+                return False
+            position += len(self.sort)
+        return self.range <= set(fields[position:])
+
+    def as_dict(self) -> dict:
+        return {
+            "equality": sorted(self.equality),
+            "sort": [list(item) for item in self.sort],
+            "range": sorted(self.range),
+        }
+
+
+def _collect(query: dict, equality: set, ranges: set) -> None:
+    for key, condition in query.items():
+        if key == "$and":
+            for branch in condition:
+                _collect(branch, equality, ranges)
+        elif key in _LOGICAL_OPERATORS:
+            # branches of $or/$nor are served by separate index scans, their fields count as ranges
+            for branch in condition:
+                _collect(branch, ranges, ranges)
+        elif key.startswith("$"):
+            continue
+        elif isinstance(condition, dict) and any(
+            op.startswith("$") for op in condition
+        ):
+            if set(condition) <= _EQUALITY_OPERATORS:
+                equality.add(key)
+            else:
+                ranges.add(key)
+        else:
+            equality.add(key)
+
+
+def query_index_shape(
+    query: dict | None, sort: Iterable | None = None
+) -> QueryShape | None:
+    """
+    :param query: a find query, or the content of a `$match` stage
+    :param sort: `[(field, direction), ...]` or a `$sort` document
+    :return: the shape, None for a query without conditions nor sort
+    """
+    equality, ranges = set(), set()
+    _collect(query or {}, equality, ranges)
+    if isinstance(sort, dict):
+        sort = sort.items()
+    sort_items = tuple(
+        (field, order) for field, order in (sort or []) if isinstance(order, int)
+    )
+    ranges -= equality
+    if not equality and not ranges and not sort_items:
+        return None
+    return QueryShape(frozenset(equality), sort_items, frozenset(ranges))
+
+
+class IndexAdvisor:
+    """
+    Counts query shapes per namespace. Assign an instance to the `index_advisor` attribute of a collection
+    class (or of `CollectionBaseClass` for all of them), then read `unindexed_query_shapes()`.
+    """
+
+    def __init__(self, max_shapes: int = 1000) -> None:
+        """:param max_shapes: distinct shapes kept per namespace, shapes seen after that are not counted"""
+        self.max_shapes = max_shapes
+        self._shapes: dict[tuple[str, str], Counter] = {}
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        namespace: tuple[str, str],
+        query: dict | None,
+        sort: Iterable | None = None,
+    ) -> None:
+        if (shape := query_index_shape(query, sort)) is None:
+            return
+        with self._lock:
+            shapes = self._shapes.setdefault(namespace, Counter())
+            if shape in shapes or len(shapes) < self.max_shapes:
+                shapes[shape] += 1
+
+    def report(
+        self, namespace: tuple[str, str], indexes: Iterable[Sequence[tuple[str, Any]]]
+    ) -> list[dict]:
+        """
+        :param namespace: (database, collection)
+        :param indexes: keys of the declared indexes, `[(field, direction), ...]` each. `_id` is always indexed.
+        :return: shapes that no index serves, most frequent first, with their `count`
+        """
+        indexes = [list(keys) for keys in indexes] + [[("_id", 1)]]
+        with self._lock:
+            shapes = list(self._shapes.get(namespace, Counter()).most_common())
+        return [
+            shape.as_dict() | {"count": count}
+            for shape, count in shapes
+            if not any(shape.served_by(keys) for keys in indexes)
+        ]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._shapes.clear()
+
+
+__all__ = ["IndexAdvisor", "QueryShape", "query_index_shape"]
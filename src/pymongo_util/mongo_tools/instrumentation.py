@@ -0,0 +1,343 @@
+"""Command instrumentation
+`Instrumentation` is a pymongo `CommandListener`, registered on its clients by `MongoConnect` when
+`MONGO_INSTRUMENTATION` is set. Every command is attributed to the collection class and method that sent it,
+and aggregated into latency histograms and document/byte counters; slow commands are logged with the shape
+of their query. The numbers are pulled with `snapshot()`, so that any metrics backend can export them.
+
+Attribution: collection methods set a context variable while they run. Cursors are read after the method
+returned, so the initial query also carries the attribution as its `comment`, and later `getMore`s are
+matched to it by cursor id. Only the methods of instances whose client has an `Instrumentation` registered
+are attributed; on other clients the wrapper just calls the method.
+"""
+
+import functools
+import inspect
+import logging
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+try:
+    import bson
+    from pymongo import monitoring
+except ImportError:  # pragma: no cover
+    sys.stderr.write("PyMongo not installed, run pip install pymongo")
+    raise
+
+LATENCY_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+COMMENT_PREFIX = "pymongo_util:"
+_MAX_TRACKED_CURSORS = 10000
+
+_operation: ContextVar[tuple[str, str] | None] = ContextVar(
+    "pymongo_util_operation", default=None
+)
+
+
+def current_operation() -> tuple[str, str] | None:
+    """(class name, method name) of the collection method running in this context"""
+    return _operation.get()
+
+
+def comment_kwargs() -> dict:
+    """`comment` argument attributing a cursor to the running method, empty outside instrumented methods"""
+    operation = _operation.get()
+    if operation is None:
+        return {}
+    return {"comment": f"{COMMENT_PREFIX}{operation[0]}.{operation[1]}"}
+
+
+def is_instrumented(client: Any) -> bool:
+    """Whether an `Instrumentation` is registered on a MongoClient or AsyncMongoClient"""
+    try:
+        listeners = client.options.event_listeners
+    except AttributeError:
+        return False
+    # clients of other libraries (e.g. mongomock) resolve unknown attributes to databases
+    return isinstance(listeners, list) and any(
+        isinstance(listener, Instrumentation) for listener in listeners
+    )
+
+
+def instrumented(method: Callable) -> Callable:
+    """
+    Attributes the commands sent by a collection method to it when the `client` of the instance is
+    instrumented, nested method calls keep the outer one
+    """
+    if inspect.isasyncgenfunction(method):
+
+        @functools.wraps(method)
+        async def async_generator_wrapper(self, *args, **kwargs):
+            if _operation.get() is not None or not is_instrumented(self.client):
+                async for item in method(self, *args, **kwargs):
+                    yield item
+                return
+            token = _operation.set((type(self).__name__, method.__name__))
+            try:
+                async for item in method(self, *args, **kwargs):
+                    yield item
+            finally:
+                _operation.reset(token)
+
+        return async_generator_wrapper
+
+    if inspect.iscoroutinefunction(method):
+
+        @functools.wraps(method)
+        async def async_wrapper(self, *args, **kwargs):
+            if _operation.get() is not None or not is_instrumented(self.client):
+                return await method(self, *args, **kwargs)
+            token = _operation.set((type(self).__name__, method.__name__))
+            try:
+                return await method(self, *args, **kwargs)
+            finally:
+                _operation.reset(token)
+
+        return async_wrapper
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if _operation.get() is not None or not is_instrumented(self.client):
+            return method(self, *args, **kwargs)
+        token = _operation.set((type(self).__name__, method.__name__))
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            _operation.reset(token)
+
+    return wrapper
+
+
+def instrument_methods(cls: type) -> type:
+    """Class decorator applying `instrumented` to the public methods defined by the class"""
+    for name, value in list(vars(cls).items()):
+        if not name.startswith("_") and inspect.isfunction(value):
+            setattr(cls, name, instrumented(value))
+    return cls
+
+
+def query_shape(value: Any) -> Any:
+    """Normalized shape of a query or pipeline: field names and operators are kept, values become '?'"""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)) and any(
+        isinstance(item, dict) for item in value
+    ):
+        return [query_shape(item) for item in value]
+    return "?"
+
+
+def command_shape(command: dict) -> Any:
+    for key in ("filter", "pipeline", "query"):
+        if key in command:
+            return query_shape(command[key])
+    for key in ("updates", "deletes"):
+        if command.get(key):
+            return query_shape(command[key][0].get("q", {}))
+    return None
+
+
+def _returned_documents(reply: dict) -> int:
+    if cursor := reply.get("cursor"):
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+    return reply.get("n", 0)
+
+
+@dataclass
+class OperationStats:
+    """Latency histogram and counters of one (class, method, command, namespace)"""
+
+    count: int = 0
+    errors: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    documents: int = 0
+    bytes: int = 0
+    buckets: list[int] = field(
+        default_factory=lambda: [0] * (len(LATENCY_BUCKETS_MS) + 1)
+    )
+
+    def observe(
+        self, duration_ms: float, documents: int, size: int, failed: bool
+    ) -> None:
+        self.count += 1
+        self.errors += failed
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        self.documents += documents
+        self.bytes += size
+        self.buckets[bisect_left(LATENCY_BUCKETS_MS, duration_ms)] += 1
+
+    def as_dict(self) -> dict:
+        # cumulative buckets, as Prometheus and OpenTelemetry histograms expect them
+        cumulative, running = {}, 0
+        for bound, count in zip(LATENCY_BUCKETS_MS + (float("inf"),), self.buckets):
+            running += count
+            cumulative[bound] = running
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "total_ms": self.total_ms,
+            "max_ms": self.max_ms,
+            "documents": self.documents,
+            "bytes": self.bytes,
+            "buckets": cumulative,
+        }
+
+
+class Instrumentation(monitoring.CommandListener):
+    """
+    Collects command metrics of the clients it is registered on.
+
+    Example:
+        instrumentation = Instrumentation(slow_ms=50)
+        mongo_obj = MongoConnect(instrumentation=instrumentation)
+        ...
+        for entry in instrumentation.snapshot():
+            print(entry["class"], entry["method"], entry["count"], entry["buckets"])
+    """
+
+    def __init__(
+        self,
+        slow_ms: float | None = 100,
+        slow_log_size: int = 100,
+        measure_bytes: bool = False,
+    ) -> None:
+        """
+        :param slow_ms: commands slower than this are logged, None disables the slow operation log
+        :param slow_log_size: number of slow operations kept for `slow_operations`
+        :param measure_bytes: count reply sizes. Replies are encoded again to measure them, which costs CPU.
+        """
+        self.slow_ms = slow_ms
+        self.measure_bytes = measure_bytes
+        self._stats: dict[tuple, OperationStats] = {}
+        self._slow: deque[dict] = deque(maxlen=slow_log_size)
+        self._pending: dict[tuple, tuple] = {}
+        self._cursors: OrderedDict[int, tuple[str, str] | None] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _attribution(self, event) -> tuple[str, str] | None:
+        command = event.command
+        if event.command_name == "getMore":
+            # a cursor is read by whoever iterates it, attribute it to the method that opened it
+            with self._lock:
+                if (operation := self._cursors.get(command["getMore"])) is not None:
+                    return operation
+        if operation := _operation.get():
+            return operation
+        comment = command.get("comment")
+        if isinstance(comment, str) and comment.startswith(COMMENT_PREFIX):
+            owner, _, method = comment[len(COMMENT_PREFIX) :].partition(".")
+            return owner, method
+        return None
+
+    def started(self, event) -> None:
+        command = event.command
+        name = event.command_name
+        collection = command.get("collection" if name == "getMore" else name)
+        namespace = event.database_name
+        if isinstance(collection, str):
+            namespace = f"{namespace}.{collection}"
+        shape = command_shape(command) if self.slow_ms is not None else None
+        attribution = self._attribution(event)
+        with self._lock:
+            if name == "killCursors":
+                for cursor_id in command.get("cursors", []):
+                    self._cursors.pop(cursor_id, None)
+            self._pending[(event.connection_id, event.request_id)] = (
+                attribution,
+                namespace,
+                shape,
+                command.get("getMore"),
+            )
+
+    def succeeded(self, event) -> None:
+        reply = event.reply
+        size = len(bson.encode(reply)) if self.measure_bytes else 0
+        pending = self._finish(event, _returned_documents(reply), size, failed=False)
+        cursor = reply.get("cursor")
+        if pending is None or not isinstance(cursor, dict):
+            return
+        attribution, _, _, get_more = pending
+        with self._lock:
+            if cursor.get("id"):
+                self._cursors[cursor["id"]] = attribution
+                while len(self._cursors) > _MAX_TRACKED_CURSORS:
+                    self._cursors.popitem(last=False)
+            elif get_more is not None:
+                self._cursors.pop(get_more, None)
+
+    def failed(self, event) -> None:
+        self._finish(event, 0, 0, failed=True)
+
+    def _finish(self, event, documents: int, size: int, failed: bool) -> tuple | None:
+        duration_ms = event.duration_micros / 1000
+        with self._lock:
+            pending = self._pending.pop((event.connection_id, event.request_id), None)
+            if pending is None:
+                return None
+            attribution, namespace, shape, _ = pending
+            owner, method = attribution or (None, None)
+            key = (owner, method, event.command_name, namespace)
+            if (stats := self._stats.get(key)) is None:
+                stats = self._stats[key] = OperationStats()
+            stats.observe(duration_ms, documents, size, failed)
+        if self.slow_ms is not None and duration_ms >= self.slow_ms:
+            entry = {
+                "class": owner,
+                "method": method,
+                "command": event.command_name,
+                "namespace": namespace,
+                "shape": shape,
+                "duration_ms": duration_ms,
+                "failed": failed,
+                "at": time.time(),
+            }
+            with self._lock:
+                self._slow.append(entry)
+            logging.warning("Slow mongo operation: %s", entry)
+        return pending
+
+    def snapshot(self) -> list[dict]:
+        """
+        Current metrics, one entry per (class, method, command, namespace). Class and method are None for
+        commands sent outside of collection methods.
+        """
+        with self._lock:
+            return [
+                {
+                    "class": owner,
+                    "method": method,
+                    "command": command,
+                    "namespace": namespace,
+                }
+                | stats.as_dict()
+                for (owner, method, command, namespace), stats in self._stats.items()
+            ]
+
+    def slow_operations(self) -> list[dict]:
+        """The most recent slow operations, oldest first"""
+        with self._lock:
+            return list(self._slow)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+            self._slow.clear()
+
+
+__all__ = [
+    "LATENCY_BUCKETS_MS",
+    "Instrumentation",
+    "OperationStats",
+    "comment_kwargs",
+    "current_operation",
+    "instrument_methods",
+    "instrumented",
+    "is_instrumented",
+    "query_shape",
+]
@@ -0,0 +1,95 @@
+"""Materialized views
+A view is the output of an expensive pipeline (`$lookup`, `$group`, ...) over a source collection, stored in a
+target collection so that reads of it, AG Grid queries in particular, are simple indexed queries.
+
+A full refresh replaces the target with `$out`, which keeps the target's indexes. An incremental refresh only
+runs the pipeline over the source documents whose `high_water_mark` field (e.g. an update timestamp) moved
+past the mark stored by the previous refresh, and `$merge`s the output into the target. It is correct when the
+output documents of a changed source document can be computed from it alone, e.g. per document `$lookup`s.
+A `$group` is only refreshed incrementally over an append-only source, with a `when_matched` pipeline folding
+the new partial group into the stored one. Deleted source documents are only removed from the target by a full
+refresh. The field must be set on every write, to a value that only increases.
+"""
+
+import sys
+from dataclasses import dataclass, field
+from typing import Any
+
+try:
+    from pymongo import IndexModel
+except ImportError:  # pragma: no cover
+    sys.stderr.write("PyMongo not installed, run pip install pymongo")
+    raise
+
+# collection of the source database holding the high-water mark of every view
+VIEW_METADATA_COLLECTION = "materialized_views"
+
+
+@dataclass(frozen=True)
+class MaterializedView:
+    """
+    :param name: target collection
+    :param pipeline: stages computing the view from the source collection, without `$out`/`$merge`
+    :param high_water_mark: source field selecting the documents of an incremental refresh, None allows
+            full refreshes only
+    :param on: target fields identifying a document, they need a unique index unless it is `_id`
+    :param when_matched: `$merge` action for documents already in the target, "replace", "merge",
+            "keepExisting", "fail" or an update pipeline
+    :param database: target database, defaults to the source database
+    :param indexes: indexes of the target, created before its first refresh
+    """
+
+    name: str
+    pipeline: list[dict]
+    high_water_mark: str | None = None
+    on: str | tuple[str, ...] = "_id"
+    when_matched: str | list[dict] = "replace"
+    database: str | None = None
+    indexes: list[IndexModel] = field(default_factory=list)
+
+
+def view_id(database: str, collection: str, view: MaterializedView) -> str:
+    """Key of the view in the metadata collection"""
+    return f"{database}.{collection}.{view.name}"
+
+
+def full_refresh_pipeline(view: MaterializedView, database: str) -> list[dict]:
+    """Pipeline replacing the target with the whole output of the view"""
+    if view.database in (None, database):
+        out: Any = view.name
+    else:
+        out = {"db": view.database, "coll": view.name}
+    return [*view.pipeline, {"$out": out}]
+
+
+def incremental_refresh_pipeline(
+    view: MaterializedView, database: str, since: Any, until: Any
+) -> list[dict]:
+    """
+    Pipeline merging the output of the source documents changed since the last refresh into the target
+    :param since: mark of the previous refresh, excluded
+    :param until: greatest mark at the start of this refresh, included
+    """
+    if view.high_water_mark is None:
+        raise ValueError(f"View {view.name!r} has no high_water_mark field")
+    return [
+        {"$match": {view.high_water_mark: {"$gt": since, "$lte": until}}},
+        *view.pipeline,
+        {
+            "$merge": {
+                "into": {"db": view.database or database, "coll": view.name},
+                "on": list(view.on) if isinstance(view.on, tuple) else view.on,
+                "whenMatched": view.when_matched,
+                "whenNotMatched": "insert",
+            }
+        },
+    ]
+
+
+__all__ = [
+    "VIEW_METADATA_COLLECTION",
+    "MaterializedView",
+    "full_refresh_pipeline",
+    "incremental_refresh_pipeline",
+    "view_id",
+]
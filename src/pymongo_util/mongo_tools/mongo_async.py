@@ -0,0 +1,410 @@
+import sys
+from collections.abc import AsyncIterator
+from datetime import datetime, timezone
+from typing import Any, Dict, Mapping, Sequence, Tuple, Union
+
+from .batch_loader import AsyncBatchLoader
+from .instrumentation import comment_kwargs, instrument_methods
+from .soft_delete import (
+    SOFT_DELETE_BATCH_SIZE,
+    archive_database,
+    archive_operations,
+    batch_query,
+)
+from .util_configs import MongoConfig
+
+try:
+    from pymongo import AsyncMongoClient, ReturnDocument
+    from pymongo.asynchronous.command_cursor import AsyncCommandCursor
+    from pymongo.asynchronous.cursor import AsyncCursor
+    from pymongo.results import (
+        DeleteResult,
+        InsertManyResult,
+        InsertOneResult,
+        UpdateResult,
+    )
+    from pymongo.typings import _DocumentType
+except ImportError:  # pragma: no cover
+    sys.stderr.write("PyMongo not installed, run pip install pymongo")
+    raise
+
+
+@instrument_methods
+class AsyncMongoCollectionBaseClass:
+    """
+    asyncio counterpart of `MongoCollectionBaseClass` built on pymongo's `AsyncMongoClient`.
+    Every method that talks to the server is a coroutine, except `find` which returns an
+    `AsyncCursor` that can be iterated with `async for` without awaiting the call itself.
+    """
+
+    def __init__(
+        self,
+        mongo_client: AsyncMongoClient,
+        database: str,
+        collection: str,
+        soft_delete: bool = MongoConfig.META_SOFT_DEL,
+    ) -> None:
+        self.client = mongo_client
+        self.database = database
+        self.collection = collection
+        self.soft_delete = soft_delete
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(database={self.database}, collection={self.collection})"
+
+    async def insert_one(self, data: Dict) -> InsertOneResult:
+        """
+        The function is used to inserting a document to a collection in a Mongo Database.
+        :param data: Data to be inserted
+        :return: Insert Result (Refer to Pymongo Documentation for more details)
+        """
+        database_name = self.database
+        collection_name = self.collection
+        db = self.client[database_name]
+        collection = db[collection_name]
+        return await collection.insert_one(data)
+
+    async def insert_many(self, data: list) -> InsertManyResult:
+        """
+        The function is used to inserting multiple documents to a collection in a Mongo Database.
+        :param data: List of Data to be inserted. Contents of the list must be of mutable mapping (dict)
+        :return: Insert Result (Refer to Pymongo Documentation for more details)
+        """
+        database_name = self.database
+        collection_name = self.collection
+        db = self.client[database_name]
+        collection = db[collection_name]
+        return await collection.insert_many(data)
+
+    def find(
+        self,
+        query: dict,
+        filter_dict: dict | None = None,
+        sort: Union[None, str, Sequence[Tuple[str, Union[int, str, dict]]]] = None,
+        skip: int = 0,
+        limit: int | None = None,
+    ) -> AsyncCursor:
+        """
+        The function is used to query documents from the collection
+        :param query: a mongo query object or dictionary
+        :param (Optional) filter_dict: a dictionary with keys from mongo collection.
+                If nothing is passed, it defaults to {"_id": 0}
+        :param (Optional) sort: List of tuple with key and direction. [(key, -1), ...]
+        :param (Optional) skip: Skip Number
+        :param (Optional) limit: Limit Number
+        :return: An async mongo cursor, iterate it with `async for` or call `await cursor.to_list()`
+        """
+        sort = sort or []
+        if filter_dict is None:
+            filter_dict = {"_id": 0}
+        database_name = self.database
+        collection_name = self.collection
+        db = self.client[database_name]
+        collection = db[collection_name]
+        if len(sort) > 0:
+            cursor = (
+                collection.find(
+                    query,
+                    filter_dict,
+                    **comment_kwargs(),
+                )
+                .sort(sort)
+                .skip(skip)
+            )
+        else:
+            cursor = collection.find(
+                query,
+                filter_dict,
+                **comment_kwargs(),
+            ).skip(skip)
+        if limit:
+            cursor = cursor.limit(limit)
+        return cursor
+
+    async def iter_find(
+        self,
+        query: dict,
+        filter_dict: dict | None = None,
+        sort: Union[None, str, Sequence[Tuple[str, Union[int, str, dict]]]] = None,
+        skip: int = 0,
+        limit: int | None = None,
+        batch_size: int = 0,
+    ) -> AsyncIterator[_DocumentType]:
+        """
+        Async generator over the documents matched by `find`, fetched `batch_size` documents per round trip
+        :param batch_size: Number of documents per batch. 0 lets the server decide
+        :return: documents one at a time
+        """
+        cursor = self.find(query, filter_dict, sort=sort, skip=skip, limit=limit)
+        if batch_size:
+            cursor = cursor.batch_size(batch_size)
+        async with cursor:
+            async for document in cursor:
+                yield document
+
+    async def find_one(
+        self, query: dict, filter_dict: dict | None = None
+    ) -> dict | None:
+        """
+        The function is used to query documents from the collection
+        :param query: a mongo query object or dictionary
+        :param (Optional) filter_dict: a dictionary with keys from mongo collection.
+                If nothing is passed, it defaults to {"_id": 0}
+        :return: document or None
+        """
+        database_name = self.database
+        collection_name = self.collection
+        if filter_dict is None:
+            filter_dict = {"_id": 0}
+        db = self.client[database_name]
+        collection = db[collection_name]
+        return await collection.find_one(query, filter_dict)
+
+    async def update_one(
+        self,
+        query: dict,
+        data: dict,
+        upsert: bool = False,
+        strategy: str = "$set",
+    ) -> UpdateResult:
+        """
+        This function updates a mongo document.
+        :param query: a mongo query dictionary
+        :param strategy: update strategy (refer mongo documentation). Important note: strategy only supports flat data.
+        :param upsert: Setting true inserts data if the query does not match
+        :param data: data to be updated with. The behaviour is as per strategy that is passed.
+        :return: UpdateResult (refer mongo documentation)
+        """
+        database_name = self.database
+        collection_name = self.collection
+        db = self.client[database_name]
+        collection = db[collection_name]
+        return await collection.update_one(query, {strategy: data}, upsert=upsert)
+
+    async def update_to_set(
+        self, query: dict, param: str, data: Any, upsert: bool = False
+    ) -> UpdateResult:
+        """
+        This function updates a mongo document's array field. This defaults to the `$addToSet` strategy.
+        :param query: a mongo query dictionary
+        :param param: the key of array field
+        :param upsert: Setting true inserts data if the query does not match
+        :param data: data to be updated with. The behaviour is as per strategy that is passed.
+        :return: UpdateResult (refer mongo documentation)
+        """
+        database_name = self.database
+        collection_name = self.collection
+        db = self.client[database_name]
+        collection = db[collection_name]
+        return await collection.update_one(
+            query, {"$addToSet": {param: data}}, upsert=upsert
+        )
+
+    async def update_many(
+        self, query: dict, data: dict, upsert: bool = False
+    ) -> UpdateResult:
+        """
+        This function updates multiple mongo documents
+        :param query: a mongo query dictionary
+        :param data: data to be updated with. The behaviour is as per strategy that is passed.
+        :return: UpdateResult (refer mongo documentation)
+        """
+        database_name = self.database
+        collection_name = self.collection
+        db = self.client[database_name]
+        collection = db[collection_name]
+        return await collection.update_many(query, {"$set": data}, upsert=upsert)
+
+    async def find_and_update(
+        self,
+        query: dict,
+        data: dict,
+        upsert: bool = False,
+        strategy: str = "$set",
+    ) -> _DocumentType:  # type: ignore[type-var, misc]
+        """
+        This function finds a document and updates it in a single query
+        :param query: a mongo query dictionary
+        :param data: data to be updated with. The behaviour is as per strategy that is passed.
+        :param upsert: Boolean flag to upsert document, if the query does not match
+        :param strategy: update strategy (refer mongo documentation)
+        :return: Updated document
+        """
+        database_name = self.database
+        collection_name = self.collection
+        db = self.client[database_name]
+        collection = db[collection_name]
+        return await collection.find_one_and_update(
+            query,
+            {strategy: data},
+            return_document=ReturnDocument.AFTER,
+            upsert=upsert,
+        )
+
+    async def delete_many(
+        self, query: dict, batch_size: int = SOFT_DELETE_BATCH_SIZE
+    ) -> DeleteResult:
+        """
+        Delete multiple document based on query match.
+        With soft delete enabled, the matched documents are deleted in batches of `batch_size` `_id`s and
+        each batch is archived into `deleted__<database>` with a single bulk write.
+        :param query: a mongo query dictionary
+        :param (Optional) batch_size: Number of documents archived and deleted per round trip on soft delete
+        :return: DeleteResult (refer mongo documentation)
+        """
+        database_name = self.database
+        collection_name = self.collection
+        db = self.client[database_name]
+        collection = db[collection_name]
+        if self.soft_delete:
+            return await self._soft_delete_many(collection, query, batch_size)
+        return await collection.delete_many(query)
+
+    async def delete_one(self, query: dict) -> DeleteResult:
+        """
+        Deletes a mongo document for a given query.
+        With soft delete enabled, the document is removed with `find_one_and_delete` and exactly that
+        document is archived into `deleted__<database>`.
+        :param query: a mongo query dictionary
+        :return: DeleteResult (refer mongo documentation)
+        """
+        database_name = self.database
+        collection_name = self.collection
+        db = self.client[database_name]
+        collection = db[collection_name]
+        if self.soft_delete:
+            return await self._soft_delete_one(collection, query)
+        return await collection.delete_one(query)
+
+    def _archive_collection(self):
+        return self.client[archive_database(self.database)][self.collection]
+
+    async def _soft_delete_one(self, collection, query: dict) -> DeleteResult:
+        document = await collection.find_one_and_delete(query)
+        if document is not None:
+            try:
+                await self._archive_collection().bulk_write(
+                    archive_operations([document]), ordered=False
+                )
+            except Exception:
+                # never lose a document that could not be archived
+                await collection.insert_one(document)
+                raise
+        return DeleteResult(
+            {"n": int(document is not None), "ok": 1},
+            acknowledged=collection.write_concern.acknowledged,
+        )
+
+    async def _soft_delete_many(
+        self, collection, query: dict, batch_size: int
+    ) -> DeleteResult:
+        # see MongoCollectionBaseClass._soft_delete_many for the ordering of archive and delete
+        archive = self._archive_collection()
+        deleted_count = 0
+        while documents := await collection.find(query).limit(batch_size).to_list():
+            ids = [document["_id"] for document in documents]
+            await archive.bulk_write(archive_operations(documents), ordered=False)
+            result = await collection.delete_many(batch_query(query, ids))
+            deleted_count += result.deleted_count
+        return DeleteResult(
+            {"n": deleted_count, "ok": 1},
+            acknowledged=collection.write_concern.acknowledged,
+        )
+
+    async def perform_soft_delete(self, query):
+        """
+        Archives every document matching `query` into `deleted__<database>` with a `$merge` aggregation,
+        without deleting it. `delete_one` and `delete_many` archive the documents they delete themselves.
+        :param query: a mongo query dictionary
+        """
+        soft_del_query = [
+            {"$match": query},
+            {
+                "$addFields": {
+                    "deleted": {
+                        "on": datetime.now(timezone.utc).replace(tzinfo=timezone.utc)
+                    }
+                }
+            },
+            {
+                "$merge": {
+                    "into": {
+                        "db": archive_database(self.database),
+                        "coll": self.collection,
+                    },
+                }
+            },
+        ]
+        cursor = await self.aggregate(pipelines=soft_del_query)
+        await cursor.close()
+
+    def loader(
+        self,
+        field: str = "_id",
+        filter_dict: dict | None = None,
+        window: float = 0,
+        max_batch_size: int = 1000,
+    ) -> AsyncBatchLoader:
+        """
+        Creates a loader that coalesces the single document lookups on `field` awaited together, e.g. under
+        one `asyncio.gather`, into one `find({field: {"$in": keys}})`
+        :param field: field looked up, the loader returns the first document of each key
+        :param (Optional) filter_dict: projection, defaults to {"_id": 0} as in `find_one`
+        :param window: seconds a batch waits for more keys, 0 waits for the next turn of the event loop
+        :param max_batch_size: number of keys that sends a batch without waiting
+        :return: AsyncBatchLoader, await `load(key)` or `load_many(keys)`
+        """
+        return AsyncBatchLoader(
+            self,
+            field=field,
+            filter_dict=filter_dict,
+            window=window,
+            max_batch_size=max_batch_size,
+        )
+
+    async def distinct(self, query_key: str, filter_json: dict | None = None) -> list:
+        """
+        Finds the distinct values for a specified field across a single collection or view and returns the results in an array.
+        :param query_key: The field for which to return distinct values
+        :param filter_json: A query that specifies the documents from which to retrieve the distinct values.
+        :return:
+        """
+        database_name = self.database
+        collection_name = self.collection
+        db = self.client[database_name]
+        collection = db[collection_name]
+        return await collection.distinct(query_key, filter_json)
+
+    async def find_count(self, query: Dict) -> int:
+        database_name = self.database
+        collection_name = self.collection
+        db = self.client[database_name]
+        collection = db[collection_name]
+        return await collection.count_documents(query)
+
+    async def aggregate(
+        self,
+        pipelines: list,
+        let: Mapping[str, Any] | None = None,
+        collation=None,
+        allowDiskUse=False,  # noqa NOSONAR
+    ) -> AsyncCommandCursor[_DocumentType]:
+        """
+        Perform an aggregation using the aggregation framework on this collection
+        :param pipelines: A sequence of data aggregation operations or stages. See the MongoDB Docs for details.
+        :param let: Specifies a document with a list of variables. This allows you to improve command readability by separating the variables from the query text.
+        :param allowDiskUse: Enables writing to temporary files. When set to True, aggregation stages can write data to the _tmp subdirectory in the dbPath directory.
+        :param collation: performs case insensitivity on string comparison and diacritic insensitivity on character comparison.
+        :return: An async command cursor, iterate it with `async for` or call `await cursor.to_list()`
+        """
+        database_name = self.database
+        collection_name = self.collection
+        db = self.client[database_name]
+        collection = db[collection_name]
+        return await collection.aggregate(
+            pipelines,
+            let=let,
+            collation=collation,
+            allowDiskUse=allowDiskUse,
+            **comment_kwargs(),
+        )
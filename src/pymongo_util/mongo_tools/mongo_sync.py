@@ -1,13 +1,67 @@
+import logging
+import os
 import sys
+import threading
+from concurrent.futures import Future
 from datetime import datetime, timezone
-from typing import Any, Dict, Mapping, Sequence, Tuple, Union
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    Mapping,
+    Sequence,
+    Tuple,
+    Union,
+)
 
+from .base_models import AGGridTableRequest, AGGridTableResponse
+from .batch_loader import BatchLoader
+from .bulk_writer import BulkWriter, BulkWriteSummary, upsert_operation
+from .chunking import DEFAULT_CHUNK_SIZE, ChunkedInsertResult, iter_chunks, map_chunks
+from .exporters import DEFAULT_EXPORT_BATCH_SIZE, iter_export, write_export
+from .index_advisor import IndexAdvisor
+from .instrumentation import comment_kwargs, instrument_methods
+from .materialized_views import (
+    VIEW_METADATA_COLLECTION,
+    MaterializedView,
+    full_refresh_pipeline,
+    incremental_refresh_pipeline,
+    view_id,
+)
+from .parallel_scan import combine_groups, iter_ranges, range_query, sample_bounds
+from .raw_documents import RAW_CODEC_OPTIONS
+from .query_cache import (
+    QueryCache,
+    get_cache,
+    get_count_cache,
+    invalidate_namespace,
+    invalidates_cache,
+    cache_key,
+)
+from .query_buidler import (
+    KEYSET_FIELD,
+    AGGridMongoQueryUtil,
+    encode_keyset_cursor,
+    keyset_sort_digest,
+)
+from .soft_delete import (
+    SOFT_DELETE_BATCH_SIZE,
+    archive_database,
+    archive_operations,
+    batch_query,
+)
 from .util_configs import MongoConfig
 
+COUNT_MODES = ("exact", "auto", "estimated", "cached", "approximate")
+
 try:
-    from pymongo import MongoClient, ReturnDocument
-    from pymongo.command_cursor import CommandCursor
-    from pymongo.cursor import Cursor
+    from pymongo import TEXT, IndexModel, MongoClient, ReturnDocument
+    from pymongo.command_cursor import CommandCursor, RawBatchCommandCursor
+    from pymongo.errors import BulkWriteError
+    from pymongo.cursor import Cursor, RawBatchCursor
     from pymongo.results import (
         DeleteResult,
         InsertManyResult,
@@ -20,7 +74,32 @@ except ImportError:  # pragma: no cover
     raise
 
 
+@instrument_methods
 class MongoCollectionBaseClass:
+    # Opt-in read-through cache for find_one, distinct and find_count. Set `cache_size` on a subclass to
+    # enable it; entries also expire after `cache_ttl` seconds when set. Write methods invalidate it.
+    cache_size: int = 0
+    cache_ttl: float | None = None
+    # Builder used by `aggrid_query`, override it on a subclass to add forced filters
+    aggrid_query_util: AGGridMongoQueryUtil = AGGridMongoQueryUtil()
+    # Fields of the collection's text index, searched by the AG Grid quick filter, see `create_text_index`
+    text_index_fields: list[str] = []
+    # Return RawBSONDocuments from find, find_one and aggregate, for documents that are passed through
+    # undecoded. Each of those calls can also choose with its `raw` argument.
+    raw_bson: bool = False
+    # Indexes the queries of the class rely on, created by `ensure_indexes`
+    indexes: list[IndexModel] = []
+    # Records the shapes of find, find_one, find_count and aggrid_query queries when set,
+    # see `unindexed_query_shapes`
+    index_advisor: IndexAdvisor | None = None
+    # Seconds a count of `find_count(mode="cached")` is reused, and number of counted queries kept
+    count_cache_ttl: float = 60
+    count_cache_size: int = 256
+    # Documents sampled by `find_count(mode="approximate")`
+    count_sample_size: int = 1000
+    # Views computed from this collection and stored in their own collections, see `refresh_view` and `view`
+    materialized_views: list[MaterializedView] = []
+
     def __init__(
         self,
         mongo_client: MongoClient,
@@ -32,10 +111,84 @@ class MongoCollectionBaseClass:
         self.database = database
         self.collection = collection
         self.soft_delete = soft_delete
+        self._has_text_index: bool | None = None
 
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}(database={self.database}, collection={self.collection})"
 
+    @property
+    def query_cache(self) -> QueryCache | None:
+        """The read-through cache shared by the instances of this class on the same collection, if enabled"""
+        if not self.cache_size:
+            return None
+        return get_cache(
+            type(self),
+            (self.database, self.collection),
+            max_size=self.cache_size,
+            ttl=self.cache_ttl,
+        )
+
+    def cache_stats(self) -> dict:
+        """
+        Hit, miss, eviction and expiration counters of the read-through cache
+        :return: counters, empty when caching is disabled
+        """
+        cache = self.query_cache
+        return cache.stats() if cache else {}
+
+    def is_raw(self, raw: bool | None = None) -> bool:
+        """Whether a read returns RawBSONDocuments, the `raw` argument of the call overriding `raw_bson`"""
+        return self.raw_bson if raw is None else raw
+
+    def _advise(self, query: dict | None, sort=None) -> None:
+        if self.index_advisor is not None:
+            self.index_advisor.record((self.database, self.collection), query, sort)
+
+    def ensure_indexes(self, block: bool = True) -> list[str] | Future:
+        """
+        Creates the declared `indexes`. Indexes that already exist with the same keys and options are left
+        as they are, so it is safe to call at every startup.
+        :param (Optional) block: when False, the indexes are created on a background thread
+        :return: names of the indexes, or a Future of them when not blocking
+        """
+        database_name = self.database
+        collection_name = self.collection
+        db = self.client[database_name]
+        collection = db[collection_name]
+        if block:
+            return collection.create_indexes(self.indexes) if self.indexes else []
+        future: Future = Future()
+
+        def create() -> None:
+            try:
+                future.set_result(self.ensure_indexes(block=True))
+            except Exception as e:
+                logging.exception(e)
+                future.set_exception(e)
+
+        threading.Thread(
+            target=create, name=f"ensure_indexes-{collection_name}", daemon=True
+        ).start()
+        return future
+
+    def unindexed_query_shapes(self) -> list[dict]:
+        """
+        Query shapes recorded by the `index_advisor` on this collection that none of the declared `indexes`
+        serves, most frequent first
+        :return: `[{"equality": [...], "sort": [...], "range": [...], "count": n}, ...]`
+        """
+        if self.index_advisor is None:
+            return []
+        return self.index_advisor.report(
+            (self.database, self.collection),
+            [list(index.document["key"].items()) for index in self.indexes],
+        )
+
+    def invalidate_cache(self) -> None:
+        """Drops the cached reads of every cached class on this collection"""
+        invalidate_namespace((self.database, self.collection))
+
+    @invalidates_cache
     def insert_one(self, data: Dict) -> InsertOneResult:
         """
         The function is used to inserting a document to a collection in a Mongo Database.
@@ -48,17 +201,153 @@ class MongoCollectionBaseClass:
         collection = db[collection_name]
         return collection.insert_one(data)
 
-    def insert_many(self, data: list) -> InsertManyResult:
+    @invalidates_cache
+    def insert_many(
+        self,
+        data: Iterable[dict],
+        chunk_size: int | None = None,
+        max_chunk_bytes: int | None = None,
+        max_workers: int | None = None,
+        ordered: bool = True,
+        return_ids: bool = True,
+        progress_callback: Callable[[int], None] | None = None,
+    ) -> InsertManyResult | ChunkedInsertResult:
         """
         The function is used to inserting multiple documents to a collection in a Mongo Database.
-        :param data: List of Data to be inserted. Contents of the list must be of mutable mapping (dict)
-        :return: Insert Result (Refer to Pymongo Documentation for more details)
+        A list without any of the optional arguments is sent as a single `insert_many` call. Any other iterable
+        (generators included) or any chunking argument streams the documents in chunks, so the input never has
+        to be materialized.
+        :param data: Iterable of Data to be inserted. Contents must be of mutable mapping (dict)
+        :param (Optional) chunk_size: Maximum number of documents per chunk, defaults to 1000 when chunking
+        :param (Optional) max_chunk_bytes: Maximum encoded BSON size of a chunk
+        :param (Optional) max_workers: Send chunks concurrently over a thread pool. Chunks are then unordered.
+        :param (Optional) ordered: Stop at the first failing document. Unordered and parallel loads insert
+                every other document.
+        :param (Optional) return_ids: Collect the inserted ids, disable it to save memory on large loads
+        :param (Optional) progress_callback: Called with the total number of inserted documents after each chunk
+        :return: Insert Result (Refer to Pymongo Documentation for more details) for a plain list,
+                else a ChunkedInsertResult merged over all chunks, which reports write errors in `errors` with
+                the position of their document in `data` instead of raising BulkWriteError
         """
         database_name = self.database
         collection_name = self.collection
         db = self.client[database_name]
         collection = db[collection_name]
-        return collection.insert_many(data)
+        chunking = (chunk_size, max_chunk_bytes, max_workers, progress_callback)
+        if isinstance(data, list) and return_ids and all(i is None for i in chunking):
+            return collection.insert_many(data, ordered=ordered)
+
+        parallel = bool(max_workers and max_workers > 1)
+        chunk_ordered = ordered and not parallel
+
+        def numbered_chunks() -> Iterator[tuple[int, list[dict]]]:
+            start = 0
+            for chunk in iter_chunks(
+                data,
+                chunk_size=chunk_size or DEFAULT_CHUNK_SIZE,
+                max_chunk_bytes=max_chunk_bytes,
+            ):
+                yield start, chunk
+                start += len(chunk)
+
+        def send(numbered: tuple[int, list[dict]]) -> tuple[int, list[dict], Mapping]:
+            start, chunk = numbered
+            try:
+                inserted = collection.insert_many(chunk, ordered=chunk_ordered)
+            except BulkWriteError as e:
+                return start, chunk, e.details
+            return start, chunk, {"nInserted": len(inserted.inserted_ids)}
+
+        result = ChunkedInsertResult()
+        for start, chunk, raw_result in map_chunks(
+            send, numbered_chunks(), max_workers=max_workers
+        ):
+            result.chunks += 1
+            result.inserted_count += raw_result.get("nInserted", 0)
+            failed = {error["index"] for error in raw_result.get("writeErrors", [])}
+            if return_ids:
+                # insert_many sets the `_id` of every document before sending it
+                if chunk_ordered and failed:
+                    inserted_documents = chunk[: raw_result["nInserted"]]
+                else:
+                    inserted_documents = [
+                        document
+                        for index, document in enumerate(chunk)
+                        if index not in failed
+                    ]
+                result.inserted_ids.extend(
+                    document["_id"] for document in inserted_documents
+                )
+            for error in raw_result.get("writeErrors", []):
+                result.errors.append(error | {"index": start + error["index"]})
+            if progress_callback:
+                progress_callback(result.inserted_count)
+            if chunk_ordered and failed:
+                # an ordered load stops at its first failing document
+                break
+        return result
+
+    @invalidates_cache
+    def upsert_many(
+        self,
+        data: Iterable[dict],
+        key_fields: Sequence[str],
+        strategy: str = "$set",
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        max_chunk_bytes: int | None = None,
+        max_workers: int | None = None,
+        progress_callback: Callable[[int], None] | None = None,
+    ) -> BulkWriteSummary:
+        """
+        Upserts documents on their natural key, streamed in unordered `bulk_write` chunks, one round trip
+        per chunk instead of one `update_one` per document
+        :param data: Iterable of documents, each must hold every key field
+        :param key_fields: Fields identifying a document, e.g. ["registered_plugin_id"]. They should be
+                covered by a unique index, else concurrent upserts of a new key can insert it twice.
+        :param (Optional) strategy: Update operator applied to each document ("$set", "$setOnInsert", ...)
+                or "replace" to replace the stored documents
+        :param (Optional) chunk_size: Maximum number of documents per chunk
+        :param (Optional) max_chunk_bytes: Maximum encoded BSON size of a chunk
+        :param (Optional) max_workers: Send chunks concurrently over a thread pool
+        :param (Optional) progress_callback: Called with the number of documents sent after each chunk
+        :return: BulkWriteSummary of the run. Write errors do not stop the run, they are reported in
+                `errors` with the position of their document in `data`.
+        """
+        database_name = self.database
+        collection_name = self.collection
+        db = self.client[database_name]
+        collection = db[collection_name]
+
+        def numbered_chunks() -> Iterator[tuple[int, list[dict]]]:
+            start = 0
+            for chunk in iter_chunks(
+                data, chunk_size=chunk_size, max_chunk_bytes=max_chunk_bytes
+            ):
+                yield start, chunk
+                start += len(chunk)
+
+        def send(numbered: tuple[int, list[dict]]) -> tuple[range, Mapping]:
+            start, chunk = numbered
+            operations = [
+                upsert_operation(document, key_fields, strategy) for document in chunk
+            ]
+            positions = range(start, start + len(chunk))
+            try:
+                return positions, collection.bulk_write(
+                    operations, ordered=False
+                ).bulk_api_result
+            except BulkWriteError as e:
+                return positions, e.details
+
+        summary = BulkWriteSummary()
+        for positions, raw_result in map_chunks(
+            send, numbered_chunks(), max_workers=max_workers
+        ):
+            summary.batches += 1
+            summary.add(raw_result, positions)
+            if progress_callback:
+                progress_callback(positions.stop)
+        return summary
 
     def find(
         self,
@@ -67,6 +356,7 @@ class MongoCollectionBaseClass:
         sort: Union[None, str, Sequence[Tuple[str, Union[int, str, dict]]]] = None,
         skip: int = 0,
         limit: int | None = None,
+        raw: bool | None = None,
     ) -> Cursor:
         """
         The function is used to query documents from the collection
@@ -76,20 +366,25 @@ class MongoCollectionBaseClass:
         :param (Optional) sort: List of tuple with key and direction. [(key, -1), ...]
         :param (Optional) skip: Skip Number
         :param (Optional) limit: Limit Number
+        :param (Optional) raw: return RawBSONDocuments, defaults to `raw_bson`
         :return: A mongo cursor
         """
         sort = sort or []
         if filter_dict is None:
             filter_dict = {"_id": 0}
+        self._advise(query, sort if isinstance(sort, list) else None)
         database_name = self.database
         collection_name = self.collection
         db = self.client[database_name]
         collection = db[collection_name]
+        if self.is_raw(raw):
+            collection = collection.with_options(codec_options=RAW_CODEC_OPTIONS)
         if len(sort) > 0:
             cursor = (
                 collection.find(
                     query,
                     filter_dict,
+                    **comment_kwargs(),
                 )
                 .sort(sort)
                 .skip(skip)
@@ -98,27 +393,41 @@ class MongoCollectionBaseClass:
             cursor = collection.find(
                 query,
                 filter_dict,
+                **comment_kwargs(),
             ).skip(skip)
         if limit:
             cursor = cursor.limit(limit)
         return cursor
 
-    def find_one(self, query: dict, filter_dict: dict | None = None) -> dict | None:
+    def find_one(
+        self, query: dict, filter_dict: dict | None = None, raw: bool | None = None
+    ) -> dict | None:
         """
         The function is used to query documents from the collection
         :param query: a mongo query object or dictionary
         :param (Optional) filter_dict: a dictionary with keys from mongo collection.
                 If nothing is passed, it defaults to {"_id": 0}
+        :param (Optional) raw: return a RawBSONDocument, defaults to `raw_bson`
         :return: document or None
         """
+        self._advise(query)
         database_name = self.database
         collection_name = self.collection
         if filter_dict is None:
             filter_dict = {"_id": 0}
         db = self.client[database_name]
         collection = db[collection_name]
+        raw = self.is_raw(raw)
+        if raw:
+            collection = collection.with_options(codec_options=RAW_CODEC_OPTIONS)
+        if cache := self.query_cache:
+            return cache.cached(
+                cache_key("find_one", query, filter_dict, raw),
+                lambda: collection.find_one(query, filter_dict),
+            )
         return collection.find_one(query, filter_dict)
 
+    @invalidates_cache
     def update_one(
         self,
         query: dict,
@@ -140,6 +449,7 @@ class MongoCollectionBaseClass:
         collection = db[collection_name]
         return collection.update_one(query, {strategy: data}, upsert=upsert)
 
+    @invalidates_cache
     def update_to_set(
         self, query: dict, param: str, data: Any, upsert: bool = False
     ) -> UpdateResult:
@@ -157,6 +467,7 @@ class MongoCollectionBaseClass:
         collection = db[collection_name]
         return collection.update_one(query, {"$addToSet": {param: data}}, upsert=upsert)
 
+    @invalidates_cache
     def update_many(
         self, query: dict, data: dict, upsert: bool = False
     ) -> UpdateResult:
@@ -172,6 +483,7 @@ class MongoCollectionBaseClass:
         collection = db[collection_name]
         return collection.update_many(query, {"$set": data}, upsert=upsert)
 
+    @invalidates_cache
     def find_and_update(
         self,
         query: dict,
@@ -198,10 +510,16 @@ class MongoCollectionBaseClass:
             upsert=upsert,
         )
 
-    def delete_many(self, query: dict) -> DeleteResult:
+    @invalidates_cache
+    def delete_many(
+        self, query: dict, batch_size: int = SOFT_DELETE_BATCH_SIZE
+    ) -> DeleteResult:
         """
-        Delete multiple document based on query match
+        Delete multiple document based on query match.
+        With soft delete enabled, the matched documents are deleted in batches of `batch_size` `_id`s and
+        each batch is archived into `deleted__<database>` with a single bulk write.
         :param query: a mongo query dictionary
+        :param (Optional) batch_size: Number of documents archived and deleted per round trip on soft delete
         :return: DeleteResult (refer mongo documentation)
         """
         database_name = self.database
@@ -209,12 +527,15 @@ class MongoCollectionBaseClass:
         db = self.client[database_name]
         collection = db[collection_name]
         if self.soft_delete:
-            self.perform_soft_delete(query)
+            return self._soft_delete_many(collection, query, batch_size)
         return collection.delete_many(query)
 
+    @invalidates_cache
     def delete_one(self, query: dict) -> DeleteResult:
         """
-        Deletes a mongo document for a given query
+        Deletes a mongo document for a given query.
+        With soft delete enabled, the document is removed with `find_one_and_delete` and exactly that
+        document is archived into `deleted__<database>`.
         :param query: a mongo query dictionary
         :return: DeleteResult (refer mongo documentation)
         """
@@ -223,10 +544,52 @@ class MongoCollectionBaseClass:
         db = self.client[database_name]
         collection = db[collection_name]
         if self.soft_delete:
-            self.perform_soft_delete(query)
+            return self._soft_delete_one(collection, query)
         return collection.delete_one(query)
 
+    def _archive_collection(self):
+        return self.client[archive_database(self.database)][self.collection]
+
+    def _soft_delete_one(self, collection, query: dict) -> DeleteResult:
+        document = collection.find_one_and_delete(query)
+        if document is not None:
+            try:
+                self._archive_collection().bulk_write(
+                    archive_operations([document]), ordered=False
+                )
+            except Exception:
+                # never lose a document that could not be archived
+                collection.insert_one(document)
+                raise
+        return DeleteResult(
+            {"n": int(document is not None), "ok": 1},
+            acknowledged=collection.write_concern.acknowledged,
+        )
+
+    def _soft_delete_many(
+        self, collection, query: dict, batch_size: int
+    ) -> DeleteResult:
+        # Archive first, then delete the archived _ids that still match the query, so a crash in between leaves
+        # an extra archived copy rather than a lost document. A document another writer changed in between so
+        # that it no longer matches is kept, with its update, and only leaves an extra archived copy.
+        archive = self._archive_collection()
+        deleted_count = 0
+        while documents := list(collection.find(query).limit(batch_size)):
+            ids = [document["_id"] for document in documents]
+            archive.bulk_write(archive_operations(documents), ordered=False)
+            result = collection.delete_many(batch_query(query, ids))
+            deleted_count += result.deleted_count
+        return DeleteResult(
+            {"n": deleted_count, "ok": 1},
+            acknowledged=collection.write_concern.acknowledged,
+        )
+
     def perform_soft_delete(self, query):
+        """
+        Archives every document matching `query` into `deleted__<database>` with a `$merge` aggregation,
+        without deleting it. `delete_one` and `delete_many` archive the documents they delete themselves.
+        :param query: a mongo query dictionary
+        """
         soft_del_query = [
             {"$match": query},
             {
@@ -239,13 +602,48 @@ class MongoCollectionBaseClass:
             {
                 "$merge": {
                     "into": {
-                        "db": f"deleted__{self.database}",
+                        "db": archive_database(self.database),
                         "coll": self.collection,
                     },
                 }
             },
         ]
-        self.aggregate(pipelines=soft_del_query)
+        self.aggregate(pipelines=soft_del_query, raw=False)
+
+    def bulk(self, batch_size: int = 1000, max_age: float | None = None) -> BulkWriter:
+        """
+        Creates a writer that buffers `insert_one`, `update_one`, `update_to_set`, `update_many`, `delete_one`
+        and `delete_many` calls and sends them as unordered `bulk_write` batches. Use it as a context manager
+        so the remaining operations are flushed on exit.
+        :param batch_size: Number of buffered operations that triggers a flush
+        :param max_age: Seconds after which buffered operations are flushed by a timer, even without new writes
+        :return: BulkWriter, its `summary` holds the aggregated counts and per operation errors
+        """
+        return BulkWriter(self, batch_size=batch_size, max_age=max_age)
+
+    def loader(
+        self,
+        field: str = "_id",
+        filter_dict: dict | None = None,
+        window: float = 0.002,
+        max_batch_size: int = 1000,
+    ) -> BatchLoader:
+        """
+        Creates a loader that coalesces single document lookups on `field`, made from several threads within
+        `window` seconds, into one `find({field: {"$in": keys}})`
+        :param field: field looked up, the loader returns the first document of each key
+        :param (Optional) filter_dict: projection, defaults to {"_id": 0} as in `find_one`
+        :param window: seconds a batch waits for more keys after its first one
+        :param max_batch_size: number of keys that sends a batch without waiting
+        :return: BatchLoader, call `load(key)` or `load_many(keys)`
+        """
+        return BatchLoader(
+            self,
+            field=field,
+            filter_dict=filter_dict,
+            window=window,
+            max_batch_size=max_batch_size,
+        )
 
     def distinct(self, query_key: str, filter_json: dict | None = None) -> list:
         """
@@ -258,21 +656,94 @@ class MongoCollectionBaseClass:
         collection_name = self.collection
         db = self.client[database_name]
         collection = db[collection_name]
+        if cache := self.query_cache:
+            return cache.cached(
+                cache_key("distinct", query_key, filter_json),
+                lambda: collection.distinct(query_key, filter_json),
+            )
         return collection.distinct(query_key, filter_json)
 
-    def find_count(self, query: Dict) -> Cursor:
+    def find_count(
+        self, query: Dict, mode: str = "exact", sample_size: int | None = None
+    ) -> int:
+        """
+        Counts the documents matching a query
+        :param query: a mongo query object or dictionary
+        :param (Optional) mode:
+                "exact" counts the matching documents with `count_documents`, through the read-through cache
+                when enabled.
+                "estimated" returns the collection size from its metadata without scanning anything, for an
+                empty query only. It can be off after an unclean shutdown or on sharded clusters with orphans.
+                "auto" is "estimated" for an empty query and "exact" otherwise.
+                "cached" is an exact count reused for `count_cache_ttl` seconds, even if documents were
+                written since.
+                "approximate" extrapolates the matching fraction of a random `$sample` to the estimated
+                collection size, exact when the collection is not larger than the sample.
+        :param (Optional) sample_size: documents sampled in "approximate" mode, defaults to `count_sample_size`
+        :return: number of documents
+        """
+        if mode not in COUNT_MODES:
+            raise ValueError(
+                f"Unknown count mode {mode!r}, expected one of {COUNT_MODES}"
+            )
+        if mode == "auto":
+            mode = "exact" if query else "estimated"
+        if mode == "estimated" and query:
+            raise ValueError("An estimated count only applies to an empty query")
+        self._advise(query)
         database_name = self.database
         collection_name = self.collection
         db = self.client[database_name]
         collection = db[collection_name]
+        if mode == "estimated":
+            return collection.estimated_document_count()
+        if mode == "approximate":
+            return self._approximate_count(
+                collection, query, sample_size or self.count_sample_size
+            )
+        if mode == "cached":
+            cache = get_count_cache(
+                type(self),
+                (self.database, self.collection),
+                max_size=self.count_cache_size,
+                ttl=self.count_cache_ttl,
+            )
+        else:
+            cache = self.query_cache
+        if cache:
+            return cache.cached(
+                cache_key("find_count", query),
+                lambda: collection.count_documents(query),
+            )
         return collection.count_documents(query)
 
+    @staticmethod
+    def _approximate_count(collection, query: dict, sample_size: int) -> int:
+        total = collection.estimated_document_count()
+        if total <= sample_size:
+            return collection.count_documents(query)
+        if not query:
+            return total
+        matched = next(
+            collection.aggregate(
+                [
+                    {"$sample": {"size": sample_size}},
+                    {"$match": query},
+                    {"$count": "n"},
+                ],
+                **comment_kwargs(),
+            ),
+            {"n": 0},
+        )["n"]
+        return round(matched / sample_size * total)
+
     def aggregate(
         self,
         pipelines: list,
         let: Mapping[str, Any] | None = None,
         collation=None,
         allowDiskUse=False,  # noqa NOSONAR
+        raw: bool | None = None,
     ) -> CommandCursor[_DocumentType]:
         """
         Perform an aggregation using the aggregation framework on this collection
@@ -281,12 +752,545 @@ class MongoCollectionBaseClass:
               comment: Any | None = None,
         :param allowDiskUse: Enables writing to temporary files. When set to True, aggregation stages can write data to the _tmp subdirectory in the dbPath directory.
         :param collation: performs case insensitivity on string comparison and diacritic insensitivity on character comparison.
+        :param raw: return RawBSONDocuments, defaults to `raw_bson`
         :return:
         """
         database_name = self.database
         collection_name = self.collection
         db = self.client[database_name]
         collection = db[collection_name]
+        if self.is_raw(raw):
+            collection = collection.with_options(codec_options=RAW_CODEC_OPTIONS)
         return collection.aggregate(
-            pipelines, let=let, collation=collation, allowDiskUse=allowDiskUse
+            pipelines,
+            let=let,
+            collation=collation,
+            allowDiskUse=allowDiskUse,
+            **comment_kwargs(),
         )
+
+    def aggrid_set_filter_values(
+        self,
+        columns: list[str],
+        filter_model: dict | None = None,
+        limit: int | None = None,
+    ) -> dict[str, list[dict]]:
+        """
+        Values of AG Grid set filters for many columns, from a single aggregation.
+        Results go through the read-through cache when enabled, keyed on the filter model.
+        :param columns: columns whose values are requested
+        :param (Optional) filter_model: active filter model of the grid, each column's own filter is ignored
+        :param (Optional) limit: maximum number of values per column
+        :return: `{column: [{"value": ..., "count": n}, ...]}`, values in ascending order
+        """
+        if not columns:
+            return {}
+        filter_model = filter_model or {}
+        query_util = self.aggrid_query_util
+
+        def fetch() -> dict[str, list[dict]]:
+            pipeline = query_util.build_set_values_query(filter_model, columns, limit)
+            result = next(
+                self.aggregate(
+                    pipelines=pipeline, collation=query_util.collation, raw=False
+                )
+            )
+            return {
+                column: [
+                    {"value": value["_id"], "count": value["count"]}
+                    for value in result[f"c{i}"]
+                ]
+                for i, column in enumerate(columns)
+            }
+
+        if cache := self.query_cache:
+            return cache.cached(
+                cache_key("aggrid_set_filter_values", filter_model, columns, limit),
+                fetch,
+            )
+        return fetch()
+
+    def _aggrid_search(self, req_body: AGGridTableRequest) -> dict:
+        # how the builder searches the request's quick filter text on this collection
+        return {
+            "text_search": bool(self.aggrid_query_util.quick_filter_text(req_body))
+            and self.has_text_index(),
+            "quick_filter_fields": self.text_index_fields or None,
+        }
+
+    def _export_cursor(
+        self,
+        fmt: str,
+        query: dict | None,
+        filter_dict: dict | None,
+        pipeline: list | None,
+        req_body: AGGridTableRequest | None,
+        batch_size: int,
+    ) -> Cursor | CommandCursor:
+        database_name = self.database
+        collection_name = self.collection
+        db = self.client[database_name]
+        collection = db[collection_name]
+        if fmt == "bson":
+            # documents are written as they were received, without being decoded
+            collection = collection.with_options(codec_options=RAW_CODEC_OPTIONS)
+        collation = None
+        if req_body is not None:
+            query_util = self.aggrid_query_util
+            pipeline = query_util.build_export_query(
+                req_body, **self._aggrid_search(req_body)
+            )
+            collation = query_util.collation
+        if pipeline is not None:
+            return collection.aggregate(
+                pipeline,
+                batchSize=batch_size,
+                collation=collation,
+                allowDiskUse=True,
+                **comment_kwargs(),
+            )
+        if filter_dict is None:
+            filter_dict = {"_id": 0}
+        return collection.find(
+            query or {}, filter_dict, batch_size=batch_size, **comment_kwargs()
+        )
+
+    def iter_export(
+        self,
+        fmt: str = "ndjson",
+        query: dict | None = None,
+        filter_dict: dict | None = None,
+        pipeline: list | None = None,
+        req_body: AGGridTableRequest | None = None,
+        batch_size: int = DEFAULT_EXPORT_BATCH_SIZE,
+        gzip: bool = False,
+        columns: list[str] | None = None,
+    ) -> Iterator[bytes]:
+        """
+        Streams documents as chunks of encoded bytes, one chunk per `batch_size` documents, e.g. as the body
+        of an HTTP streaming response. Memory use is bounded by a batch, not by the size of the export.
+        The documents are those of `req_body` (every row of an AG Grid request, unpaged), else `pipeline`,
+        else `find(query, filter_dict)`.
+        :param fmt: "ndjson", "csv" or "bson", see `exporters.iter_export`
+        :param (Optional) query: find query
+        :param (Optional) filter_dict: find projection. If nothing is passed, it defaults to {"_id": 0}
+        :param (Optional) pipeline: aggregation pipeline
+        :param (Optional) req_body: AG Grid request
+        :param (Optional) batch_size: documents per cursor batch and per chunk
+        :param (Optional) gzip: gzip the stream
+        :param (Optional) columns: csv columns, taken from the first document when not given
+        :return: generator of bytes
+        """
+        cursor = self._export_cursor(
+            fmt, query, filter_dict, pipeline, req_body, batch_size
+        )
+        return iter_export(cursor, fmt, batch_size, gzip, columns)
+
+    def export(
+        self,
+        destination: str | os.PathLike | IO[bytes],
+        fmt: str = "ndjson",
+        query: dict | None = None,
+        filter_dict: dict | None = None,
+        pipeline: list | None = None,
+        req_body: AGGridTableRequest | None = None,
+        batch_size: int = DEFAULT_EXPORT_BATCH_SIZE,
+        gzip: bool = False,
+        columns: list[str] | None = None,
+    ) -> int:
+        """
+        Streams documents to a file, see `iter_export` for the arguments
+        :param destination: path, or binary file-like object
+        :return: number of exported documents
+        """
+        cursor = self._export_cursor(
+            fmt, query, filter_dict, pipeline, req_body, batch_size
+        )
+        return write_export(cursor, destination, fmt, batch_size, gzip, columns)
+
+    def create_text_index(self, **kwargs) -> str:
+        """
+        Creates the text index over `text_index_fields`, a collection has at most one text index
+        :param kwargs: index options, e.g. `weights` or `default_language`
+        :return: name of the index
+        """
+        if not self.text_index_fields:
+            raise ValueError("text_index_fields is not set")
+        database_name = self.database
+        collection_name = self.collection
+        db = self.client[database_name]
+        collection = db[collection_name]
+        name = collection.create_index(
+            [(field, TEXT) for field in self.text_index_fields], **kwargs
+        )
+        self._has_text_index = True
+        return name
+
+    def has_text_index(self) -> bool:
+        """Whether the collection has a text index, looked up once per instance"""
+        if self._has_text_index is None:
+            database_name = self.database
+            collection_name = self.collection
+            db = self.client[database_name]
+            collection = db[collection_name]
+            self._has_text_index = any(
+                kind == TEXT
+                for index in collection.index_information().values()
+                for _, kind in index["key"]
+            )
+        return self._has_text_index
+
+    def find_raw_batches(
+        self,
+        query: dict,
+        filter_dict: dict | None = None,
+        batch_size: int | None = None,
+    ) -> RawBatchCursor:
+        """
+        Query documents as raw batches: each iteration yields the bytes of a whole batch of BSON documents,
+        to be forwarded as is or converted with `raw_documents.raw_batches_to_json`
+        :param query: a mongo query object or dictionary
+        :param (Optional) filter_dict: a dictionary with keys from mongo collection.
+                If nothing is passed, it defaults to {"_id": 0}
+        :param (Optional) batch_size: number of documents per batch
+        :return: A raw batch cursor
+        """
+        if filter_dict is None:
+            filter_dict = {"_id": 0}
+        database_name = self.database
+        collection_name = self.collection
+        db = self.client[database_name]
+        collection = db[collection_name]
+        cursor = collection.find_raw_batches(query, filter_dict, **comment_kwargs())
+        if batch_size:
+            cursor = cursor.batch_size(batch_size)
+        return cursor
+
+    def aggregate_raw_batches(
+        self,
+        pipelines: list,
+        let: Mapping[str, Any] | None = None,
+        collation=None,
+        allowDiskUse=False,  # noqa NOSONAR
+    ) -> RawBatchCommandCursor:
+        """
+        Perform an aggregation returning raw batches of BSON documents, see `find_raw_batches`
+        :param pipelines: A sequence of data aggregation operations or stages
+        :return: A raw batch command cursor
+        """
+        database_name = self.database
+        collection_name = self.collection
+        db = self.client[database_name]
+        collection = db[collection_name]
+        return collection.aggregate_raw_batches(
+            pipelines,
+            let=let,
+            collation=collation,
+            allowDiskUse=allowDiskUse,
+            **comment_kwargs(),
+        )
+
+    def find_columnar(
+        self,
+        query: dict,
+        schema: Mapping[str, Any],
+        sort: Union[None, str, Sequence[Tuple[str, Union[int, str, dict]]]] = None,
+        skip: int = 0,
+        limit: int | None = None,
+        batch_size: int | None = None,
+    ) -> dict:
+        """
+        Query documents into NumPy columns instead of dicts, requires NumPy (`pymongo-util[numpy]`)
+        :param query: a mongo query object or dictionary
+        :param schema: field name to NumPy dtype, e.g. {"price": "float64", "sku": "U16"}. Only these fields
+                are fetched, dotted names reach into embedded documents. A longer string than a "U"/"S" dtype
+                holds raises ValueError.
+        :param (Optional) sort: List of tuple with key and direction. [(key, -1), ...]
+        :param (Optional) skip: Skip Number
+        :param (Optional) limit: Limit Number, also sizes the arrays upfront
+        :param (Optional) batch_size: number of documents per cursor batch
+        :return: field name to `numpy.ma.MaskedArray`, masked where a document has no value
+        """
+        from .columnar import DEFAULT_CAPACITY, ColumnarBuilder, schema_projection
+
+        builder = ColumnarBuilder(schema, capacity=limit or DEFAULT_CAPACITY)
+        cursor = self.find(
+            query,
+            schema_projection(schema),
+            sort=sort,
+            skip=skip,
+            limit=limit,
+            raw=False,
+        )
+        if batch_size:
+            cursor = cursor.batch_size(batch_size)
+        builder.extend(cursor)
+        return builder.columns()
+
+    def aggregate_columnar(
+        self,
+        pipelines: list,
+        schema: Mapping[str, Any],
+        let: Mapping[str, Any] | None = None,
+        collation=None,
+        allowDiskUse=False,  # noqa NOSONAR
+    ) -> dict:
+        """
+        Perform an aggregation into NumPy columns, see `find_columnar`. A `$project` of the schema fields is
+        appended to the pipeline.
+        :param pipelines: A sequence of data aggregation operations or stages
+        :param schema: field name to NumPy dtype
+        :return: field name to `numpy.ma.MaskedArray`, masked where a document has no value
+        """
+        from .columnar import ColumnarBuilder, schema_projection
+
+        builder = ColumnarBuilder(schema)
+        builder.extend(
+            self.aggregate(
+                pipelines=[*pipelines, {"$project": schema_projection(schema)}],
+                let=let,
+                collation=collation,
+                allowDiskUse=allowDiskUse,
+                raw=False,
+            )
+        )
+        return builder.columns()
+
+    def parallel_scan(
+        self,
+        query: dict | None = None,
+        filter_dict: dict | None = None,
+        pipeline: list | None = None,
+        combiner: Callable[[dict, dict], dict] | None = None,
+        field: str = "_id",
+        partitions: int | None = None,
+        max_workers: int = 4,
+        sample_size: int | None = None,
+    ) -> Iterator[dict]:
+        """
+        Scans the collection in ranges of `field` read concurrently over a thread pool, each on its own
+        connection. Range bounds come from a `$sample` of the field's values, see `parallel_scan.sample_bounds`.
+        Each range runs `pipeline` after a `$match` on the range, or `find(query, filter_dict)`. A last range
+        reads the documents where the field is null or missing.
+        Documents are yielded in range order as their batches arrive, while up to `max_workers` ranges are
+        read ahead, see `parallel_scan.iter_ranges`.
+        :param (Optional) query: find query, or the query of the `$match` prepended to `pipeline`
+        :param (Optional) filter_dict: find projection. If nothing is passed, it defaults to {"_id": 0}
+        :param (Optional) pipeline: aggregation pipeline run on every range
+        :param (Optional) combiner: with a pipeline ending with `$group`, merges the partial results of a group
+                found in several ranges, `combiner(a, b) -> merged`. Groups are yielded once every range is read.
+        :param (Optional) field: indexed field the collection is split on, with values of a single type
+        :param (Optional) partitions: number of ranges, defaults to `4 * max_workers`
+        :param (Optional) max_workers: number of threads
+        :param (Optional) sample_size: number of sampled documents, defaults to `20 * partitions`
+        :return: documents
+        """
+        query = query or {}
+        if filter_dict is None:
+            filter_dict = {"_id": 0}
+        partitions = partitions or 4 * max_workers
+        database_name = self.database
+        collection_name = self.collection
+        db = self.client[database_name]
+        collection = db[collection_name]
+        ranges = sample_bounds(
+            collection, field, partitions, sample_size or 20 * partitions
+        )
+
+        # ranges are read on other threads, which do not see this method's context
+        comment = comment_kwargs()
+
+        def read(bounds) -> Iterator[list[dict]]:
+            match = range_query(query, field, bounds)
+            if pipeline is not None:
+                cursor = collection.aggregate([{"$match": match}] + pipeline, **comment)
+            else:
+                cursor = collection.find(match, filter_dict, **comment)
+            with cursor:
+                yield from iter_chunks(cursor)
+
+        documents = iter_ranges(read, ranges, max_workers=max_workers)
+        if combiner is not None:
+            return iter(combine_groups(documents, combiner))
+        return documents
+
+    def aggrid_query(
+        self,
+        req_body: AGGridTableRequest,
+        additional_projection: dict | None = None,
+        count: str = "exact",
+        known_total: int | None = None,
+        keyset: bool = False,
+    ) -> AGGridTableResponse:
+        """
+        Runs an AG Grid server side request and returns the page of rows together with the total row count,
+        both from a single `$facet` aggregation.
+        :param req_body: AG Grid request
+        :param (Optional) additional_projection: projection applied to the rows
+        :param (Optional) count: "exact" counts the matches in the same aggregation, "estimated" uses
+                `estimated_document_count` when the request has no filters and no row grouping, and counts
+                exactly otherwise,
+                "none" skips counting
+        :param (Optional) known_total: total row count already known by the grid, skips counting
+        Group rows are returned for row grouping and pivot requests, see `AGGridMongoQueryUtil.form_group_query`;
+        pivot requests also return the pivot result fields found in the page.
+        :param (Optional) keyset: seek to the next block with the request's `cursor` instead of `$skip`.
+                The response carries the cursor for the following block; pass it back with the next request.
+                When a keyset continuation still needs a count, it is run as a separate aggregation.
+        The quick filter text is searched with `$text` when the collection has a text index, else with
+        regexes over `text_index_fields`.
+        :return: AGGridTableResponse. Without a count, `last_row` is only set once the last page is reached
+        """
+        if count not in ("exact", "estimated", "none"):
+            raise ValueError(f"Invalid count mode: {count}")
+        query_util = self.aggrid_query_util
+        search = self._aggrid_search(req_body)
+        total = known_total
+        with_count = known_total is None and count != "none"
+        if (
+            with_count
+            and count == "estimated"
+            and query_util.counts_collection(req_body)
+        ):
+            database_name = self.database
+            collection_name = self.collection
+            db = self.client[database_name]
+            collection = db[collection_name]
+            total = collection.estimated_document_count()
+            with_count = False
+        if with_count and keyset and query_util.keyset_continues(req_body):
+            counted = list(
+                self.aggregate(
+                    pipelines=query_util.build_count_query(req_body, **search),
+                    collation=query_util.collation,
+                    raw=False,
+                )
+            )
+            total = counted[0]["count"] if counted else 0
+            with_count = False
+
+        pipeline = query_util.build_facet_query(
+            req_body,
+            additional_projection=additional_projection,
+            with_count=with_count,
+            keyset=keyset,
+            **search,
+        )
+        if self.index_advisor is not None:
+            self._advise(*query_util.leading_match_and_sort(pipeline))
+        if with_count:
+            result = next(
+                self.aggregate(
+                    pipelines=pipeline, collation=query_util.collation, raw=False
+                )
+            )
+            rows = result["rows"]
+            total = result["total"][0]["count"] if result["total"] else 0
+        else:
+            rows = list(
+                self.aggregate(
+                    pipelines=pipeline, collation=query_util.collation, raw=False
+                )
+            )
+        page_size = req_body.end_row - req_body.start_row
+        if total is None and len(rows) < page_size:
+            total = req_body.start_row + len(rows)
+
+        cursor = None
+        if keyset:
+            sort_values = [row.pop(KEYSET_FIELD, {}) for row in rows]
+            if rows and sort_values[-1] and len(rows) == page_size:
+                cursor = encode_keyset_cursor(
+                    list(sort_values[-1].values()),
+                    req_body.start_row + len(rows),
+                    keyset_sort_digest(req_body),
+                )
+        pivot_result_fields = None
+        if query_util.is_pivot(req_body.filters):
+            pivot_result_fields = query_util.pivot_result_fields(req_body.filters, rows)
+        return AGGridTableResponse(
+            row_data=rows,
+            last_row=total,
+            cursor=cursor,
+            pivot_result_fields=pivot_result_fields,
+        )
+
+    def _materialized_view(self, name: str) -> MaterializedView:
+        for view in self.materialized_views:
+            if view.name == name:
+                return view
+        raise KeyError(f"{self!r} has no materialized view {name!r}")
+
+    def view(self, name: str) -> "MongoCollectionBaseClass":
+        """
+        Collection class instance reading a materialized view, for `aggrid_query` and the other read methods.
+        It filters with the `aggrid_query_util` of this class and declares the view's indexes.
+        :param name: name of a view of `materialized_views`
+        """
+        view = self._materialized_view(name)
+        reader = MongoCollectionBaseClass(
+            self.client, view.database or self.database, view.name, soft_delete=False
+        )
+        reader.aggrid_query_util = self.aggrid_query_util
+        reader.indexes = view.indexes
+        return reader
+
+    def refresh_view(self, name: str, full: bool = False) -> dict:
+        """
+        Refreshes a materialized view, incrementally from its high-water mark when it has one, see the
+        `materialized_views` module. The first refresh of a view creates its indexes and is a full refresh.
+        :param name: name of a view of `materialized_views`
+        :param (Optional) full: recompute the whole view, which also drops the documents of deleted sources
+        :return: the state stored in the metadata collection: `high_water_mark`, `refreshed_at` and `full`
+        """
+        view = self._materialized_view(name)
+        database_name = self.database
+        collection_name = self.collection
+        db = self.client[database_name]
+        collection = db[collection_name]
+        metadata = db[VIEW_METADATA_COLLECTION]
+        key = view_id(database_name, collection_name, view)
+        state = metadata.find_one({"_id": key})
+        if state is None:
+            self.view(name).ensure_indexes()
+        full = (
+            full
+            or view.high_water_mark is None
+            or state is None
+            or state.get("high_water_mark") is None
+        )
+
+        # read before the refresh: documents written while it runs are picked up by the next one
+        until = None
+        if view.high_water_mark is not None:
+            latest = list(
+                collection.aggregate(
+                    [
+                        {"$match": {view.high_water_mark: {"$ne": None}}},
+                        {"$sort": {view.high_water_mark: -1}},
+                        {"$limit": 1},
+                        {"$project": {"_id": 0, "mark": f"${view.high_water_mark}"}},
+                    ],
+                    **comment_kwargs(),
+                )
+            )
+            until = latest[0]["mark"] if latest else None
+
+        if full:
+            pipeline = full_refresh_pipeline(view, database_name)
+        elif until is not None and until != state.get("high_water_mark"):
+            pipeline = incremental_refresh_pipeline(
+                view, database_name, state["high_water_mark"], until
+            )
+        else:
+            pipeline = None
+        if pipeline:
+            collection.aggregate(pipeline, allowDiskUse=True, **comment_kwargs())
+        state = {
+            "_id": key,
+            "high_water_mark": until,
+            "refreshed_at": datetime.now(timezone.utc),
+            "full": full,
+        }
+        metadata.replace_one({"_id": key}, state, upsert=True)
+        return state
@@ -2,30 +2,186 @@
 All definitions related to mongo db is defined in this module
 """
 
+import os
 import sys
-from typing import Type
+import threading
+from typing import TYPE_CHECKING, Any, Type
 
 try:
-    from pymongo import MongoClient
+    from pymongo import AsyncMongoClient, MongoClient
 except ImportError:  # pragma: no cover
     sys.stderr.write("PyMongo not installed, run pip install pymongo")
     raise
 
-from . import mongo_sync
+from .instrumentation import Instrumentation
 from .util_configs import MongoConfig
 
+if TYPE_CHECKING:
+    # imported on first use, a client alone does not need the collection classes and their query builders
+    from . import mongo_async, mongo_sync
+
+
+def pool_options() -> dict:
+    """Connection pool settings of `MongoConfig`, as MongoClient keyword arguments"""
+    options = {
+        "maxPoolSize": MongoConfig.MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MongoConfig.MONGO_MIN_POOL_SIZE,
+    }
+    if MongoConfig.MONGO_MAX_IDLE_TIME_MS is not None:
+        options["maxIdleTimeMS"] = MongoConfig.MONGO_MAX_IDLE_TIME_MS
+    if MongoConfig.MONGO_WAIT_QUEUE_TIMEOUT_MS is not None:
+        options["waitQueueTimeoutMS"] = MongoConfig.MONGO_WAIT_QUEUE_TIMEOUT_MS
+    return options
+
+
+def _freeze(value: Any) -> Any:
+    """Hashable form of a client option, for the registry key"""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(item) for item in value)
+    try:
+        hash(value)
+    except TypeError:
+        return id(value)
+    return value
+
 
 class MongoConnect:
-    def __init__(self, client: MongoClient | None = None) -> None:
-        self.client = client or MongoClient(MongoConfig.MONGO_URI, connect=False)
+    """
+    Clients created by `MongoConnect` come from a process wide registry, which holds one client per client type,
+    URI and options: classes and services talking to the same cluster share its connection pool. The registry
+    is emptied in child processes after a fork, so that pre-fork servers (gunicorn, celery) create their own
+    clients in every worker instead of using the parent's sockets.
+    """
+
+    _clients: dict[tuple, MongoClient | AsyncMongoClient] = {}
+    _clients_lock = threading.Lock()
+
+    def __init__(
+        self,
+        client: MongoClient | None = None,
+        async_client: AsyncMongoClient | None = None,
+        instrumentation: Instrumentation | None = None,
+        uri: str | None = None,
+        **client_options,
+    ) -> None:
+        """
+        :param client: defaults to the shared client of `uri`
+        :param async_client: defaults to the shared async client of `uri`, created on first access
+        :param instrumentation: command listener registered on the clients created here, by default one
+                is created when `MONGO_INSTRUMENTATION` is set. Clients passed in must register it themselves.
+        :param uri: defaults to `MONGO_URI`
+        :param client_options: MongoClient keyword arguments, they override the pool settings of `MongoConfig`
+        """
+        if instrumentation is None and MongoConfig.MONGO_INSTRUMENTATION:
+            instrumentation = Instrumentation(slow_ms=MongoConfig.MONGO_SLOW_MS)
+        self.instrumentation = instrumentation
+        self.uri = uri
+        self.client_options = client_options
+        self._client = client
+        self._async_client = async_client
 
     def __call__(self, *args, **kwargs):  # type: ignore
         return self.client
 
+    @property
+    def client(self) -> MongoClient:
+        """The client passed in, or the shared client of this process, looked up on every access"""
+        if self._client is not None:
+            return self._client
+        return self.get_client(
+            self.uri, event_listeners=self._listeners(), **self.client_options
+        )
+
+    @property
+    def async_client(self) -> AsyncMongoClient:
+        """AsyncMongoClient for `AsyncMongoCollectionBaseClass`, created on first access"""
+        if self._async_client is not None:
+            return self._async_client
+        return self.get_async_client(
+            self.uri, event_listeners=self._listeners(), **self.client_options
+        )
+
+    def _listeners(self) -> list:
+        return [self.instrumentation] if self.instrumentation else []
+
+    @classmethod
+    def get_client(cls, uri: str | None = None, **options) -> MongoClient:
+        """
+        Shared MongoClient of a URI and options, created on first request
+        :param uri: defaults to `MONGO_URI`
+        :param options: MongoClient keyword arguments, they override the pool settings of `MongoConfig`
+        """
+        return cls._shared(MongoClient, uri, options)
+
+    @classmethod
+    def get_async_client(cls, uri: str | None = None, **options) -> AsyncMongoClient:
+        """Shared AsyncMongoClient of a URI and options, see `get_client`"""
+        return cls._shared(AsyncMongoClient, uri, options)
+
+    @classmethod
+    def _shared(cls, client_class: type, uri: str | None, options: dict):
+        uri = uri or MongoConfig.MONGO_URI
+        options = pool_options() | options
+        if not options.get("event_listeners"):
+            # no listener is the default: the same client as when the option is left out
+            options.pop("event_listeners", None)
+        key = (client_class.__name__, uri, _freeze(options))
+        with cls._clients_lock:
+            if (client := cls._clients.get(key)) is None:
+                # connect=False: no monitoring thread is started until the first operation
+                client = cls._clients[key] = client_class(uri, connect=False, **options)
+        return client
+
+    @classmethod
+    def close_clients(cls) -> None:
+        """Closes the shared MongoClients and removes them from the registry"""
+        with cls._clients_lock:
+            keys = [
+                key
+                for key, client in cls._clients.items()
+                if isinstance(client, MongoClient)
+            ]
+            clients = [cls._clients.pop(key) for key in keys]
+        for client in clients:
+            client.close()
+
+    @classmethod
+    async def aclose_clients(cls) -> None:
+        """Closes the shared AsyncMongoClients and removes them from the registry"""
+        with cls._clients_lock:
+            keys = [
+                key
+                for key, client in cls._clients.items()
+                if isinstance(client, AsyncMongoClient)
+            ]
+            clients = [cls._clients.pop(key) for key in keys]
+        for client in clients:
+            await client.close()
+
+    @classmethod
+    def _after_fork(cls) -> None:
+        # the parent's clients and lock are unusable in the child, drop them without closing the parent's sockets
+        cls._clients = {}
+        cls._clients_lock = threading.Lock()
+
     @staticmethod
-    def get_base_class() -> Type[mongo_sync.MongoCollectionBaseClass]:
+    def get_base_class() -> Type["mongo_sync.MongoCollectionBaseClass"]:
+        from . import mongo_sync
+
         return mongo_sync.MongoCollectionBaseClass
 
+    @staticmethod
+    def get_async_base_class() -> Type["mongo_async.AsyncMongoCollectionBaseClass"]:
+        from . import mongo_async
+
+        return mongo_async.AsyncMongoCollectionBaseClass
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=MongoConnect._after_fork)
+
 
 class MongoStageCreator:
     @staticmethod
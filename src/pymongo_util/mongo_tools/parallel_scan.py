@@ -0,0 +1,173 @@
+"""Partitioned collection scans
+A collection is split into ranges of an indexed field, with bounds taken from a `$sample` of its values, so
+that every range can be read on its own connection. Values of the field should share a single BSON type:
+range queries only match values of the type of their bounds. Documents where the field is null or missing
+are read by a last range of their own.
+"""
+
+import queue
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator
+
+try:
+    import bson
+    from pymongo.collection import Collection
+except ImportError:  # pragma: no cover
+    sys.stderr.write("PyMongo not installed, run pip install pymongo")
+    raise
+
+Range = tuple[Any, Any]
+# batches a range read ahead of the caller holds before its thread waits
+RANGE_BUFFER = 2
+_DONE = object()
+
+
+def sample_bounds(
+    collection: Collection, field: str, partitions: int, sample_size: int
+) -> list[Range]:
+    """
+    Splits the values of `field` into `partitions` ranges of about the same number of documents
+    :param collection: pymongo collection
+    :param field: indexed field, `_id` usually
+    :param partitions: number of ranges wanted, fewer are returned for small or skewed samples
+    :param sample_size: number of sampled documents
+    :return: `(lower, upper)` ranges, lower bound included and upper bound excluded. The first range has no
+            lower bound and the last bounded one no upper bound (None). When the values are split, a final None
+            stands for the documents where the field is null or missing, which no bounded range matches.
+    """
+    sampled = [
+        document["v"]
+        for document in collection.aggregate(
+            [
+                {"$sample": {"size": sample_size}},
+                {"$match": {field: {"$ne": None}}},
+                {"$project": {"_id": 0, "v": f"${field}"}},
+                {"$sort": {"v": 1}},
+            ]
+        )
+    ]
+    bounds = []
+    for i in range(1, partitions):
+        if not sampled:
+            break
+        value = sampled[i * len(sampled) // partitions]
+        if not bounds or bounds[-1] != value:
+            bounds.append(value)
+    lowers = [None] + bounds
+    uppers = bounds + [None]
+    ranges: list[Range | None] = list(zip(lowers, uppers))
+    if bounds:
+        ranges.append(None)
+    return ranges
+
+
+def range_query(query: dict, field: str, bounds: Range | None) -> dict:
+    """Restricts `query` to a range returned by `sample_bounds`"""
+    if bounds is None:
+        # matches null and missing values
+        return {"$and": [query, {field: None}]} if query else {field: None}
+    lower, upper = bounds
+    condition = {}
+    if lower is not None:
+        condition["$gte"] = lower
+    if upper is not None:
+        condition["$lt"] = upper
+    if not condition:
+        return query
+    if not query:
+        return {field: condition}
+    return {"$and": [query, {field: condition}]}
+
+
+def combine_groups(
+    partials: Iterable[dict], combiner: Callable[[dict, dict], dict]
+) -> list[dict]:
+    """
+    Merges the `$group` outputs of every range: documents with the same `_id` are folded with `combiner`
+    :param partials: pipeline output of every range
+    :param combiner: merges two partial results of a group, e.g. adds their counts
+    :return: one document per group, in order of first appearance
+    """
+    groups: dict[bytes, dict] = {}
+    for document in partials:
+        key = bson.encode({"k": document.get("_id")})
+        if key in groups:
+            groups[key] = combiner(groups[key], document)
+        else:
+            groups[key] = document
+    return list(groups.values())
+
+
+def iter_ranges(
+    read: Callable[[Range | None], Iterable[list[dict]]],
+    ranges: Iterable[Range | None],
+    max_workers: int,
+) -> Iterator[dict]:
+    """
+    Reads ranges over a thread pool and yields their documents in range order, a batch at a time as they arrive. Up to
+    `max_workers` ranges are read at once, each one at most `RANGE_BUFFER` batches ahead of the caller.
+    :param read: yields the documents of a range in batches, e.g. from a cursor
+    :param ranges: ranges returned by `sample_bounds`
+    :param max_workers: number of threads, 1 reads the ranges one after the other in the calling thread
+    :return: documents
+    """
+    if max_workers <= 1:
+        for bounds in ranges:
+            for batch in read(bounds):
+                yield from batch
+        return
+    stop = threading.Event()
+
+    def put(batches: queue.Queue, item) -> bool:
+        # gives up once the caller stopped reading, instead of waiting on a full buffer
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce(bounds: Range | None, batches: queue.Queue) -> None:
+        reader = iter(())
+        try:
+            reader = iter(read(bounds))
+            for batch in reader:
+                if not put(batches, batch):
+                    return
+            put(batches, _DONE)
+        except Exception as e:
+            put(batches, e)
+        finally:
+            # closes the cursor of a range left unread
+            getattr(reader, "close", lambda: None)()
+
+    ranges = iter(ranges)
+    in_flight: deque[queue.Queue] = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+        def submit() -> None:
+            if (bounds := next(ranges, _DONE)) is not _DONE:
+                batches: queue.Queue = queue.Queue(maxsize=RANGE_BUFFER)
+                executor.submit(produce, bounds, batches)
+                in_flight.append(batches)
+
+        try:
+            # one thread per range in flight, so the range being yielded is always being read
+            for _ in range(max_workers):
+                submit()
+            while in_flight:
+                batches = in_flight.popleft()
+                while (item := batches.get()) is not _DONE:
+                    if isinstance(item, Exception):
+                        raise item
+                    yield from item
+                submit()
+        finally:
+            stop.set()
+
+
+__all__ = ["combine_groups", "iter_ranges", "range_query", "sample_bounds"]
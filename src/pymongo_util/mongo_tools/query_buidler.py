@@ -1,7 +1,18 @@
+import base64
 import logging
+import re
+import sys
+from dataclasses import dataclass, field
 
-from pymongo_util.exceptions import QueryFormationError
-from pymongo_util.mongo_tools.base_models import AGGridTableRequest
+from pymongo_util.exceptions import InvalidCursorError, QueryFormationError
+from pymongo_util.mongo_tools.base_models import AGGridFilterModel, AGGridTableRequest
+from pymongo_util.mongo_tools.query_cache import QueryCache, cache_key
+
+try:
+    import bson
+except ImportError:  # pragma: no cover
+    sys.stderr.write("PyMongo not installed, run pip install pymongo")
+    raise
 
 MG_AGG_REGEX = "$regex"
 MG_AGG_PROJECT = "$project"
@@ -9,128 +20,809 @@ MG_AGG_OPTIONS = "$options"
 MG_AGG_EMPTY = "$empty"
 MG_AGG_MATCH = "$match"
 
+KEYSET_FIELD = "__keyset"
+CHILD_COUNT_FIELD = "childCount"
+AUTO_GROUP_COLUMN = "ag-Grid-AutoColumn"
+TEXT_SCORE_SORT = {"score": {"$meta": "textScore"}}
+
+AGG_FUNCTIONS = {
+    "sum": "$sum",
+    "avg": "$avg",
+    "min": "$min",
+    "max": "$max",
+    "first": "$first",
+    "last": "$last",
+}
+
+# How the optimization pass rewrites text filters:
+# "regex" keeps them case insensitive, only prefix patterns are anchored;
+# "case_sensitive" matches case sensitively, so that anchored prefixes are bounded by an index;
+# "collation" turns prefixes into ranges and relies on a case insensitive collation, which the
+# aggregation and the index must share (`DEFAULT_COLLATION` unless given)
+TEXT_MATCH_MODES = ("regex", "case_sensitive", "collation")
+DEFAULT_COLLATION = {"locale": "en", "strength": 2}
+# sorts after every other character in ICU collations, closes the range of a prefix
+COLLATION_MAX_CHAR = "\uffff"
+
+
+@dataclass
+class CompiledFilters:
+    """Request independent part of an AG Grid pipeline, compiled from the filter model"""
+
+    match: list[dict] = field(default_factory=list)
+    sort: dict = field(default_factory=dict)
+    projection: dict = field(default_factory=dict)
+
+
+@dataclass
+class CompiledGrouping:
+    """Row grouping and pivoting stages for the group level requested by `group_keys`"""
+
+    match: list[dict] = field(default_factory=list)
+    group: list[dict] = field(default_factory=list)
+    sort: dict = field(default_factory=dict)
+
+
+@dataclass
+class PipelineParts:
+    """Stages of a request pipeline: matching, grouping, sorting, then paging and projection"""
+
+    match: list[dict] = field(default_factory=list)
+    group: list[dict] = field(default_factory=list)
+    sort: list[dict] = field(default_factory=list)
+    page: list[dict] = field(default_factory=list)
+
+    @property
+    def stages(self) -> list[dict]:
+        return self.match + self.group + self.sort + self.page
+
+
+def _column_field(column: str | dict) -> str:
+    # AG Grid sends column definitions, `{"id": ..., "field": ..., "aggFunc": ...}`; plain names are accepted too
+    if isinstance(column, str):
+        return column
+    return column.get("field") or column["id"]
+
+
+def _nested(path: str, value) -> dict:
+    # expression objects cannot have dotted keys, so "a.b" becomes {"a": {"b": value}}
+    for key in reversed(path.split(".")):
+        value = {key: value}
+    return value
+
+
+def _is_inclusion(projection: dict) -> bool:
+    return any(
+        value not in (0, False) for key, value in projection.items() if key != "_id"
+    )
+
+
+def _merge_conditions(first: dict, second: dict) -> dict:
+    # distinct fields are merged in a single document, repeated ones ($or, a column) are kept apart in an $and
+    if not first.keys() & second.keys():
+        return first | second
+    if list(first) == ["$and"]:
+        return {"$and": first["$and"] + [second]}
+    return {"$and": [first, second]}
+
+
+def keyset_sort_digest(req_body: AGGridTableRequest) -> bytes:
+    """Digest of the request's sort model, binding a keyset cursor to the order it was issued for"""
+    sort_model = req_body.filters.sort_model if req_body.filters else []
+    return cache_key("keyset", sort_model)[:8]
+
+
+def encode_keyset_cursor(values: list, row: int, sort_digest: bytes = b"") -> str:
+    """
+    Opaque cursor for the block starting at `row`, holding the sort values of the row before it
+    :param values: sort values of the last row returned, `_id` last
+    :param row: the `start_row` of the next block
+    :param sort_digest: `keyset_sort_digest` of the request
+    """
+    return base64.urlsafe_b64encode(
+        bson.encode({"row": row, "values": values, "sort": sort_digest})
+    ).decode()
+
+
+def decode_keyset_cursor(
+    cursor: str | None, sort_digest: bytes | None = None, size: int | None = None
+) -> dict | None:
+    """
+    Cursors come from clients, they are checked before any of their values reaches a query
+    :param sort_digest: when given, the cursor must have been issued for this sort
+    :param size: when given, the number of sort values the cursor must hold
+    :return: `{"row": ..., "values": [...], "sort": ...}`, None when missing
+    :raises InvalidCursorError: malformed cursor, or issued for another sort
+    """
+    if not cursor:
+        return None
+    try:
+        token = bson.decode(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, bson.errors.InvalidBSON) as e:
+        raise InvalidCursorError("Malformed keyset cursor") from e
+    row, values = token.get("row"), token.get("values")
+    if (
+        not isinstance(row, int)
+        or isinstance(row, bool)
+        or row < 0
+        or not isinstance(values, list)
+        or not isinstance(token.get("sort"), bytes)
+    ):
+        raise InvalidCursorError("Malformed keyset cursor")
+    if size is not None and len(values) != size:
+        raise InvalidCursorError("Keyset cursor does not match the sort model")
+    if sort_digest is not None and token["sort"] != sort_digest:
+        raise InvalidCursorError("Keyset cursor was issued for another sort model")
+    return token
+
 
 class AGGridMongoQueryUtil:
-    def __init__(self) -> None:
-        self.forced_filters = {}
-        self.filter_query = []
-        self.sort_query = {}
-        self.value_col_filter = {}
-        self.aggregation_pipeline = []
-        self.skip = {}
-        self.limit = {}
+    """
+    Builds aggregation pipelines from AG Grid server side requests.
+    The builder holds no per request state: `build_query` is a pure function of the request, so a single
+    instance can be shared across requests and threads. With `cache_size`, the filter, sort and projection
+    stages are compiled once per distinct filter model and kept in an LRU cache; only the `$skip`/`$limit`
+    stages are bound per page. Hashing and copying a cached model costs about as much as compiling a small
+    one, so the cache only pays off for large filter models (20 columns and more, see the benchmarks).
+    With `optimize`, pipelines are rewritten to use indexes: every `$match` is merged into a single leading
+    stage and text filters match their values literally, in the index friendly forms of `text_match`.
+    A request's `global_filters` take the same form as its filter model and apply to every row; its quick
+    filter text searches the collection's text index, or `quick_filter_fields` without one.
+    """
+
+    def __init__(
+        self,
+        forced_filters: dict | None = None,
+        cache_size: int = 0,
+        optimize: bool = True,
+        text_match: str = "regex",
+        collation: dict | None = None,
+        quick_filter_fields: list[str] | None = None,
+    ) -> None:
+        """
+        :param forced_filters: stage prepended to every pipeline, usually a `$match`
+        :param cache_size: number of compiled filter models kept, 0 (the default) disables the cache
+        :param optimize: merge matches and rewrite text filters, False builds the pipelines as is
+        :param text_match: one of `TEXT_MATCH_MODES`
+        :param collation: collation of "collation" text matching, should be the collation of the indexes
+        :param quick_filter_fields: fields searched by the quick filter when there is no text index,
+                the request's value columns otherwise
+        """
+        if text_match not in TEXT_MATCH_MODES:
+            raise ValueError(f"Invalid text match mode: {text_match}")
+        self.forced_filters = forced_filters or {}
+        self.optimize = optimize
+        self.quick_filter_fields = quick_filter_fields
+        self.text_match = text_match
+        self._text_collation = collation or DEFAULT_COLLATION
+        self._compiled = QueryCache(max_size=cache_size) if cache_size else None
+
+    @property
+    def collation(self) -> dict | None:
+        """Collation the pipelines must run with, None unless text filters rely on one"""
+        if self.optimize and self.text_match == "collation":
+            return self._text_collation
+        return None
 
     def build_query(
-        self, req_body: AGGridTableRequest, *, additional_projection: dict | None = None
+        self,
+        req_body: AGGridTableRequest,
+        *,
+        additional_projection: dict | None = None,
+        keyset: bool = False,
+        text_search: bool = False,
+        quick_filter_fields: list[str] | None = None,
     ) -> list[dict]:
+        """
+        :param keyset: paginate on the sort values of the last row instead of `$skip`, see `keyset_stages`
+        :param text_search: the collection has a text index, see `quick_filter_stage`
+        :param quick_filter_fields: overrides the builder's `quick_filter_fields`
+        """
+        try:
+            parts = self.build_parts(
+                req_body,
+                additional_projection,
+                keyset,
+                text_search=text_search,
+                quick_filter_fields=quick_filter_fields,
+            )
+            return parts.stages
+        except InvalidCursorError:
+            raise
+        except Exception as e:
+            logging.exception(e)
+            raise QueryFormationError from e
+
+    def build_facet_query(
+        self,
+        req_body: AGGridTableRequest,
+        *,
+        additional_projection: dict | None = None,
+        with_count: bool = True,
+        keyset: bool = False,
+        text_search: bool = False,
+        quick_filter_fields: list[str] | None = None,
+    ) -> list[dict]:
+        """
+        Builds a pipeline returning a page of rows and the total row count in a single document,
+        `{"rows": [...], "total": [{"count": n}]}`. Matching and sorting run before the `$facet`, where
+        they can use indexes; only paging, projection and counting run inside it.
+        :param with_count: when False, the plain `build_query` pipeline is returned
+        :param keyset: see `build_query`, as are `text_search` and `quick_filter_fields`. A keyset continuation narrows the match to the rows after the
+                cursor, which cannot be counted alongside, so the plain pipeline is returned for it as well.
+        """
+        if not with_count or (keyset and self.keyset_continues(req_body)):
+            return self.build_query(
+                req_body,
+                additional_projection=additional_projection,
+                keyset=keyset,
+                text_search=text_search,
+                quick_filter_fields=quick_filter_fields,
+            )
         try:
-            start_row = req_body.start_row
-            end_row = req_body.end_row
+            parts = self.build_parts(
+                req_body,
+                additional_projection,
+                keyset,
+                text_search=text_search,
+                quick_filter_fields=quick_filter_fields,
+            )
+            facet = {"$facet": {"rows": parts.page, "total": [{"$count": "count"}]}}
+            return parts.match + parts.group + parts.sort + [facet]
+        except InvalidCursorError:
+            raise
+        except Exception as e:
+            logging.exception(e)
+            raise QueryFormationError from e
 
-            if start_row > 0:
-                self.skip = {"$skip": start_row}
+    def build_export_query(
+        self,
+        req_body: AGGridTableRequest,
+        *,
+        additional_projection: dict | None = None,
+        text_search: bool = False,
+        quick_filter_fields: list[str] | None = None,
+    ) -> list[dict]:
+        """Pipeline of every row matched by the request, sorted and projected as its pages but not paged"""
+        try:
+            parts = self.build_parts(
+                req_body,
+                additional_projection,
+                text_search=text_search,
+                quick_filter_fields=quick_filter_fields,
+            )
+            projections = [
+                stage
+                for stage in parts.page
+                if "$skip" not in stage and "$limit" not in stage
+            ]
+            return parts.match + parts.group + parts.sort + projections
+        except Exception as e:
+            logging.exception(e)
+            raise QueryFormationError from e
 
-            limit = end_row - start_row
-            self.limit = {"$limit": limit}
+    def build_count_query(
+        self,
+        req_body: AGGridTableRequest,
+        *,
+        text_search: bool = False,
+        quick_filter_fields: list[str] | None = None,
+    ) -> list[dict]:
+        """Pipeline counting every row matched by the request, as `{"count": n}`"""
+        try:
+            parts = self.build_parts(
+                req_body,
+                text_search=text_search,
+                quick_filter_fields=quick_filter_fields,
+            )
+            return parts.match + parts.group + [{"$count": "count"}]
+        except Exception as e:
+            logging.exception(e)
+            raise QueryFormationError from e
 
-            if filters := req_body.filters:
-                self.form_filter_query(
-                    sort_model=filters.sort_model,
-                    filter_model=filters.filter_model,
-                    value_cols=filters.value_cols,
+    def build_parts(
+        self,
+        req_body: AGGridTableRequest,
+        additional_projection: dict | None = None,
+        keyset: bool = False,
+        *,
+        text_search: bool = False,
+        quick_filter_fields: list[str] | None = None,
+    ) -> PipelineParts:
+        compiled = CompiledFilters()
+        grouping = None
+        if filters := req_body.filters:
+            compiled = self.compile_filters(
+                sort_model=filters.sort_model,
+                filter_model=filters.filter_model,
+                value_cols=filters.value_cols,
+            )
+            grouping = self.compile_grouping(filters)
+        parts = PipelineParts()
+        quick_filter = self.quick_filter_stage(
+            req_body, text_search, quick_filter_fields
+        )
+        if quick_filter:
+            # $text is only allowed in the first stage
+            parts.match.append(quick_filter)
+        if self.forced_filters:
+            parts.match.append(self.forced_filters)
+        if req_body.global_filters:
+            parts.match.extend(
+                self.compile_filters(
+                    sort_model=[], filter_model=req_body.global_filters, value_cols=[]
+                ).match
+            )
+        parts.match.extend(compiled.match)
+        if grouping:
+            parts.match.extend(grouping.match)
+        if grouping and grouping.group:
+            # group rows are already shaped, they are sorted and paged but not projected
+            parts.group = grouping.group
+            parts.sort = [grouping.sort]
+            parts.page = self.page_stages(req_body.start_row, req_body.end_row)
+        else:
+            if keyset:
+                range_match, parts.sort, parts.page = self.keyset_stages(
+                    req_body, compiled
                 )
+                if range_match:
+                    parts.match.append(range_match)
+            else:
+                if compiled.sort:
+                    parts.sort.append(compiled.sort)
+                elif text_search and quick_filter:
+                    parts.sort.append({"$sort": TEXT_SCORE_SORT})
+                parts.page = self.page_stages(req_body.start_row, req_body.end_row)
+            for projection in (
+                compiled.projection,
+                {MG_AGG_PROJECT: additional_projection}
+                if additional_projection
+                else {},
+            ):
+                if projection:
+                    if keyset and _is_inclusion(projection[MG_AGG_PROJECT]):
+                        projection[MG_AGG_PROJECT] = projection[MG_AGG_PROJECT] | {
+                            KEYSET_FIELD: 1
+                        }
+                    parts.page.append(projection)
+        if self.optimize:
+            parts.match = self.merge_matches(parts.match)
+        return parts
 
-            stages = (
-                self.forced_filters,
-                self.filter_query,
-                self.sort_query,
-                self.skip,
-                self.limit,
-                self.value_col_filter,
+    @staticmethod
+    def merge_matches(stages: list[dict]) -> list[dict]:
+        """
+        Merges consecutive `$match` stages into one, so the planner sees the whole predicate at once and
+        `$sort` directly follows it. Other stages, e.g. a `$lookup` in `forced_filters`, keep their position.
+        """
+        merged: list[dict] = []
+        for stage in stages:
+            if MG_AGG_MATCH in stage and merged and MG_AGG_MATCH in merged[-1]:
+                merged[-1] = {
+                    MG_AGG_MATCH: _merge_conditions(
+                        merged[-1][MG_AGG_MATCH], stage[MG_AGG_MATCH]
+                    )
+                }
+            else:
+                merged.append(stage)
+        return merged
+
+    @staticmethod
+    def leading_match_and_sort(pipeline: list[dict]) -> tuple[dict, dict | None]:
+        """
+        Query and sort the server can serve from an index: the leading `$match` and the `$sort` directly
+        following it, as found in optimized pipelines
+        """
+        match, sort = {}, None
+        stages = iter(pipeline)
+        stage = next(stages, {})
+        if MG_AGG_MATCH in stage:
+            match = stage[MG_AGG_MATCH]
+            stage = next(stages, {})
+        if "$sort" in stage:
+            sort = stage["$sort"]
+        return match, sort
+
+    @staticmethod
+    def is_pivot(filters: AGGridFilterModel | None) -> bool:
+        return bool(filters and filters.pivot_mode and filters.pivot_cols)
+
+    @staticmethod
+    def is_group_level(filters: AGGridFilterModel | None) -> bool:
+        """True when the request asks for group rows rather than leaf rows"""
+        if not filters:
+            return False
+        if AGGridMongoQueryUtil.is_pivot(filters) and not filters.row_group_cols:
+            return True
+        return len(filters.group_keys) < len(filters.row_group_cols)
+
+    def compile_grouping(self, filters: AGGridFilterModel) -> CompiledGrouping | None:
+        """
+        Memoized `form_group_query`
+        :return: None when the request does not group rows
+        """
+        if not filters.row_group_cols and not self.is_pivot(filters):
+            return None
+        if self._compiled is None:
+            return self.form_group_query(filters)
+        return self._compiled.cached(
+            cache_key(
+                "group",
+                filters.row_group_cols,
+                filters.group_keys,
+                filters.value_cols,
+                filters.pivot_cols,
+                self.is_pivot(filters),
+                filters.sort_model,
+            ),
+            lambda: self.form_group_query(filters),
+        )
+
+    def form_group_query(self, filters: AGGridFilterModel) -> CompiledGrouping:
+        """
+        Server side row grouping. `group_keys` select the group being expanded: the rows are matched on the
+        keys of the outer groups and grouped on the next `row_group_cols` column, aggregating `value_cols` by
+        their `aggFunc`. Each group row holds the group column, the aggregated values and `childCount`.
+        Once every group column has a key, the leaf rows of the group are returned.
+        In pivot mode the aggregated values are spread into one column per pivot value, named like AG Grid's
+        pivot result fields: `<pivot keys joined by _>_<value column field>`.
+        """
+        group_fields = self.group_fields(filters)
+        grouping = CompiledGrouping()
+        if filters.group_keys:
+            grouping.match.append(
+                {MG_AGG_MATCH: dict(zip(group_fields, filters.group_keys))}
             )
+        if not self.is_group_level(filters):
+            return grouping
+
+        level = len(filters.group_keys)
+        group_field = group_fields[level] if level < len(group_fields) else None
+        aggregates = self.value_aggregates(filters.value_cols)
+        if self.is_pivot(filters):
+            pivot_fields = [_column_field(column) for column in filters.pivot_cols]
+            grouping.group = self.pivot_stages(group_field, pivot_fields, aggregates)
+        else:
+            grouping.group = [
+                self.group_stage(
+                    f"${group_field}",
+                    {f"a{i}": agg for i, (_, agg) in enumerate(aggregates)}
+                    | {CHILD_COUNT_FIELD: {"$sum": 1}},
+                ),
+                self.projection_stage(
+                    {"_id": 0, group_field: "$_id"}
+                    | {name: f"$a{i}" for i, (name, _) in enumerate(aggregates)}
+                    | {CHILD_COUNT_FIELD: 1}
+                ),
+            ]
 
-            for stage in stages:
-                if stage:
-                    if isinstance(stage, list):
-                        self.aggregation_pipeline.extend(stage)
-                    else:
-                        self.aggregation_pipeline.append(stage)
+        sort = {}
+        for sort_obj in filters.sort_model:
+            column = sort_obj["colId"]
+            if column == AUTO_GROUP_COLUMN:
+                column = group_field
+            if column:
+                sort[column] = 1 if sort_obj["sort"] == "asc" else -1
+        if not sort and group_field:
+            sort = {group_field: 1}
+        grouping.sort = {"$sort": sort} if sort else {}
+        return grouping
 
-            if additional_projection:
-                self.aggregation_pipeline.append(
-                    {MG_AGG_PROJECT: additional_projection}
+    def pivot_result_fields(
+        self, filters: AGGridFilterModel, rows: list[dict]
+    ) -> list[str]:
+        """
+        Pivot result columns of the group rows returned by the `pivot_stages` reshape: every key of a row but
+        `childCount` and the top-level key holding the group column, which is nested for a dotted field
+        """
+        if not self.is_pivot(filters) or not self.is_group_level(filters):
+            return []
+        group_fields = self.group_fields(filters)
+        level = len(filters.group_keys)
+        group_row = {CHILD_COUNT_FIELD}
+        if level < len(group_fields):
+            group_row.add(group_fields[level].split(".")[0])
+        return list(
+            dict.fromkeys(key for row in rows for key in row if key not in group_row)
+        )
+
+    @staticmethod
+    def group_fields(filters: AGGridFilterModel) -> list[str]:
+        return [_column_field(column) for column in filters.row_group_cols]
+
+    @staticmethod
+    def value_aggregates(value_cols: list) -> list[tuple[str, dict]]:
+        """
+        :return: (field, accumulator) for every value column that has an `aggFunc`
+        """
+        aggregates = []
+        for column in value_cols:
+            if isinstance(column, str) or not column.get("aggFunc"):
+                continue
+            name = _column_field(column)
+            agg_func = column["aggFunc"]
+            if agg_func == "count":
+                aggregates.append((name, {"$sum": 1}))
+            elif agg_func in AGG_FUNCTIONS:
+                aggregates.append((name, {AGG_FUNCTIONS[agg_func]: f"${name}"}))
+            else:
+                raise NotImplementedError(
+                    f"given aggregation is not supported: {agg_func}"
                 )
-            return self.aggregation_pipeline
-        except Exception as e:
-            logging.exception(e)
-            raise QueryFormationError from e
+        return aggregates
+
+    def pivot_stages(
+        self,
+        group_field: str | None,
+        pivot_fields: list[str],
+        aggregates: list[tuple[str, dict]],
+    ) -> list[dict]:
+        # 1. aggregate per (group, pivot values), 2. push the pivot cells into their group,
+        # 3. reshape the cells into one `<pivot keys>_<value field>` column each
+        pivot_keys = [f"p{i}" for i in range(len(pivot_fields))]
+        cells = {f"a{i}": agg for i, (_, agg) in enumerate(aggregates)}
+        first = self.group_stage(
+            {"g": f"${group_field}" if group_field else None}
+            | {key: f"${name}" for key, name in zip(pivot_keys, pivot_fields)},
+            cells | {"n": {"$sum": 1}},
+        )
+        second = self.group_stage(
+            "$_id.g",
+            {
+                "pivot": {
+                    "$push": {key: f"$_id.{key}" for key in pivot_keys}
+                    | {cell: f"${cell}" for cell in cells}
+                },
+                CHILD_COUNT_FIELD: {"$sum": "$n"},
+            },
+        )
+        columns = []
+        for i, (name, _) in enumerate(aggregates):
+            key_parts = []
+            for key in pivot_keys:
+                key_parts += [{"$ifNull": [{"$toString": f"$$p.{key}"}, ""]}, "_"]
+            columns.append(
+                {
+                    "$map": {
+                        "input": "$pivot",
+                        "as": "p",
+                        "in": {
+                            "k": {"$concat": key_parts + [name]},
+                            "v": f"$$p.a{i}",
+                        },
+                    }
+                }
+            )
+        group_row = {CHILD_COUNT_FIELD: f"${CHILD_COUNT_FIELD}"}
+        if group_field:
+            group_row |= _nested(group_field, "$_id")
+        reshape = {
+            "$replaceRoot": {
+                "newRoot": {
+                    "$mergeObjects": [
+                        group_row,
+                        {"$arrayToObject": {"$concatArrays": columns}},
+                    ]
+                }
+            }
+        }
+        return [first, second, reshape]
+
+    @staticmethod
+    def group_stage(group_id, accumulators: dict) -> dict:
+        return {"$group": {"_id": group_id} | accumulators}
+
+    @staticmethod
+    def projection_stage(projection: dict) -> dict:
+        return {MG_AGG_PROJECT: projection}
+
+    def has_filters(self, req_body: AGGridTableRequest) -> bool:
+        """True when the request, or the builder's forced filters, restrict the matched documents"""
+        return bool(
+            self.forced_filters
+            or req_body.global_filters
+            or self.quick_filter_text(req_body)
+            or (req_body.filters and req_body.filters.filter_model)
+        )
+
+    def counts_collection(self, req_body: AGGridTableRequest) -> bool:
+        """
+        True when the request's rows are all the documents of the collection, so that their count can be
+        estimated. Filtered requests, expanded groups and group rows need an exact count of their pipeline.
+        """
+        filters = req_body.filters
+        return not (
+            self.has_filters(req_body)
+            or (filters and filters.group_keys)
+            or self.is_group_level(filters)
+        )
+
+    @staticmethod
+    def quick_filter_text(req_body: AGGridTableRequest) -> str:
+        """The request's quick filter text, older clients send a boolean which carries none"""
+        quick_filter = req_body.filters.quick_filter if req_body.filters else None
+        return quick_filter.strip() if isinstance(quick_filter, str) else ""
+
+    def quick_filter_stage(
+        self,
+        req_body: AGGridTableRequest,
+        text_search: bool = False,
+        quick_filter_fields: list[str] | None = None,
+    ) -> dict:
+        """
+        With a text index, the quick filter is a `$text` search and rows without a sort model are sorted by
+        relevance. Without one, every word of the text must be found, case insensitively, in one of the
+        quick filter fields, as AG Grid's own quick filter does.
+        :return: the `$match` stage, empty without quick filter text
+        """
+        text = self.quick_filter_text(req_body)
+        if not text:
+            return {}
+        if text_search:
+            return {MG_AGG_MATCH: {"$text": {"$search": text}}}
+        fields = quick_filter_fields or self.quick_filter_fields
+        if not fields and req_body.filters:
+            fields = [_column_field(col) for col in req_body.filters.value_cols]
+        if not fields:
+            raise ValueError("Quick filter needs a text index or quick filter fields")
+        words = [
+            {
+                "$or": [
+                    {field: {MG_AGG_REGEX: re.escape(word), MG_AGG_OPTIONS: "i"}}
+                    for field in fields
+                ]
+            }
+            for word in text.split()
+        ]
+        return {MG_AGG_MATCH: words[0] if len(words) == 1 else {"$and": words}}
+
+    @staticmethod
+    def keyset_sort(compiled: CompiledFilters) -> dict:
+        """The request's sort with `_id` appended as tiebreaker, so that the order is total"""
+        sort = dict(compiled.sort.get("$sort", {}))
+        sort.setdefault("_id", 1)
+        return sort
+
+    def keyset_continues(self, req_body: AGGridTableRequest) -> bool:
+        """
+        True when the request carries a cursor issued for the block that starts at its `start_row`
+        :raises InvalidCursorError: see `decode_keyset_cursor`
+        """
+        token = decode_keyset_cursor(req_body.cursor, keyset_sort_digest(req_body))
+        return token is not None and token["row"] == req_body.start_row
+
+    def keyset_stages(
+        self, req_body: AGGridTableRequest, compiled: CompiledFilters
+    ) -> tuple[dict, list[dict], list[dict]]:
+        """
+        Keyset (seek) pagination: when the request's cursor continues from the previous block, the rows
+        after the cursor are selected with a range `$match` on the sort values instead of skipping
+        `start_row` documents. Random jumps, without a matching cursor, fall back to `$skip`.
+        Every row gets its sort values in `__keyset` (as `{"k0": ..., "k1": ...}`), from which the next
+        cursor is made.
+        Sort fields should not be null or missing, as those values do not compare in a range match.
+        :return: range match (empty when falling back to `$skip`), sort stage and page stages
+        :raises InvalidCursorError: see `decode_keyset_cursor`
+        """
+        sort = self.keyset_sort(compiled)
+        token = decode_keyset_cursor(
+            req_body.cursor, keyset_sort_digest(req_body), size=len(sort)
+        )
+        range_match = {}
+        if token is not None and token["row"] == req_body.start_row:
+            branches = []
+            for i, (column, order) in enumerate(sort.items()):
+                # $eq: a document value from the cursor must not be read as query operators
+                branch = {
+                    previous: {"$eq": value}
+                    for previous, value in zip(list(sort)[:i], token["values"])
+                }
+                branch[column] = {"$gt" if order == 1 else "$lt": token["values"][i]}
+                branches.append(branch)
+            range_match = {MG_AGG_MATCH: {"$or": branches}}
+            page = [{"$limit": req_body.end_row - req_body.start_row}]
+        else:
+            page = self.page_stages(req_body.start_row, req_body.end_row)
+        page.append(
+            {
+                "$addFields": {
+                    KEYSET_FIELD: {
+                        f"k{i}": {"$ifNull": [f"${column}", None]}
+                        for i, column in enumerate(sort)
+                    }
+                }
+            }
+        )
+        return range_match, [{"$sort": sort}], page
+
+    @staticmethod
+    def page_stages(start_row: int, end_row: int) -> list[dict]:
+        stages = []
+        if start_row > 0:
+            stages.append({"$skip": start_row})
+        stages.append({"$limit": end_row - start_row})
+        return stages
+
+    def compile_filters(
+        self, sort_model: list, filter_model: dict, value_cols: list
+    ) -> CompiledFilters:
+        """
+        Memoized `form_filter_query`, keyed on the normalized filter model
+        :return: a copy of the compiled stages, callers may mutate it
+        """
+        if self._compiled is None:
+            return self.form_filter_query(sort_model, filter_model, value_cols)
+        return self._compiled.cached(
+            cache_key("compile", filter_model, sort_model, value_cols),
+            lambda: self.form_filter_query(sort_model, filter_model, value_cols),
+        )
 
     def form_filter_query(
         self, sort_model: list, filter_model: dict, value_cols: list
-    ) -> None:
+    ) -> CompiledFilters:
+        compiled = CompiledFilters()
         is_filtering = len(filter_model) > 0
         if is_filtering:
             for column, filter_obj in filter_model.items():
                 query = self.build_column_query(filter_obj, column)
-                self.filter_query.append(query)
+                compiled.match.append(query)
 
         is_sorting = len(sort_model) > 0
 
         if is_sorting:
-            self.form_sort_query(sort_model=sort_model)
+            compiled.sort = self.form_sort_query(sort_model=sort_model)
 
         if value_cols:
-            self.value_col_filter = {
-                MG_AGG_PROJECT: {"_id": 0} | {col: 1 for col in value_cols}
+            compiled.projection = {
+                MG_AGG_PROJECT: {"_id": 0}
+                | {_column_field(col): 1 for col in value_cols}
             }
+        return compiled
 
-    def form_sort_query(self, sort_model: list) -> None:
+    @staticmethod
+    def form_sort_query(sort_model: list) -> dict:
         _sort = {}
         for sort_obj in sort_model:
             order = 1 if sort_obj["sort"] == "asc" else -1
             _sort[sort_obj["colId"]] = order
-        self.sort_query = {"$sort": _sort}
+        return {"$sort": _sort}
 
     @staticmethod
-    def build_text_query(filter_obj, column) -> dict:
+    def build_text_query(filter_obj, column, text_match: str | None = None) -> dict:
+        """
+        :param text_match: one of `TEXT_MATCH_MODES`, the value is then matched literally.
+                When None, the value is used as a case insensitive pattern.
+        """
+        value = filter_obj.get("filter")
+        if text_match is not None and isinstance(value, str):
+            pattern = re.escape(value)
+        else:
+            pattern = value
+        options = {} if text_match == "case_sensitive" else {MG_AGG_OPTIONS: "i"}
+
+        def regex(expression: str) -> dict:
+            return {MG_AGG_REGEX: expression} | options
+
+        def starts_with() -> dict:
+            if text_match == "collation":
+                return {column: {"$gte": value, "$lte": value + COLLATION_MAX_CHAR}}
+            return {column: regex("^" + pattern)}
+
+        query_map = {
+            "contains": lambda: {column: regex(pattern)},
+            "equals": lambda: {column: value},
+            "notEqual": lambda: {column: {"$ne": value}},
+            "notContains": lambda: {column: {"$not": regex(pattern)}},
+            "startsWith": starts_with,
+            "endsWith": lambda: {column: regex(pattern + "$")},
+            "blank": lambda: {column: {"$in": [None, ""]}},
+            "notBlank": lambda: {column: {"$nin": [None, ""]}},
+            "false": lambda: {column: False},
+            "true": lambda: {column: True},
+        }
         try:
-            query_map = {
-                "contains": {
-                    column: {MG_AGG_REGEX: filter_obj["filter"], MG_AGG_OPTIONS: "i"}
-                },
-                "equals": {column: filter_obj["filter"]},
-                "notEqual": {column: {"$ne": filter_obj["filter"]}},
-                "notContains": {
-                    column: {
-                        "$not": {
-                            MG_AGG_REGEX: filter_obj["filter"],
-                            MG_AGG_OPTIONS: "i",
-                        }
-                    }
-                },
-                "startsWith": {
-                    column: {
-                        MG_AGG_REGEX: "^" + filter_obj["filter"],
-                        MG_AGG_OPTIONS: "i",
-                    }
-                },
-                "endsWith": {
-                    column: {
-                        MG_AGG_REGEX: filter_obj["filter"] + "$",
-                        MG_AGG_OPTIONS: "i",
-                    }
-                },
-                "blank": {
-                    "$or": [
-                        {column: {MG_AGG_EMPTY: True, "$eq": ""}},
-                        {column: {MG_AGG_EMPTY: False}},
-                    ]
-                },
-                "notBlank": {column: {"$exists": True, "$ne": ""}},
-                "false": {column: False},
-                "true": {column: True},
-            }
-            return query_map[filter_obj["type"]]
+            return query_map[filter_obj["type"]]()
         except KeyError as e:
             raise NotImplementedError(
                 f"given text search is not supported: {filter_obj['type']}"
@@ -138,33 +830,22 @@ class AGGridMongoQueryUtil:
 
     @staticmethod
     def build_number_query(filter_obj, column) -> dict:
+        value = filter_obj.get("filter")
+        query_map = {
+            "equals": lambda: {column: value},
+            "notEqual": lambda: {column: {"$ne": value}},
+            "lessThan": lambda: {column: {"$lt": value}},
+            "lessThanOrEqual": lambda: {column: {"$lte": value}},
+            "greaterThan": lambda: {column: {"$gt": value}},
+            "greaterThanOrEqual": lambda: {column: {"$gte": value}},
+            "inRange": lambda: {column: {"$gt": value, "$lt": filter_obj["filterTo"]}},
+            "blank": lambda: {column: {"$in": [None, ""]}},
+            "notBlank": lambda: {column: {"$nin": [None, ""]}},
+            "false": lambda: {column: False},
+            "true": lambda: {column: True},
+        }
         try:
-            query_map = {
-                "equals": {column: filter_obj["filter"]},
-                "notEqual": {column: {"$ne": filter_obj["filter"]}},
-                "lessThan": {column: {"$lt": filter_obj["filter"]}},
-                "lessThanOrEqual": {column: {"$lte": filter_obj["filter"]}},
-                "greaterThan": {column: {"$gt": filter_obj["filter"]}},
-                "greaterThanOrEqual": {column: {"$gte": filter_obj["filter"]}},
-                "inRange": {
-                    column: {
-                        "$and": [
-                            {"$lt": filter_obj["filterTo"]},
-                            {"$gt": filter_obj["filter"]},
-                        ]
-                    }
-                },
-                "blank": {
-                    "$or": [
-                        {column: {MG_AGG_EMPTY: True, "$eq": ""}},
-                        {column: {MG_AGG_EMPTY: False}},
-                    ]
-                },
-                "notBlank": {column: {"$exists": True, "$ne": ""}},
-                "false": {column: False},
-                "true": {column: True},
-            }
-            return query_map[filter_obj["type"]]
+            return query_map[filter_obj["type"]]()
         except KeyError as e:
             raise NotImplementedError(
                 f"given text search is not supported: {filter_obj['type']}"
@@ -180,6 +861,8 @@ class AGGridMongoQueryUtil:
             "date": self.build_date_query,
         }
         filter_type = filter_obj.get("filterType", "undef")
+        if filter_type == "text" and self.optimize:
+            return self.build_text_query(filter_obj, column, self.text_match)
         if func := func_map.get(filter_type):
             return func(filter_obj, column)
         else:
@@ -187,7 +870,7 @@ class AGGridMongoQueryUtil:
 
     def build_column_query(self, filter_obj, column) -> dict:
         if "operator" in filter_obj:
-            query = {MG_AGG_MATCH: self.handle_operator_filter(filter_obj, column)}
+            query = self.handle_operator_filter(filter_obj, column)
         elif "filterType" in filter_obj:
             if filter_obj["filterType"] == "set":
                 query = self.handle_set_filter(filter_obj, column)
@@ -197,16 +880,24 @@ class AGGridMongoQueryUtil:
             raise ValueError("Invalid filter type: " + filter_obj["filterType"])
         return {MG_AGG_MATCH: query}
 
-    @staticmethod
-    def handle_operator_filter(filter_obj, column) -> dict:
+    def handle_operator_filter(self, filter_obj, column) -> dict:
         operator = filter_obj["operator"]
-        condition1 = filter_obj["condition1"]
-        condition2 = filter_obj["condition2"]
+        # recent AG Grid versions send a `conditions` list, older ones `condition1` and `condition2`
+        conditions = filter_obj.get("conditions") or [
+            filter_obj["condition1"],
+            filter_obj["condition2"],
+        ]
+        queries = [
+            self.simple_search_query(
+                {"filterType": filter_obj.get("filterType")} | condition, column
+            )
+            for condition in conditions
+        ]
 
         if operator == "AND":
-            return {"$and": [{column: condition1}, {column: condition2}]}
+            return {"$and": queries}
         elif operator == "OR":
-            return {"$or": [{column: condition1}, {column: condition2}]}
+            return {"$or": queries}
         else:
             raise ValueError(f"Invalid operator: {operator}")
 
@@ -233,4 +924,48 @@ class AGGridMongoQueryUtil:
         }
          */
         """
-        return {MG_AGG_MATCH: {column: {"$in": filter_obj["values"]}}}
+        return {column: {"$in": filter_obj["values"]}}
+
+    def build_set_values_query(
+        self, filter_model: dict, columns: list[str], limit: int | None = None
+    ) -> list[dict]:
+        """
+        Pipeline computing the set filter values of many columns at once, under the active filter model.
+        Each column's values ignore the column's own filter, as AG Grid expects. Filters of the other
+        columns are matched once before the `$facet`, where they can use indexes.
+        The result is a single document with one `[{"_id": value, "count": n}, ...]` list per column,
+        under the keys `c0`, `c1`, ... in the order of `columns`.
+        :param filter_model: the grid's filter model
+        :param columns: columns whose values are requested
+        :param limit: maximum number of values per column, the first in sort order
+        """
+        try:
+            common = [self.forced_filters] if self.forced_filters else []
+            own = {}
+            for column, filter_obj in filter_model.items():
+                match = self.compile_filters(
+                    sort_model=[], filter_model={column: filter_obj}, value_cols=[]
+                ).match
+                if column in columns:
+                    own[column] = match
+                else:
+                    common.extend(match)
+            facet = {}
+            for i, column in enumerate(columns):
+                branch = [
+                    stage
+                    for other, match in own.items()
+                    if other != column
+                    for stage in match
+                ]
+                branch.append(self.group_stage(f"${column}", {"count": {"$sum": 1}}))
+                branch.append({"$sort": {"_id": 1}})
+                if limit:
+                    branch.append({"$limit": limit})
+                facet[f"c{i}"] = self.merge_matches(branch) if self.optimize else branch
+            if self.optimize:
+                common = self.merge_matches(common)
+            return common + [{"$facet": facet}]
+        except Exception as e:
+            logging.exception(e)
+            raise QueryFormationError from e
@@ -0,0 +1,215 @@
+"""Read-through query cache
+Caches are opted into per collection class and stored per class and namespace (database, collection).
+A write through any cached class invalidates every cache registered for the same namespace.
+"""
+
+import copy
+import dataclasses
+import datetime
+import functools
+import hashlib
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable
+
+try:
+    import bson
+    from bson import Decimal128, Int64, ObjectId
+except ImportError:  # pragma: no cover
+    sys.stderr.write("PyMongo not installed, run pip install pymongo")
+    raise
+
+_MISSING = object()
+# immutable values, shared between copies
+_ATOMIC = frozenset(
+    {
+        str,
+        int,
+        float,
+        bool,
+        bytes,
+        type(None),
+        datetime.datetime,
+        datetime.date,
+        uuid.UUID,
+        ObjectId,
+        Decimal128,
+        Int64,
+    }
+)
+
+
+def _copy(value: Any) -> Any:
+    # deep copy specialized for documents, several times faster than copy.deepcopy on them
+    kind = type(value)
+    if kind in _ATOMIC:
+        return value
+    if kind is dict:
+        return {key: _copy(item) for key, item in value.items()}
+    if kind is list:
+        return [_copy(item) for item in value]
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.replace(
+            value,
+            **{
+                field.name: _copy(getattr(value, field.name))
+                for field in dataclasses.fields(value)
+                if field.init
+            },
+        )
+    return copy.deepcopy(value)
+
+
+def _canonical(value: Any) -> Any:
+    # top level keys of a filter or a projection are order independent, nested documents are not
+    if isinstance(value, dict):
+        return dict(sorted(value.items()))
+    return value
+
+
+def cache_key(*parts: Any) -> bytes:
+    """
+    Canonical hash of a query, used as cache key
+    :param parts: method name, query, projection, ... Anything BSON encodable
+    :return: 16 bytes digest
+    """
+    encoded = bson.encode({"k": [_canonical(part) for part in parts]})
+    return hashlib.blake2b(encoded, digest_size=16).digest()
+
+
+class QueryCache:
+    """LRU cache with an optional TTL, safe to share between threads"""
+
+    def __init__(self, max_size: int, ttl: float | None = None) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.generation = 0
+        self._entries: OrderedDict[bytes, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: bytes) -> Any:
+        """
+        :return: a copy of the cached value, or the `_MISSING` sentinel when absent or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None:
+                if time.monotonic() - entry[0] > self.ttl:
+                    del self._entries[key]
+                    self.expirations += 1
+                    entry = None
+            if entry is None:
+                self.misses += 1
+                return _MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return _copy(entry[1])
+
+    def set(self, key: bytes, value: Any, generation: int) -> None:
+        """
+        Stores a copy of `value`, unless the cache was invalidated since `generation` was read,
+        in which case the value may already be stale.
+        """
+        value = _copy(value)
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+        }
+
+    def cached(self, key: bytes, fetch: Callable[[], Any]) -> Any:
+        """Returns the cached value for `key`, calling `fetch` and storing its result on a miss"""
+        value = self.get(key)
+        if value is _MISSING:
+            generation = self.generation
+            value = fetch()
+            self.set(key, value, generation)
+        return value
+
+
+_registry: dict[tuple[str, str], dict[type, QueryCache]] = {}
+_registry_lock = threading.Lock()
+
+
+def get_cache(
+    owner: type, namespace: tuple[str, str], max_size: int, ttl: float | None
+) -> QueryCache:
+    with _registry_lock:
+        caches = _registry.setdefault(namespace, {})
+        if (cache := caches.get(owner)) is None:
+            cache = caches[owner] = QueryCache(max_size=max_size, ttl=ttl)
+        return cache
+
+
+_count_caches: dict[tuple[type, tuple[str, str]], QueryCache] = {}
+
+
+def get_count_cache(
+    owner: type, namespace: tuple[str, str], max_size: int, ttl: float
+) -> QueryCache:
+    """
+    Cache of the counts of `find_count(mode="cached")`. Unlike the read-through caches it is not invalidated
+    by writes, its entries are only refreshed once expired.
+    """
+    with _registry_lock:
+        if (cache := _count_caches.get((owner, namespace))) is None:
+            cache = _count_caches[(owner, namespace)] = QueryCache(
+                max_size=max_size, ttl=ttl
+            )
+        return cache
+
+
+def invalidate_namespace(namespace: tuple[str, str]) -> None:
+    with _registry_lock:
+        caches = list(_registry.get(namespace, {}).values())
+    for cache in caches:
+        cache.invalidate()
+
+
+def invalidates_cache(method: Callable) -> Callable:
+    """Marks a write method of a collection class, its namespace caches are invalidated once it returns or fails"""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.invalidate_cache()
+
+    return wrapper
+
+
+__all__ = [
+    "QueryCache",
+    "cache_key",
+    "get_cache",
+    "get_count_cache",
+    "invalidate_namespace",
+    "invalidates_cache",
+]
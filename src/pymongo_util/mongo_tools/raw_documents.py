@@ -0,0 +1,136 @@
+"""Raw BSON helpers
+Pass-through reads return `RawBSONDocument`s or raw batches of BSON bytes, which are forwarded without being
+decoded and encoded again. When a few fields are needed from them, `extract_fields` walks the document bytes
+and decodes only those fields.
+"""
+
+import struct
+import sys
+from typing import Iterable, Iterator
+
+try:
+    import bson
+    from bson import json_util
+    from bson.codec_options import CodecOptions
+    from bson.raw_bson import RawBSONDocument
+except ImportError:  # pragma: no cover
+    sys.stderr.write("PyMongo not installed, run pip install pymongo")
+    raise
+
+RAW_CODEC_OPTIONS = CodecOptions(document_class=RawBSONDocument)
+
+_INT32 = struct.Struct("<i")
+# size of the values of fixed size BSON types, by type byte
+_FIXED_SIZES = {
+    0x01: 8,  # double
+    0x06: 0,  # undefined
+    0x07: 12,  # ObjectId
+    0x08: 1,  # boolean
+    0x09: 8,  # UTC datetime
+    0x0A: 0,  # null
+    0x10: 4,  # int32
+    0x11: 8,  # timestamp
+    0x12: 8,  # int64
+    0x13: 16,  # decimal128
+    0x7F: 0,  # max key
+    0xFF: 0,  # min key
+}
+_STRING_TYPES = (0x02, 0x0D, 0x0E)  # string, code, symbol
+_DOCUMENT_TYPES = (0x03, 0x04, 0x0F)  # document, array, code with scope
+
+
+def _value_size(data: bytes, kind: int, offset: int) -> int:
+    if (size := _FIXED_SIZES.get(kind)) is not None:
+        return size
+    if kind in _STRING_TYPES:
+        return 4 + _INT32.unpack_from(data, offset)[0]
+    if kind in _DOCUMENT_TYPES:
+        return _INT32.unpack_from(data, offset)[0]
+    if kind == 0x05:  # binary: length, subtype, bytes
+        return 5 + _INT32.unpack_from(data, offset)[0]
+    if kind == 0x0B:  # regex: pattern and options cstrings
+        end = data.index(b"\x00", data.index(b"\x00", offset) + 1)
+        return end + 1 - offset
+    if kind == 0x0C:  # DBPointer: string and ObjectId
+        return 4 + _INT32.unpack_from(data, offset)[0] + 12
+    raise bson.errors.InvalidBSON(f"Unknown BSON type {kind:#x}")
+
+
+def iter_elements(document: bytes) -> Iterator[tuple[str, int, bytes]]:
+    """
+    Walks the top level elements of a BSON document without decoding their values
+    :return: name, type byte and encoded value of each element
+    """
+    offset, end = 4, len(document) - 1
+    while offset < end:
+        kind = document[offset]
+        name_end = document.index(b"\x00", offset + 1)
+        name = document[offset + 1 : name_end].decode()
+        start = name_end + 1
+        offset = start + _value_size(document, kind, start)
+        yield name, kind, document[start:offset]
+
+
+def decode_value(kind: int, value: bytes):
+    """Decodes a single encoded value of the given type"""
+    element = bytes([kind]) + b"v\x00" + value
+    return bson.decode(_INT32.pack(len(element) + 5) + element + b"\x00")["v"]
+
+
+def extract_fields(document: bytes | RawBSONDocument, fields: Iterable[str]) -> dict:
+    """
+    Decodes only the given fields of an encoded document, other fields are skipped over
+    :param document: BSON bytes or a RawBSONDocument
+    :param fields: field names, dotted names reach into embedded documents
+    :return: the fields found, nested as in the document
+    """
+    if isinstance(document, RawBSONDocument):
+        document = document.raw
+    paths: dict[str, list[str]] = {}
+    for field in fields:
+        head, _, rest = field.partition(".")
+        paths.setdefault(head, []).append(rest)
+    result = {}
+    for name, kind, value in iter_elements(document):
+        if (subfields := paths.get(name)) is None:
+            continue
+        if "" in subfields:
+            result[name] = decode_value(kind, value)
+        elif kind == 0x03 and (found := extract_fields(value, subfields)):
+            result[name] = found
+    return result
+
+
+def iter_raw_documents(batches: Iterable[bytes]) -> Iterator[bytes]:
+    """Splits raw batches, as returned by `find_raw_batches`/`aggregate_raw_batches`, into documents"""
+    for batch in batches:
+        offset = 0
+        while offset < len(batch):
+            size = _INT32.unpack_from(batch, offset)[0]
+            yield batch[offset : offset + size]
+            offset += size
+
+
+def raw_batches_to_json(
+    batches: Iterable[bytes], fields: Iterable[str] | None = None
+) -> Iterator[str]:
+    """
+    Converts raw batches to extended JSON, one string per document
+    :param batches: raw batches of BSON documents
+    :param fields: when given, only these fields are decoded and converted
+    """
+    fields = list(fields) if fields is not None else None
+    for document in iter_raw_documents(batches):
+        if fields is None:
+            yield json_util.dumps(bson.decode(document))
+        else:
+            yield json_util.dumps(extract_fields(document, fields))
+
+
+__all__ = [
+    "RAW_CODEC_OPTIONS",
+    "extract_fields",
+    "iter_elements",
+    "iter_raw_documents",
+    "raw_batches_to_json",
+]
@@ -0,0 +1,50 @@
+"""Soft delete helpers
+Soft deleted documents are archived into the `deleted__<database>` database under the same collection name,
+with a `deleted.on` timestamp. The archive is keyed by `_id`, so deleting a restored document again replaces
+its previous archived copy, as the former `$merge` based archiving did.
+"""
+
+import sys
+from datetime import datetime, timezone
+
+try:
+    from pymongo import ReplaceOne
+except ImportError:  # pragma: no cover
+    sys.stderr.write("PyMongo not installed, run pip install pymongo")
+    raise
+
+SOFT_DELETE_BATCH_SIZE = 1000
+
+
+def archive_database(database: str) -> str:
+    return f"deleted__{database}"
+
+
+def archive_operations(documents: list[dict]) -> list[ReplaceOne]:
+    """
+    Builds the upserts that archive the given documents in a single unordered `bulk_write`
+    :param documents: full documents, as returned before or by the delete
+    :return: list of ReplaceOne operations keyed by `_id`
+    """
+    deleted_on = datetime.now(timezone.utc)
+    return [
+        ReplaceOne(
+            {"_id": document["_id"]},
+            document | {"deleted": {"on": deleted_on}},
+            upsert=True,
+        )
+        for document in documents
+    ]
+
+
+def batch_query(query: dict, ids: list) -> dict:
+    """Restricts `query` to a batch of archived `_id`s, so documents that stopped matching are not deleted"""
+    return {"$and": [query, {"_id": {"$in": ids}}]}
+
+
+__all__ = [
+    "SOFT_DELETE_BATCH_SIZE",
+    "archive_database",
+    "archive_operations",
+    "batch_query",
+]
@@ -5,6 +5,12 @@ from pydantic_settings import BaseSettings
 class _MongoConfig(BaseSettings):
     MONGO_URI: str | None = Field(default=None)
     META_SOFT_DEL: bool = Field(default=True)
+    MONGO_INSTRUMENTATION: bool = Field(default=False)
+    MONGO_SLOW_MS: float | None = Field(default=100)
+    MONGO_MAX_POOL_SIZE: int = Field(default=100)
+    MONGO_MIN_POOL_SIZE: int = Field(default=0)
+    MONGO_MAX_IDLE_TIME_MS: int | None = Field(default=None)
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: int | None = Field(default=None)
 
 
 MongoConfig = _MongoConfig()
@@ -12,3 +12,16 @@ def mongo_client():
     return BaseClass(
         mongo_client=client(), database="mock_data", collection="mock_coll"
     )
+
+
+@pytest.fixture
+def make_collection():
+    client = MongoConnect(client=mongomock.MongoClient())
+    BaseClass = client.get_base_class()  # noqa NOSONAR
+
+    def _make(collection: str, **kwargs):
+        return BaseClass(
+            mongo_client=client(), database="mock_data", collection=collection, **kwargs
+        )
+
+    return _make
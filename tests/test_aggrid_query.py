@@ -0,0 +1,333 @@
+import base64
+
+import bson
+import mongomock
+import pytest
+from bson.raw_bson import RawBSONDocument
+
+from pymongo_util.exceptions import InvalidCursorError
+from pymongo_util.mongo_tools.base_models import AGGridTableRequest
+from pymongo_util.mongo_tools.mongo_sync import MongoCollectionBaseClass
+from pymongo_util.mongo_tools.query_buidler import (
+    AGGridMongoQueryUtil,
+    encode_keyset_cursor,
+    keyset_sort_digest,
+)
+from pymongo_util.mongo_tools.raw_documents import RAW_CODEC_OPTIONS
+
+
+@pytest.fixture
+def people(make_collection):
+    coll = make_collection("aggrid_coll", soft_delete=False)
+    coll.insert_many(
+        [{"id": i, "gender": "Female" if i % 3 else "Male"} for i in range(30)]
+    )
+    return coll
+
+
+def make_request(start_row, end_row, filter_model=None) -> AGGridTableRequest:
+    return AGGridTableRequest.model_validate(
+        {
+            "startRow": start_row,
+            "endRow": end_row,
+            "filters": {
+                "filterModel": filter_model or {},
+                "sortModel": [{"colId": "id", "sort": "asc"}],
+            },
+        }
+    )
+
+
+FEMALE = {"gender": {"filterType": "text", "type": "equals", "filter": "Female"}}
+
+
+def test_rows_and_total_in_one_aggregation(people):
+    response = people.aggrid_query(
+        make_request(5, 10, FEMALE), additional_projection={"_id": 0}
+    )
+    assert response.last_row == 20
+    assert [row["id"] for row in response.row_data] == [8, 10, 11, 13, 14]
+    assert response.model_dump(by_alias=True)["lastRow"] == 20
+
+
+def test_estimated_and_skipped_counts(people):
+    assert people.aggrid_query(make_request(0, 5), count="estimated").last_row == 30
+    response = people.aggrid_query(make_request(0, 5, FEMALE), count="none")
+    assert response.last_row is None
+    assert len(response.row_data) == 5
+    last_page = people.aggrid_query(
+        make_request(15, 25, FEMALE), known_total=None, count="none"
+    )
+    assert last_page.last_row == 20
+    assert (
+        people.aggrid_query(make_request(0, 5, FEMALE), known_total=20).last_row == 20
+    )
+
+
+def scroll(people, filter_model, block_size, keyset):
+    rows, cursor, start_row = [], None, 0
+    while True:
+        request = make_request(start_row, start_row + block_size, filter_model)
+        request.cursor = cursor
+        response = people.aggrid_query(
+            request, additional_projection={"_id": 0}, keyset=keyset
+        )
+        rows.extend(response.row_data)
+        start_row += block_size
+        cursor = response.cursor
+        if response.last_row is not None and start_row >= response.last_row:
+            return rows, response.last_row
+
+
+def test_keyset_scroll_matches_offset_scroll(people):
+    keyset_rows, keyset_total = scroll(people, FEMALE, 6, keyset=True)
+    offset_rows, offset_total = scroll(people, FEMALE, 6, keyset=False)
+    assert keyset_rows == offset_rows
+    assert keyset_total == offset_total == 20
+    assert all("__keyset" not in row for row in keyset_rows)
+
+
+def test_keyset_continuation_uses_range_match_instead_of_skip(people):
+    first = people.aggrid_query(make_request(0, 5, FEMALE), keyset=True)
+    request = make_request(5, 10, FEMALE)
+    request.cursor = first.cursor
+    pipeline = people.aggrid_query_util.build_query(request, keyset=True)
+    assert not any("$skip" in stage for stage in pipeline)
+    assert pipeline[-3] == {"$sort": {"id": 1, "_id": 1}}
+    assert "$or" in pipeline[-4]["$match"]
+
+    jump = make_request(10, 15, FEMALE)
+    jump.cursor = first.cursor
+    pipeline = people.aggrid_query_util.build_query(jump, keyset=True)
+    assert {"$skip": 10} in pipeline
+
+
+def test_keyset_cursor_is_validated(people):
+    first = people.aggrid_query(make_request(0, 5, FEMALE), keyset=True)
+    util = people.aggrid_query_util
+    digest = keyset_sort_digest(make_request(0, 5))
+    forged = [
+        "not a cursor",
+        encode_keyset_cursor([1, 2], 5, digest)[:-4],
+        base64.urlsafe_b64encode(bson.encode({"values": [1, 2]})).decode(),
+        encode_keyset_cursor([1], 5, digest),
+    ]
+    for cursor in forged:
+        request = make_request(5, 10, FEMALE)
+        request.cursor = cursor
+        with pytest.raises(InvalidCursorError):
+            people.aggrid_query(request, keyset=True)
+
+    # a document value is compared as a value, never read as query operators
+    request = make_request(5, 10, FEMALE)
+    request.cursor = encode_keyset_cursor([{"$ne": None}, 1], 5, digest)
+    match = util.build_query(request, keyset=True)[-4]["$match"]
+    assert {"id": {"$eq": {"$ne": None}}, "_id": {"$gt": 1}} in match["$or"]
+
+    # a cursor is bound to the sort it was issued for
+    resorted = make_request(5, 10, FEMALE)
+    resorted.filters.sort_model = [{"colId": "id", "sort": "desc"}]
+    resorted.cursor = first.cursor
+    with pytest.raises(InvalidCursorError):
+        util.build_query(resorted, keyset=True)
+
+
+@pytest.fixture
+def medals(make_collection):
+    coll = make_collection("medals_coll", soft_delete=False)
+    coll.insert_many(
+        [
+            {"country": "IE", "sport": "Rowing", "year": 2000, "gold": 1},
+            {"country": "IE", "sport": "Boxing", "year": 2000, "gold": 2},
+            {"country": "IE", "sport": "Boxing", "year": 2004, "gold": 3},
+            {"country": "US", "sport": "Rowing", "year": 2004, "gold": 4},
+        ]
+    )
+    return coll
+
+
+def group_request(group_keys=(), pivot_cols=()) -> AGGridTableRequest:
+    return AGGridTableRequest.model_validate(
+        {
+            "startRow": 0,
+            "endRow": 100,
+            "filters": {
+                "rowGroupCols": [
+                    {"id": "country", "field": "country"},
+                    {"id": "sport", "field": "sport"},
+                ],
+                "groupKeys": list(group_keys),
+                "valueCols": [{"id": "gold", "field": "gold", "aggFunc": "sum"}],
+                "pivotCols": [{"id": col, "field": col} for col in pivot_cols],
+                "pivotMode": bool(pivot_cols),
+            },
+        }
+    )
+
+
+def test_group_rows_for_each_level(medals):
+    top = medals.aggrid_query(group_request())
+    assert top.row_data == [
+        {"country": "IE", "gold": 6, "childCount": 3},
+        {"country": "US", "gold": 4, "childCount": 1},
+    ]
+    assert top.last_row == 2
+    inner = medals.aggrid_query(group_request(["IE"]))
+    assert inner.row_data == [
+        {"sport": "Boxing", "gold": 5, "childCount": 2},
+        {"sport": "Rowing", "gold": 1, "childCount": 1},
+    ]
+    leaves = medals.aggrid_query(group_request(["IE", "Boxing"]))
+    assert leaves.last_row == 2
+    assert sorted(row["gold"] for row in leaves.row_data) == [2, 3]
+
+
+def test_estimated_count_of_grouped_requests_is_exact(medals):
+    top = medals.aggrid_query(group_request(), count="estimated")
+    assert top.last_row == 2
+    inner = medals.aggrid_query(group_request(["IE"]), count="estimated")
+    assert inner.last_row == 2
+    leaves = medals.aggrid_query(group_request(["IE", "Boxing"]), count="estimated")
+    assert leaves.last_row == 2
+    pivot = group_request(pivot_cols=["year"])
+    pivot.filters.row_group_cols = []
+    assert not AGGridMongoQueryUtil().counts_collection(pivot)
+
+
+def test_pivot_stages():
+    pipeline = AGGridMongoQueryUtil().build_query(group_request(pivot_cols=["year"]))
+    first, second, reshape = pipeline[:3]
+    assert first == {
+        "$group": {
+            "_id": {"g": "$country", "p0": "$year"},
+            "a0": {"$sum": "$gold"},
+            "n": {"$sum": 1},
+        }
+    }
+    assert second == {
+        "$group": {
+            "_id": "$_id.g",
+            "pivot": {"$push": {"p0": "$_id.p0", "a0": "$a0"}},
+            "childCount": {"$sum": "$n"},
+        }
+    }
+    merged = reshape["$replaceRoot"]["newRoot"]["$mergeObjects"]
+    assert merged[0] == {"childCount": "$childCount", "country": "$_id"}
+    column = merged[1]["$arrayToObject"]["$concatArrays"][0]["$map"]
+    assert column["in"]["k"] == {
+        "$concat": [{"$ifNull": [{"$toString": "$$p.p0"}, ""]}, "_", "gold"]
+    }
+    assert pipeline[3:] == [{"$sort": {"country": 1}}, {"$limit": 100}]
+
+
+def test_pivot_result_fields_of_a_dotted_group_field():
+    request = group_request(pivot_cols=["year"])
+    request.filters.row_group_cols = [{"id": "loc.region", "field": "loc.region"}]
+    rows = [
+        {"loc": {"region": "eu"}, "childCount": 2, "2000_gold": 1, "2004_gold": 2},
+        {"loc": {"region": "us"}, "childCount": 1, "2000_gold": 3},
+    ]
+    util = AGGridMongoQueryUtil()
+    assert util.pivot_result_fields(request.filters, rows) == ["2000_gold", "2004_gold"]
+    request.filters.group_keys = ["eu"]
+    assert util.pivot_result_fields(request.filters, [{"year": 2000}]) == []
+
+
+class Cities(MongoCollectionBaseClass):
+    text_index_fields = ["name", "country"]
+
+
+def test_quick_filter_searches_text_index_fields(make_collection):
+    coll = make_collection("cities", soft_delete=False)
+    cities = Cities(coll.client, coll.database, coll.collection, soft_delete=False)
+    cities.insert_many(
+        [
+            {"id": 0, "name": "Paris", "country": "France"},
+            {"id": 1, "name": "Lyon", "country": "France"},
+            {"id": 2, "name": "Madrid", "country": "Spain"},
+        ]
+    )
+    assert not cities.has_text_index()
+    request = AGGridTableRequest.model_validate(
+        {"filters": {"quickFilter": "fra ly", "sortModel": []}}
+    )
+    response = cities.aggrid_query(request, additional_projection={"_id": 0})
+    assert response.row_data == [{"id": 1, "name": "Lyon", "country": "France"}]
+    assert response.last_row == 1
+
+
+def test_set_filter_values_ignore_own_filter(make_collection):
+    coll = make_collection("set_values", soft_delete=False)
+    coll.insert_many(
+        [
+            {"country": country, "sport": sport}
+            for country, sport in [
+                ("France", "Judo"),
+                ("France", "Rowing"),
+                ("Spain", "Judo"),
+                ("Kenya", "Athletics"),
+            ]
+        ]
+    )
+    filter_model = {
+        "country": {"filterType": "set", "values": ["France", "Spain"]},
+        "sport": {"filterType": "set", "values": ["Judo"]},
+    }
+    values = coll.aggrid_set_filter_values(["country", "sport"], filter_model, limit=2)
+    assert values == {
+        "country": [{"value": "France", "count": 1}, {"value": "Spain", "count": 1}],
+        "sport": [{"value": "Judo", "count": 2}, {"value": "Rowing", "count": 1}],
+    }
+    pipeline = coll.aggrid_query_util.build_set_values_query(filter_model, ["sport"])
+    assert pipeline[0] == {"$match": {"country": {"$in": ["France", "Spain"]}}}
+    assert pipeline[1]["$facet"]["c0"][0]["$group"] == {
+        "_id": "$sport",
+        "count": {"$sum": 1},
+    }
+
+
+class RawCollection:
+    """Collection returning RawBSONDocuments, mongomock does not support a custom document_class"""
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    def aggregate(self, *args, **kwargs):
+        return (
+            RawBSONDocument(bson.encode(document))
+            for document in self._collection.aggregate(*args, **kwargs)
+        )
+
+
+def test_raw_bson_class_queries_grid_with_decoded_documents(people, monkeypatch):
+    with_options = mongomock.collection.Collection.with_options
+
+    def raw_with_options(self, codec_options=None, **kwargs):
+        if codec_options is RAW_CODEC_OPTIONS:
+            return RawCollection(self)
+        return with_options(self, codec_options=codec_options, **kwargs)
+
+    monkeypatch.setattr(
+        mongomock.collection.Collection, "with_options", raw_with_options
+    )
+    people.raw_bson = True
+    assert isinstance(next(people.aggregate([{"$limit": 1}])), RawBSONDocument)
+
+    request = make_request(0, 5, FEMALE)
+    response = people.aggrid_query(request, additional_projection={"_id": 0})
+    assert response.last_row == 20
+    assert [row["id"] for row in response.row_data] == [1, 2, 4, 5, 7]
+    keyset = people.aggrid_query(request, additional_projection={"_id": 0}, keyset=True)
+    request.cursor = keyset.cursor
+    request.start_row, request.end_row = 5, 10
+    following = people.aggrid_query(
+        request, additional_projection={"_id": 0}, keyset=True
+    )
+    assert [row["id"] for row in following.row_data] == [8, 10, 11, 13, 14]
+    assert following.last_row == 20
+    assert people.aggrid_set_filter_values(["gender"]) == {
+        "gender": [{"value": "Female", "count": 20}, {"value": "Male", "count": 10}]
+    }
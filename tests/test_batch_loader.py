@@ -0,0 +1,116 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from pymongo_util.mongo_tools.batch_loader import AsyncBatchLoader
+
+
+def counting(collection):
+    queries = []
+    find = collection.find
+
+    def counted_find(query, *args, **kwargs):
+        queries.append(query)
+        return find(query, *args, **kwargs)
+
+    collection.find = counted_find
+    return queries
+
+
+def test_load_many_coalesces_keys(make_collection):
+    plugins = make_collection("plugins", soft_delete=False)
+    plugins.insert_many([{"plugin_id": i, "name": f"p{i}"} for i in range(5)])
+    queries = counting(plugins)
+    loader = plugins.loader("plugin_id")
+    assert loader.load_many([3, 1, 3, 9]) == [
+        {"plugin_id": 3, "name": "p3"},
+        {"plugin_id": 1, "name": "p1"},
+        {"plugin_id": 3, "name": "p3"},
+        None,
+    ]
+    assert queries == [{"plugin_id": {"$in": [3, 1, 9]}}]
+    # the key field is fetched to map the documents back, then removed when not projected
+    names = plugins.loader("plugin_id", filter_dict={"_id": 0, "name": 1})
+    assert names.load_many([2]) == [{"name": "p2"}]
+
+
+def test_concurrent_loads_share_a_query(make_collection):
+    plugins = make_collection("plugins", soft_delete=False)
+    plugins.insert_many([{"plugin_id": i} for i in range(8)])
+    queries = counting(plugins)
+    loader = plugins.loader("plugin_id", window=0.2)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        documents = list(pool.map(loader.load, range(8)))
+    assert documents == [{"plugin_id": i} for i in range(8)]
+    assert len(queries) == 1
+
+
+class FakeAsyncCollection:
+    def __init__(self, documents):
+        self.documents = documents
+        self.queries = []
+        self.released = asyncio.Event()
+        self.released.set()
+
+    def find(self, query, filter_dict):
+        self.queries.append(query)
+        keys = query["plugin_id"]["$in"]
+        matches = [dict(d) for d in self.documents if d["plugin_id"] in keys]
+        released = self.released
+
+        class Cursor:
+            async def to_list(self):
+                await released.wait()
+                return matches
+
+        return Cursor()
+
+
+def test_async_loads_gathered_into_one_query():
+    collection = FakeAsyncCollection([{"plugin_id": i} for i in range(4)])
+    loader = AsyncBatchLoader(collection, "plugin_id")
+
+    async def resolve():
+        return await asyncio.gather(*(loader.load(i) for i in (2, 0, 2, 7)))
+
+    assert asyncio.run(resolve()) == [
+        {"plugin_id": 2},
+        {"plugin_id": 0},
+        {"plugin_id": 2},
+        None,
+    ]
+    assert collection.queries == [{"plugin_id": {"$in": [2, 0, 7]}}]
+
+
+def test_async_cancelled_caller_leaves_others_served():
+    collection = FakeAsyncCollection([{"plugin_id": i} for i in range(4)])
+    loader = AsyncBatchLoader(collection, "plugin_id", max_batch_size=2)
+
+    async def resolve():
+        collection.released.clear()
+        waiting = asyncio.create_task(loader.load(1))
+        # the second key fills the batch, the query runs while its caller is cancelled
+        cancelled = asyncio.create_task(loader.load(2))
+        sharing = asyncio.create_task(loader.load(2))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        collection.released.set()
+        first, second = await asyncio.wait_for(asyncio.gather(waiting, sharing), 5)
+        second["plugin_id"] = None
+        return first, second, cancelled.cancelled(), await loader.load(2)
+
+    assert asyncio.run(resolve()) == (
+        {"plugin_id": 1},
+        {"plugin_id": None},
+        True,
+        {"plugin_id": 2},
+    )
+    assert len(collection.queries) == 2
+
+
+def test_callers_of_a_key_get_their_own_documents(make_collection):
+    plugins = make_collection("plugins", soft_delete=False)
+    plugins.insert_one({"plugin_id": 1, "tags": ["a"]})
+    first, second = plugins.loader("plugin_id").load_many([1, 1])
+    first["tags"].append("b")
+    assert second == {"plugin_id": 1, "tags": ["a"]}
@@ -0,0 +1,147 @@
+import time
+
+import mongomock
+import pytest
+from pymongo.errors import AutoReconnect
+
+
+def test_bulk_flushes_on_batch_size_and_exit(make_collection):
+    coll = make_collection("bulk_coll", soft_delete=False)
+    with coll.bulk(batch_size=3) as writer:
+        for i in range(5):
+            writer.insert_one({"id": i})
+        assert len(writer) == 2
+        writer.update_one(query={"id": 1}, data={"name": "one"})
+        writer.update_to_set(query={"id": 2}, param="tags", data="a")
+        writer.delete_one({"id": 4})
+    assert len(writer) == 0
+    summary = writer.summary
+    assert summary.batches == 3
+    assert summary.inserted_count == 5
+    assert summary.modified_count == 2
+    assert summary.deleted_count == 1
+    assert coll.find_one({"id": 2})["tags"] == ["a"]
+    assert coll.find_count({}) == 4
+
+
+def test_bulk_flushes_after_max_age_without_new_writes(make_collection):
+    coll = make_collection("bulk_age_coll", soft_delete=False)
+    with coll.bulk(max_age=0.05) as writer:
+        writer.insert_one({"id": 1})
+        deadline = time.monotonic() + 5
+        while len(writer) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(writer) == 0
+        assert coll.find_count({}) == 1
+        writer.insert_one({"id": 2})
+        timer = writer._timer
+    assert timer.finished.is_set()
+    assert writer.summary.batches == 2
+    assert coll.find_count({}) == 2
+
+
+def test_bulk_keeps_operations_of_a_failed_timer_flush(make_collection, monkeypatch):
+    coll = make_collection("bulk_retry_coll", soft_delete=False)
+    bulk_write = mongomock.collection.Collection.bulk_write
+    calls = []
+
+    def failing_bulk_write(self, *args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            raise AutoReconnect("connection lost")
+        return bulk_write(self, *args, **kwargs)
+
+    monkeypatch.setattr(
+        mongomock.collection.Collection, "bulk_write", failing_bulk_write
+    )
+    writer = coll.bulk(max_age=0.05)
+    writer.insert_one({"id": 1})
+    deadline = time.monotonic() + 5
+    while writer._timer_error is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(writer) == 1
+    with pytest.raises(AutoReconnect):
+        writer.insert_one({"id": 2})
+    writer.close()
+    assert len(writer) == 0
+    assert coll.find_count({}) == 1
+    assert writer.summary.inserted_count == 1
+    assert writer.summary.errors == []
+
+
+def test_bulk_collects_errors_with_global_index(make_collection):
+    coll = make_collection("bulk_err_coll", soft_delete=False)
+    with coll.bulk(batch_size=2) as writer:
+        writer.insert_one({"_id": 1})
+        writer.insert_one({"_id": 2})
+        writer.insert_one({"_id": 3})
+        writer.insert_one({"_id": 1})
+    assert writer.summary.inserted_count == 3
+    assert [error["index"] for error in writer.summary.errors] == [3]
+
+
+def test_bulk_soft_deletes_archive_deleted_documents(make_collection):
+    coll = make_collection("bulk_soft_coll", soft_delete=True)
+    coll.insert_many([{"id": i} for i in range(4)])
+    with coll.bulk() as writer:
+        writer.delete_one({"id": 0})
+        writer.delete_many({"id": {"$gte": 2}})
+        writer.update_one(query={"id": 1}, data={"kept": True})
+    assert writer.summary.deleted_count == 3
+    assert writer.summary.modified_count == 1
+    archive = coll.client["deleted__mock_data"]["bulk_soft_coll"]
+    assert sorted(archive.distinct("id")) == [0, 2, 3]
+
+
+def test_bulk_soft_deletes_see_earlier_writes(make_collection):
+    coll = make_collection("bulk_soft_order", soft_delete=True)
+    with coll.bulk() as writer:
+        writer.insert_one({"k": 1})
+        writer.insert_one({"k": 2})
+        writer.delete_one({"k": 1})
+        writer.update_one(query={"k": 2}, data={"seen": True})
+        writer.delete_many({"seen": True})
+        writer.insert_one({"k": 3})
+    assert writer.summary.deleted_count == 2
+    assert writer.summary.inserted_count == 3
+    assert list(coll.find({}, {"_id": 0, "k": 1})) == [{"k": 3}]
+    archive = coll.client["deleted__mock_data"]["bulk_soft_order"]
+    assert sorted(archive.distinct("k")) == [1, 2]
+
+
+def test_upsert_many_by_natural_key(make_collection):
+    coll = make_collection("upsert_coll", soft_delete=False)
+    coll.insert_one({"code": "a", "region": "eu", "price": 1, "stock": 5})
+    rows = [
+        {"code": "a", "region": "eu", "price": 2},
+        {"code": "a", "region": "us", "price": 3},
+        {"code": "b", "region": "eu", "price": 4},
+    ]
+    sent = []
+    summary = coll.upsert_many(
+        iter(rows),
+        key_fields=["code", "region"],
+        chunk_size=2,
+        max_workers=2,
+        progress_callback=sent.append,
+    )
+    assert (summary.batches, summary.matched_count, summary.upserted_count) == (2, 1, 2)
+    assert len(summary.upserted_ids) == 2
+    assert sent == [2, 3]
+    assert coll.find_one({"code": "a", "region": "eu"}) == {
+        "code": "a",
+        "region": "eu",
+        "price": 2,
+        "stock": 5,
+    }
+    coll.upsert_many(
+        [{"code": "a", "region": "eu", "price": 9}],
+        ["code", "region"],
+        strategy="replace",
+    )
+    assert coll.find_one({"code": "a", "region": "eu"}) == {
+        "code": "a",
+        "region": "eu",
+        "price": 9,
+    }
+    assert coll.find_count({}) == 3
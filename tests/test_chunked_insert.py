@@ -0,0 +1,56 @@
+def test_insert_many_streams_generator_in_chunks(make_collection):
+    coll = make_collection("chunked_coll")
+    progress = []
+    result = coll.insert_many(
+        ({"id": i, "payload": "x" * 100} for i in range(25)),
+        chunk_size=10,
+        progress_callback=progress.append,
+    )
+    assert result.chunks == 3
+    assert result.inserted_count == 25
+    assert len(result.inserted_ids) == 25
+    assert progress == [10, 20, 25]
+    assert coll.find_count({}) == 25
+
+
+def test_insert_many_bounds_chunk_bytes_and_runs_parallel(make_collection):
+    coll = make_collection("chunked_parallel_coll")
+    result = coll.insert_many(
+        ({"id": i, "payload": "x" * 1000} for i in range(20)),
+        max_chunk_bytes=4096,
+        max_workers=4,
+        return_ids=False,
+    )
+    assert result.chunks == 7
+    assert result.inserted_count == 20
+    assert result.inserted_ids == []
+    assert sorted(coll.distinct("id")) == list(range(20))
+
+
+def test_insert_many_continues_past_failing_chunks(make_collection):
+    coll = make_collection("chunked_dup_coll")
+    coll.insert_one({"_id": 4})
+    documents = [{"_id": i} for i in range(10)]
+    result = coll.insert_many(iter(documents), chunk_size=3, ordered=False)
+    assert (result.chunks, result.inserted_count) == (4, 9)
+    assert [error["index"] for error in result.errors] == [4]
+    assert sorted(result.inserted_ids) == [i for i in range(10) if i != 4]
+    assert coll.find_count({}) == 10
+
+    parallel = make_collection("chunked_dup_parallel_coll")
+    parallel.insert_one({"_id": 4})
+    result = parallel.insert_many(
+        ({"_id": i} for i in range(10)), chunk_size=3, max_workers=2
+    )
+    assert result.inserted_count == 9
+    assert [error["index"] for error in result.errors] == [4]
+    assert parallel.find_count({}) == 10
+
+
+def test_ordered_insert_many_stops_at_the_failing_document(make_collection):
+    coll = make_collection("chunked_ordered_coll")
+    coll.insert_one({"_id": 4})
+    result = coll.insert_many(({"_id": i} for i in range(10)), chunk_size=3)
+    assert (result.chunks, result.inserted_count) == (2, 4)
+    assert result.inserted_ids == [0, 1, 2, 3]
+    assert [error["index"] for error in result.errors] == [4]
@@ -0,0 +1,65 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from pymongo_util.mongo_tools import columnar  # noqa: E402
+from pymongo_util.mongo_tools.columnar import ColumnarBuilder  # noqa: E402
+
+
+def test_builder_grows_and_masks_missing_values(monkeypatch):
+    monkeypatch.setattr(columnar, "FLUSH_SIZE", 3)
+    builder = ColumnarBuilder(
+        {"price": "float64", "stock.qty": "int32", "tags": object}, capacity=2
+    )
+    builder.extend(
+        [
+            {"price": 1.5, "stock": {"qty": 3}, "tags": ["a", "b"]},
+            {"price": None, "stock": {}},
+            {"stock": {"qty": 7}, "tags": []},
+            {"price": 4.0, "stock": {"qty": 1}},
+            {"price": 5.0},
+        ]
+    )
+    assert len(builder) == 5
+    columns = builder.columns()
+    assert columns["price"].tolist() == [1.5, None, None, 4.0, 5.0]
+    assert columns["stock.qty"].dtype == np.int32
+    assert columns["stock.qty"].tolist() == [3, None, 7, 1, None]
+    assert columns["tags"].tolist() == [["a", "b"], None, [], None, None]
+
+
+def test_builder_rejects_values_of_another_type():
+    builder = ColumnarBuilder({"price": "float64"})
+    builder.append({"price": "free"})
+    with pytest.raises(ValueError, match="price"):
+        builder.columns()
+
+
+def test_builder_rejects_strings_wider_than_dtype():
+    builder = ColumnarBuilder({"sku": "U4", "code": "S2"})
+    builder.append({"sku": "abcd", "code": b"ab"})
+    assert builder.columns()["sku"].tolist() == ["abcd"]
+    builder = ColumnarBuilder({"sku": "U4"})
+    builder.append({"sku": "abcde"})
+    with pytest.raises(ValueError, match="sku"):
+        builder.columns()
+    builder = ColumnarBuilder({"code": "S2"})
+    builder.append({"code": b"abc"})
+    with pytest.raises(ValueError, match="code"):
+        builder.columns()
+
+
+def test_find_and_aggregate_columnar(make_collection):
+    coll = make_collection("columnar", soft_delete=False)
+    coll.insert_many([{"sku": f"s{i}", "price": i * 1.5, "g": i % 2} for i in range(5)])
+    columns = coll.find_columnar(
+        {"g": 0}, {"sku": "U8", "price": "float64"}, sort=[("price", -1)]
+    )
+    assert columns["sku"].tolist() == ["s4", "s2", "s0"]
+    assert columns["price"].tolist() == [6.0, 3.0, 0.0]
+    totals = coll.aggregate_columnar(
+        [{"$group": {"_id": "$g", "total": {"$sum": "$price"}}}, {"$sort": {"_id": 1}}],
+        {"_id": "int64", "total": "float64"},
+    )
+    assert totals["_id"].tolist() == [0, 1]
+    assert totals["total"].tolist() == [9.0, 6.0]
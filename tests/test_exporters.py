@@ -0,0 +1,59 @@
+import gzip
+import io
+
+import bson
+from bson.raw_bson import RawBSONDocument
+
+from pymongo_util.mongo_tools.base_models import AGGridTableRequest
+from pymongo_util.mongo_tools.exporters import iter_export
+
+
+def test_export_ndjson_gzip(make_collection, tmp_path):
+    coll = make_collection("export_ndjson", soft_delete=False)
+    coll.insert_many([{"id": i} for i in range(5)])
+    path = tmp_path / "export.ndjson.gz"
+    count = coll.export(
+        path, query={"id": {"$gte": 1}}, filter_dict={"_id": 0}, batch_size=2, gzip=True
+    )
+    assert count == 4
+    assert gzip.decompress(path.read_bytes()).decode().splitlines() == [
+        f'{{"id": {i}}}' for i in range(1, 5)
+    ]
+    # `_id` is left out by default, as in the other reads
+    assert list(coll.iter_export(query={"id": 0})) == [b'{"id": 0}\n']
+
+
+def test_iter_export_csv_of_grid_rows(make_collection):
+    coll = make_collection("export_csv", soft_delete=False)
+    coll.insert_many(
+        [{"id": i, "address": {"city": f"c{i}"}, "tags": ["a"]} for i in range(3)]
+    )
+    request = AGGridTableRequest.model_validate(
+        {
+            "startRow": 0,
+            "endRow": 1,
+            "filters": {"sortModel": [{"colId": "id", "sort": "desc"}]},
+        }
+    )
+    chunks = list(
+        coll.iter_export(
+            "csv",
+            req_body=request,
+            columns=["id", "address.city", "tags"],
+            batch_size=2,
+        )
+    )
+    assert len(chunks) == 2
+    assert b"".join(chunks).decode().splitlines() == [
+        "id,address.city,tags",
+        '2,c2,"[""a""]"',
+        '1,c1,"[""a""]"',
+        '0,c0,"[""a""]"',
+    ]
+
+
+def test_bson_export_passes_raw_documents_through():
+    raw = RawBSONDocument(bson.encode({"a": 1}))
+    out = io.BytesIO()
+    out.writelines(iter_export([raw, {"b": 2}], "bson"))
+    assert bson.decode_all(out.getvalue()) == [{"a": 1}, {"b": 2}]
@@ -0,0 +1,68 @@
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from pymongo_util.mongo_tools.base_models import AGGridTableRequest
+from pymongo_util.mongo_tools.index_advisor import IndexAdvisor, query_index_shape
+from pymongo_util.mongo_tools.mongo_sync import MongoCollectionBaseClass
+
+
+class Orders(MongoCollectionBaseClass):
+    indexes = [
+        IndexModel([("customer", ASCENDING), ("created", DESCENDING)]),
+        IndexModel([("status", ASCENDING)], name="status"),
+    ]
+    index_advisor = IndexAdvisor()
+
+
+def make_orders(make_collection) -> Orders:
+    coll = make_collection("orders", soft_delete=False)
+    return Orders(coll.client, coll.database, coll.collection, soft_delete=False)
+
+
+def test_ensure_indexes_is_idempotent(make_collection):
+    orders = make_orders(make_collection)
+    assert orders.ensure_indexes() == ["customer_1_created_-1", "status"]
+    assert orders.ensure_indexes(block=False).result(timeout=5) == [
+        "customer_1_created_-1",
+        "status",
+    ]
+
+
+def test_unindexed_shapes_ranked_by_frequency(make_collection):
+    orders = make_orders(make_collection)
+    orders.index_advisor.reset()
+    orders.find({"customer": 1}, sort=[("created", 1)])
+    orders.find_one({"status": "paid"})
+    for _ in range(2):
+        orders.find_count({"total": {"$gt": 10}})
+    orders.find_one({"_id": 1})
+    orders.aggrid_query(
+        AGGridTableRequest.model_validate(
+            {
+                "filters": {
+                    "filterModel": {
+                        "status": {"filterType": "set", "values": ["paid"]}
+                    },
+                    "sortModel": [{"colId": "total", "sort": "desc"}],
+                }
+            }
+        )
+    )
+    assert orders.unindexed_query_shapes() == [
+        {"equality": [], "sort": [], "range": ["total"], "count": 2},
+        {"equality": ["status"], "sort": [["total", -1]], "range": [], "count": 1},
+    ]
+
+
+def test_query_index_shape():
+    shape = query_index_shape(
+        {"a": 1, "b": {"$in": [1, 2]}, "c": {"$gte": 3}, "$or": [{"d": 1}]},
+        [("e", 1)],
+    )
+    assert shape.as_dict() == {
+        "equality": ["a", "b"],
+        "sort": [["e", 1]],
+        "range": ["c", "d"],
+    }
+    assert shape.served_by([("b", 1), ("a", 1), ("e", -1), ("d", 1), ("c", 1)])
+    assert not shape.served_by([("a", 1), ("e", 1), ("b", 1), ("c", 1), ("d", 1)])
+    assert query_index_shape({}) is None
@@ -0,0 +1,99 @@
+from types import SimpleNamespace
+
+import mongomock
+import pytest
+
+from pymongo_util.mongo_tools.instrumentation import (
+    Instrumentation,
+    comment_kwargs,
+    current_operation,
+    instrumented,
+    query_shape,
+)
+from pymongo_util.mongo_tools.mongo_util import MongoConnect
+
+
+@pytest.fixture
+def listener():
+    return Instrumentation(slow_ms=5)
+
+
+def instrumented_client(listener):
+    """mongomock client with the listener registered, the way MongoClient lists it"""
+    client = mongomock.MongoClient()
+    client.options = SimpleNamespace(event_listeners=[listener])
+    return client
+
+
+def command(listener, name, body, reply, request_id, duration_ms=1):
+    event = SimpleNamespace(
+        command={name: body} | ({} if name == "getMore" else {"filter": {"a": 1}}),
+        command_name=name,
+        database_name="db",
+        request_id=request_id,
+        connection_id=("localhost", 27017),
+        duration_micros=duration_ms * 1000,
+        reply=reply,
+    )
+    if name == "getMore":
+        event.command["collection"] = "people"
+    listener.started(event)
+    listener.succeeded(event)
+
+
+class People:
+    def __init__(self, listener):
+        self.listener = listener
+        self.client = SimpleNamespace(
+            options=SimpleNamespace(event_listeners=[listener])
+        )
+
+    @instrumented
+    def find(self):
+        assert comment_kwargs() == {"comment": "pymongo_util:People.find"}
+        reply = {"cursor": {"id": 42, "firstBatch": [{}, {}]}}
+        command(self.listener, "find", "people", reply, request_id=1, duration_ms=7)
+
+
+def test_commands_are_attributed_to_methods_and_cursors(listener):
+    People(listener).find()
+    reply = {"cursor": {"id": 0, "nextBatch": [{}]}}
+    command(listener, "getMore", 42, reply, request_id=2)
+    stats = {(s["class"], s["method"], s["command"]): s for s in listener.snapshot()}
+    assert stats[("People", "find", "find")]["documents"] == 2
+    assert stats[("People", "find", "getMore")]["namespace"] == "db.people"
+    assert stats[("People", "find", "getMore")]["buckets"][1] == 1
+    assert stats[("People", "find", "find")]["buckets"][5] == 0
+    assert stats[("People", "find", "find")]["buckets"][10] == 1
+    assert [op["shape"] for op in listener.slow_operations()] == [{"a": "?"}]
+    assert comment_kwargs() == {}
+
+
+def test_only_collections_of_instrumented_clients_are_attributed(listener, monkeypatch):
+    operations = []
+    insert_one = mongomock.collection.Collection.insert_one
+
+    def recording_insert_one(self, *args, **kwargs):
+        operations.append(current_operation())
+        return insert_one(self, *args, **kwargs)
+
+    monkeypatch.setattr(
+        mongomock.collection.Collection, "insert_one", recording_insert_one
+    )
+    for client in (instrumented_client(listener), mongomock.MongoClient()):
+        mongo_obj = MongoConnect(client=client, instrumentation=listener)
+        BaseClass = mongo_obj.get_base_class()  # noqa NOSONAR
+        people = BaseClass(
+            mongo_client=mongo_obj(),
+            database="db",
+            collection="people",
+            soft_delete=False,
+        )
+        people.insert_one({"a": 1})
+    assert operations == [("MongoCollectionBaseClass", "insert_one"), None]
+
+
+def test_query_shape():
+    assert query_shape(
+        [{"$match": {"a": {"$in": [1, 2]}, "$or": [{"b": 1}, {"c": "x"}]}}]
+    ) == [{"$match": {"a": {"$in": "?"}, "$or": [{"b": "?"}, {"c": "?"}]}}]
@@ -0,0 +1,33 @@
+import os
+import subprocess
+import sys
+
+
+def run_python(code: str, **env) -> str:
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        env=os.environ | env,
+    )
+    return result.stdout.strip()
+
+
+def test_import_does_not_load_pymongo():
+    output = run_python(
+        "import sys, pymongo_util; "
+        "print(sorted(m for m in ('pymongo', 'pydantic', 'pydantic_settings') if m in sys.modules))"
+    )
+    assert output == "[]"
+
+
+def test_attributes_resolved_on_access():
+    output = run_python(
+        "import pymongo_util; "
+        "from pymongo_util import mongo_client, CollectionBaseClass; "
+        "print(pymongo_util.MongoConfig.MONGO_URI, mongo_client is pymongo_util.mongo_obj.client, "
+        "CollectionBaseClass.__name__)",
+        MONGO_URI="mongodb://example.com:27018",
+    )
+    assert output == "mongodb://example.com:27018 True MongoCollectionBaseClass"
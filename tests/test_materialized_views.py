@@ -0,0 +1,81 @@
+from pymongo import IndexModel
+
+from pymongo_util.mongo_tools.base_models import AGGridTableRequest
+from pymongo_util.mongo_tools.materialized_views import (
+    MaterializedView,
+    incremental_refresh_pipeline,
+)
+from pymongo_util.mongo_tools.mongo_sync import MongoCollectionBaseClass
+
+ORDER_TOTALS = MaterializedView(
+    name="order_totals",
+    pipeline=[
+        {
+            "$lookup": {
+                "from": "customers",
+                "localField": "customer",
+                "foreignField": "_id",
+                "as": "c",
+            }
+        },
+        {"$project": {"customer": {"$first": "$c.name"}, "total": 1, "updated": 1}},
+    ],
+    high_water_mark="updated",
+    indexes=[IndexModel([("customer", 1)])],
+)
+
+
+class Orders(MongoCollectionBaseClass):
+    materialized_views = [ORDER_TOTALS]
+
+
+def test_incremental_refresh_pipeline():
+    assert incremental_refresh_pipeline(ORDER_TOTALS, "shop", 5, 9) == [
+        {"$match": {"updated": {"$gt": 5, "$lte": 9}}},
+        *ORDER_TOTALS.pipeline,
+        {
+            "$merge": {
+                "into": {"db": "shop", "coll": "order_totals"},
+                "on": "_id",
+                "whenMatched": "replace",
+                "whenNotMatched": "insert",
+            }
+        },
+    ]
+
+
+def test_refresh_and_query_view(make_collection):
+    coll = make_collection("orders", soft_delete=False)
+    coll.client["mock_data"]["customers"].insert_many(
+        [{"_id": 1, "name": "ann"}, {"_id": 2, "name": "bob"}]
+    )
+    coll.insert_many(
+        [
+            {"_id": i, "customer": i % 2 + 1, "total": i * 10, "updated": i}
+            for i in range(4)
+        ]
+    )
+    orders = Orders(coll.client, coll.database, coll.collection)
+
+    state = orders.refresh_view("order_totals")
+    assert (state["full"], state["high_water_mark"]) == (True, 3)
+    view = orders.view("order_totals")
+    assert "customer_1" in coll.client["mock_data"]["order_totals"].index_information()
+
+    response = view.aggrid_query(
+        AGGridTableRequest.model_validate(
+            {
+                "startRow": 0,
+                "endRow": 10,
+                "filters": {
+                    "filterModel": {
+                        "customer": {"filterType": "set", "values": ["bob"]}
+                    },
+                    "sortModel": [{"colId": "total", "sort": "desc"}],
+                },
+            }
+        )
+    )
+    assert [row["total"] for row in response.row_data] == [30, 10]
+    # nothing changed since the last refresh: the pipeline is not run again
+    assert orders.refresh_view("order_totals")["full"] is False
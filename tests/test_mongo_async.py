@@ -0,0 +1,186 @@
+import asyncio
+import inspect
+
+import mongomock
+import pytest
+
+from pymongo_util.mongo_tools.mongo_util import MongoConnect
+
+CORE_METHODS = (
+    "insert_one",
+    "insert_many",
+    "find",
+    "find_one",
+    "update_one",
+    "update_to_set",
+    "update_many",
+    "find_and_update",
+    "delete_many",
+    "delete_one",
+    "perform_soft_delete",
+    "distinct",
+    "find_count",
+    "aggregate",
+)
+
+
+def test_async_base_class_mirrors_sync_surface():
+    sync_class = MongoConnect.get_base_class()
+    async_class = MongoConnect.get_async_base_class()
+    for name in CORE_METHODS:
+        assert hasattr(sync_class, name), name
+        assert hasattr(async_class, name), name
+        if name != "find":
+            assert inspect.iscoroutinefunction(getattr(async_class, name)), name
+
+
+class AsyncCursor:
+    """mongomock cursor behind the AsyncCursor interface used by the async class"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        # sort, skip, limit and batch_size return the cursor itself
+        method = getattr(self._cursor, name)
+
+        def chained(*args, **kwargs):
+            method(*args, **kwargs)
+            return self
+
+        return chained
+
+    async def to_list(self, length=None):
+        return list(self._cursor)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._cursor)
+        except StopIteration:
+            raise StopAsyncIteration from None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._cursor.close()
+
+    async def close(self):
+        self._cursor.close()
+
+
+class AsyncCollection:
+    """mongomock collection whose methods are coroutines, as on an AsyncMongoClient"""
+
+    def __init__(self, collection):
+        self._collection = collection
+        self.write_concern = collection.write_concern
+
+    def find(self, *args, **kwargs):
+        return AsyncCursor(self._collection.find(*args, **kwargs))
+
+    async def aggregate(self, *args, **kwargs):
+        return AsyncCursor(self._collection.aggregate(*args, **kwargs))
+
+    def __getattr__(self, name):
+        method = getattr(self._collection, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+
+        return call
+
+
+class AsyncClient:
+    def __init__(self):
+        self.sync = mongomock.MongoClient()
+
+    def __getitem__(self, database):
+        return AsyncDatabase(self.sync[database])
+
+
+class AsyncDatabase:
+    def __init__(self, database):
+        self._database = database
+
+    def __getitem__(self, collection):
+        return AsyncCollection(self._database[collection])
+
+
+@pytest.fixture
+def people():
+    async_class = MongoConnect.get_async_base_class()
+    return async_class(
+        mongo_client=AsyncClient(), database="mock_data", collection="people"
+    )
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_insert_one_find_one(people):
+    result = run(people.insert_one({"first_name": "Evania", "id": 1}))
+    assert result.inserted_id is not None
+    assert run(people.find_one({"id": 1})) == {"first_name": "Evania", "id": 1}
+    assert run(people.find_one({"id": 2})) is None
+
+
+def test_find_sort_skip_limit(people):
+    run(people.insert_many([{"id": i, "even": i % 2 == 0} for i in range(6)]))
+
+    async def found():
+        cursor = people.find({"even": True}, sort=[("id", -1)], skip=1, limit=1)
+        return await cursor.to_list()
+
+    assert run(found()) == [{"id": 2, "even": True}]
+
+
+def test_iter_find_in_batches(people):
+    run(people.insert_many([{"id": i} for i in range(5)]))
+
+    async def ids():
+        documents = people.iter_find({}, {"_id": 0, "id": 1}, batch_size=2)
+        return [document["id"] async for document in documents]
+
+    assert run(ids()) == [0, 1, 2, 3, 4]
+
+
+def test_updates(people):
+    run(people.insert_one({"id": 1, "tags": []}))
+    assert run(people.update_one({"id": 1}, {"name": "one"})).modified_count == 1
+    run(people.update_to_set({"id": 1}, "tags", "a"))
+    updated = run(people.find_and_update({"id": 1}, {"name": "uno"}))
+    assert updated["name"] == "uno"
+    assert updated["tags"] == ["a"]
+    assert run(people.update_many({}, {"seen": True})).matched_count == 1
+
+
+def test_soft_delete_archives_deleted_documents(people):
+    people.soft_delete = True
+    run(people.insert_many([{"id": i, "group": i % 2} for i in range(5)]))
+    assert run(people.delete_one({"id": 4})).deleted_count == 1
+    assert run(people.delete_many({"group": 1}, batch_size=1)).deleted_count == 2
+    assert run(people.find_count({})) == 2
+    archive = people.client.sync["deleted__mock_data"]["people"]
+    assert sorted(archive.distinct("id")) == [1, 3, 4]
+    assert all(document["deleted"]["on"] for document in archive.find())
+
+
+def test_hard_delete_distinct_and_aggregate(people):
+    people.soft_delete = False
+    run(people.insert_many([{"id": i, "group": i % 3} for i in range(6)]))
+    assert run(people.delete_many({"group": 2})).deleted_count == 2
+    assert run(people.distinct("group")) == [0, 1]
+
+    async def totals():
+        cursor = await people.aggregate(
+            [{"$group": {"_id": "$group", "n": {"$sum": 1}}}, {"$sort": {"_id": 1}}]
+        )
+        return await cursor.to_list()
+
+    assert run(totals()) == [{"_id": 0, "n": 2}, {"_id": 1, "n": 2}]
+    assert not people.client.sync["deleted__mock_data"].list_collection_names()
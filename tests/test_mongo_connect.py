@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+from pymongo_util.mongo_tools.mongo_util import MongoConnect
+
+
+@pytest.fixture(autouse=True)
+def close_clients():
+    yield
+    MongoConnect.close_clients()
+
+
+def test_connect_and_get_client_share_the_client():
+    client = MongoConnect(uri="mongodb://cluster-c:27017").client
+    assert client is MongoConnect.get_client("mongodb://cluster-c:27017")
+    assert client is MongoConnect.get_client(
+        "mongodb://cluster-c:27017", event_listeners=[]
+    )
+    assert MongoConnect(
+        uri="mongodb://cluster-c:27017"
+    ).async_client is MongoConnect.get_async_client("mongodb://cluster-c:27017")
+
+
+def test_shared_client_per_uri_and_options():
+    first = MongoConnect(uri="mongodb://cluster-a:27017")
+    second = MongoConnect(uri="mongodb://cluster-a:27017")
+    assert first.client is second.client
+    assert first() is MongoConnect.get_client(
+        "mongodb://cluster-a:27017", event_listeners=[]
+    )
+    assert MongoConnect.get_client("mongodb://cluster-b:27017") is not first.client
+    tuned = MongoConnect(uri="mongodb://cluster-a:27017", maxPoolSize=5).client
+    assert tuned is not first.client
+    assert tuned.options.pool_options.max_pool_size == 5
+    assert first.client.options.pool_options.max_pool_size == 100
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires fork")
+def test_clients_recreated_after_fork():
+    parent = MongoConnect.get_client("mongodb://cluster-a:27017")
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:  # pragma: no cover
+        child = MongoConnect.get_client("mongodb://cluster-a:27017")
+        same = child is parent
+        shared = child is MongoConnect.get_client("mongodb://cluster-a:27017")
+        os.write(write, f"{same} {shared}".encode())
+        os._exit(0)
+    os.close(write)
+    output = os.read(read, 100).decode()
+    os.waitpid(pid, 0)
+    assert output == "False True"
+    assert MongoConnect.get_client("mongodb://cluster-a:27017") is parent
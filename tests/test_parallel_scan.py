@@ -0,0 +1,54 @@
+from pymongo_util.mongo_tools.parallel_scan import range_query
+
+
+def test_parallel_scan_reads_every_document_once(make_collection):
+    coll = make_collection("parallel_scan", soft_delete=False)
+    coll.insert_many([{"_id": i, "group": i % 3} for i in range(200)])
+    documents = list(
+        coll.parallel_scan(query={"group": {"$ne": 2}}, filter_dict={}, max_workers=3)
+    )
+    assert sorted(doc["_id"] for doc in documents) == [
+        i for i in range(200) if i % 3 != 2
+    ]
+
+
+def test_parallel_scan_combines_partial_groups(make_collection):
+    coll = make_collection("parallel_group", soft_delete=False)
+    coll.insert_many([{"_id": i, "group": i % 3, "value": i} for i in range(200)])
+    groups = coll.parallel_scan(
+        pipeline=[{"$group": {"_id": "$group", "total": {"$sum": "$value"}}}],
+        combiner=lambda a, b: {"_id": a["_id"], "total": a["total"] + b["total"]},
+        partitions=5,
+        max_workers=2,
+    )
+    assert {group["_id"]: group["total"] for group in groups} == {
+        g: sum(range(g, 200, 3)) for g in range(3)
+    }
+
+
+def test_parallel_scan_reads_documents_without_the_field(make_collection):
+    coll = make_collection("parallel_nulls", soft_delete=False)
+    coll.insert_many([{"_id": i, "k": i} for i in range(100)])
+    coll.insert_many([{"_id": 100, "k": None}, {"_id": 101}, {"_id": 102}])
+    documents = list(
+        coll.parallel_scan(filter_dict={}, field="k", partitions=4, max_workers=2)
+    )
+    assert sorted(doc["_id"] for doc in documents) == list(range(103))
+    assert [doc["_id"] for doc in documents[-3:]] == [100, 101, 102]
+
+
+def test_parallel_scan_streams_and_stops_early(make_collection):
+    coll = make_collection("parallel_stream", soft_delete=False)
+    coll.insert_many([{"_id": i} for i in range(3000)])
+    scan = coll.parallel_scan(filter_dict={}, partitions=3, max_workers=2)
+    assert next(scan)["_id"] < 1500
+    scan.close()
+
+
+def test_range_query():
+    assert range_query({}, "_id", (None, None)) == {}
+    assert range_query({"a": 1}, "_id", (None, 5)) == {
+        "$and": [{"a": 1}, {"_id": {"$lt": 5}}]
+    }
+    assert range_query({}, "_id", (5, None)) == {"_id": {"$gte": 5}}
+    assert range_query({"a": 1}, "_id", None) == {"$and": [{"a": 1}, {"_id": None}]}
@@ -0,0 +1,182 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from pymongo_util.mongo_tools.base_models import AGGridTableRequest
+from pymongo_util.mongo_tools.query_buidler import AGGridMongoQueryUtil
+
+
+def make_request(start_row=0, end_row=100, **filters) -> AGGridTableRequest:
+    return AGGridTableRequest.model_validate(
+        {"startRow": start_row, "endRow": end_row, "filters": filters}
+    )
+
+
+GENDER_FILTER = {
+    "filterModel": {
+        "gender": {"filterType": "text", "type": "equals", "filter": "Female"}
+    },
+    "sortModel": [{"colId": "id", "sort": "desc"}],
+}
+
+
+def test_build_query_is_reentrant():
+    util = AGGridMongoQueryUtil()
+    first = util.build_query(make_request(**GENDER_FILTER))
+    second = util.build_query(make_request(**GENDER_FILTER))
+    assert (
+        first
+        == second
+        == [
+            {"$match": {"gender": "Female"}},
+            {"$sort": {"id": -1}},
+            {"$limit": 100},
+        ]
+    )
+
+
+def test_compiled_filters_are_cached_and_only_pages_rebound():
+    assert AGGridMongoQueryUtil()._compiled is None
+    util = AGGridMongoQueryUtil(cache_size=256)
+    util.build_query(make_request(**GENDER_FILTER))
+    pipeline = util.build_query(make_request(100, 200, **GENDER_FILTER))
+    assert pipeline[-2:] == [{"$skip": 100}, {"$limit": 100}]
+    assert util._compiled.stats()["hits"] == 1
+    pipeline[0]["$match"]["gender"] = "mutated"
+    assert util.build_query(make_request(**GENDER_FILTER))[0] == {
+        "$match": {"gender": "Female"}
+    }
+
+
+def test_shared_builder_across_threads():
+    util = AGGridMongoQueryUtil()
+    requests = [make_request(i * 10, i * 10 + 10, **GENDER_FILTER) for i in range(50)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        pipelines = list(executor.map(util.build_query, requests))
+    for i, pipeline in enumerate(pipelines):
+        assert len(pipeline) == (3 if i == 0 else 4)
+        assert pipeline[-1] == {"$limit": 10}
+
+
+MIXED_FILTERS = {
+    "filterModel": {
+        "country": {"filterType": "set", "values": ["France", "Spain"]},
+        "name": {"filterType": "text", "type": "startsWith", "filter": "J.R"},
+        "age": {
+            "filterType": "number",
+            "type": "inRange",
+            "filter": 20,
+            "filterTo": 30,
+        },
+    },
+    "sortModel": [{"colId": "age", "sort": "asc"}],
+    "valueCols": ["name"],
+}
+
+
+def test_naive_pipeline_keeps_one_match_per_column():
+    util = AGGridMongoQueryUtil(forced_filters={"$match": {"org": 1}}, optimize=False)
+    assert util.build_query(make_request(20, 40, **MIXED_FILTERS)) == [
+        {"$match": {"org": 1}},
+        {"$match": {"country": {"$in": ["France", "Spain"]}}},
+        {"$match": {"name": {"$regex": "^J.R", "$options": "i"}}},
+        {"$match": {"age": {"$gt": 20, "$lt": 30}}},
+        {"$sort": {"age": 1}},
+        {"$skip": 20},
+        {"$limit": 20},
+        {"$project": {"_id": 0, "name": 1}},
+    ]
+
+
+def test_optimized_pipeline_has_a_single_leading_match():
+    util = AGGridMongoQueryUtil(forced_filters={"$match": {"org": 1}})
+    assert util.build_query(make_request(20, 40, **MIXED_FILTERS)) == [
+        {
+            "$match": {
+                "org": 1,
+                "country": {"$in": ["France", "Spain"]},
+                "name": {"$regex": "^J\\.R", "$options": "i"},
+                "age": {"$gt": 20, "$lt": 30},
+            }
+        },
+        {"$sort": {"age": 1}},
+        {"$skip": 20},
+        {"$limit": 20},
+        {"$project": {"_id": 0, "name": 1}},
+    ]
+
+
+def test_matches_on_a_repeated_field_are_merged_with_and():
+    util = AGGridMongoQueryUtil(forced_filters={"$match": {"age": {"$gte": 18}}})
+    request = make_request(
+        filterModel={
+            "age": {
+                "filterType": "number",
+                "operator": "OR",
+                "conditions": [
+                    {"type": "lessThan", "filter": 20},
+                    {"type": "greaterThan", "filter": 60},
+                ],
+            }
+        }
+    )
+    assert util.build_query(request)[0] == {
+        "$match": {
+            "age": {"$gte": 18},
+            "$or": [{"age": {"$lt": 20}}, {"age": {"$gt": 60}}],
+        }
+    }
+    request = make_request(
+        filterModel={"age": {"filterType": "number", "type": "lessThan", "filter": 65}}
+    )
+    assert util.build_query(request)[0] == {
+        "$match": {"$and": [{"age": {"$gte": 18}}, {"age": {"$lt": 65}}]}
+    }
+
+
+def test_text_match_modes():
+    request = make_request(
+        filterModel={
+            "name": {"filterType": "text", "type": "startsWith", "filter": "Jo"}
+        }
+    )
+    case_sensitive = AGGridMongoQueryUtil(text_match="case_sensitive")
+    assert case_sensitive.build_query(request)[0] == {
+        "$match": {"name": {"$regex": "^Jo"}}
+    }
+    assert case_sensitive.collation is None
+    collation = AGGridMongoQueryUtil(text_match="collation")
+    assert collation.build_query(request)[0] == {
+        "$match": {"name": {"$gte": "Jo", "$lte": "Jo￿"}}
+    }
+    assert collation.collation == {"locale": "en", "strength": 2}
+
+
+def test_quick_filter_uses_text_search_first():
+    util = AGGridMongoQueryUtil(forced_filters={"$lookup": {"from": "orgs"}})
+    request = make_request(quickFilter="john smith")
+    assert util.build_query(request, text_search=True) == [
+        {"$match": {"$text": {"$search": "john smith"}}},
+        {"$lookup": {"from": "orgs"}},
+        {"$sort": {"score": {"$meta": "textScore"}}},
+        {"$limit": 100},
+    ]
+
+
+def test_quick_filter_without_text_index_and_global_filters():
+    util = AGGridMongoQueryUtil(quick_filter_fields=["name", "city"])
+    request = AGGridTableRequest.model_validate(
+        {
+            "filters": {"quickFilter": "jo.", **GENDER_FILTER},
+            "globalFilters": {"active": {"filterType": "set", "values": [True]}},
+        }
+    )
+    assert util.build_query(request)[0] == {
+        "$match": {
+            "$or": [
+                {"name": {"$regex": "jo\\.", "$options": "i"}},
+                {"city": {"$regex": "jo\\.", "$options": "i"}},
+            ],
+            "active": {"$in": [True]},
+            "gender": "Female",
+        }
+    }
+    assert util.has_filters(request)
@@ -0,0 +1,57 @@
+import pytest
+
+from pymongo_util.mongo_tools.mongo_sync import MongoCollectionBaseClass
+
+
+class CachedCollection(MongoCollectionBaseClass):
+    cache_size = 2
+
+
+@pytest.fixture
+def cached_collection(make_collection, request):
+    coll = make_collection(request.node.name, soft_delete=False)
+    return CachedCollection(coll.client, coll.database, coll.collection)
+
+
+def test_find_one_is_cached_until_a_write(cached_collection):
+    coll = cached_collection
+    coll.insert_one({"plugin": "a", "version": 1})
+    assert coll.find_one({"plugin": "a"})["version"] == 1
+    assert coll.find_one({"plugin": "a"})["version"] == 1
+    assert coll.cache_stats()["hits"] == 1
+
+    coll.update_one(query={"plugin": "a"}, data={"version": 2})
+    assert coll.find_one({"plugin": "a"})["version"] == 2
+    assert coll.cache_stats()["misses"] == 2
+
+
+def test_cache_returns_copies_and_evicts_lru(cached_collection):
+    coll = cached_collection
+    coll.insert_many([{"plugin": p} for p in "abc"])
+    coll.find_one({"plugin": "a"})["plugin"] = "mutated"
+    assert coll.find_one({"plugin": "a"})["plugin"] == "a"
+    assert sorted(coll.distinct("plugin")) == ["a", "b", "c"]
+    assert coll.find_count({"plugin": {"$in": ["a", "b"]}}) == 2
+    stats = coll.cache_stats()
+    assert stats["evictions"] == 1
+    assert stats["size"] == 2
+
+
+def test_find_count_modes(make_collection):
+    coll = make_collection("count_modes", soft_delete=False)
+    coll.insert_many([{"g": i % 4} for i in range(200)])
+    assert coll.find_count({}, mode="estimated") == 200
+    assert coll.find_count({"g": 1}, mode="auto") == 50
+    with pytest.raises(ValueError):
+        coll.find_count({"g": 1}, mode="estimated")
+
+    assert coll.find_count({"g": 1}, mode="cached") == 50
+    coll.insert_one({"g": 1})
+    # reused until count_cache_ttl expires, writes do not refresh it
+    assert coll.find_count({"g": 1}, mode="cached") == 50
+    assert coll.find_count({"g": 1}) == 51
+
+    # the whole collection fits in the sample: exact
+    assert coll.find_count({"g": 1}, mode="approximate") == 51
+    approximate = coll.find_count({"g": 1}, mode="approximate", sample_size=100)
+    assert 20 <= approximate <= 90
@@ -0,0 +1,50 @@
+import datetime
+
+import bson
+from bson import Binary, Code, ObjectId, Regex
+from bson.raw_bson import RawBSONDocument
+
+from pymongo_util.mongo_tools.raw_documents import (
+    extract_fields,
+    iter_elements,
+    raw_batches_to_json,
+)
+
+DOCUMENT = {
+    "_id": ObjectId("65a000000000000000000000"),
+    "name": "Zoë",
+    "created": datetime.datetime(2024, 1, 1),
+    "blob": Binary(b"\x00\x01"),
+    "pattern": Regex("^a", "i"),
+    "script": Code("f()", {"x": 1}),
+    "tags": ["a", "b"],
+    "address": {"city": "Paris", "geo": {"lat": 48.8, "lng": 2.3}},
+    "score": 1.5,
+    "empty": None,
+}
+
+
+def test_elements_are_walked_without_decoding():
+    raw = bson.encode(DOCUMENT)
+    assert [name for name, _, _ in iter_elements(raw)] == list(DOCUMENT)
+
+
+def test_extract_fields_decodes_only_touched_fields():
+    raw = RawBSONDocument(bson.encode(DOCUMENT))
+    assert extract_fields(raw, ["name", "address.geo.lat", "tags", "missing.x"]) == {
+        "name": "Zoë",
+        "tags": ["a", "b"],
+        "address": {"geo": {"lat": 48.8}},
+    }
+
+
+def test_raw_batches_to_json():
+    batch = bson.encode({"a": 1, "b": {"c": 2}}) + bson.encode({"a": 3})
+    assert list(raw_batches_to_json([batch], fields=["b.c"])) == [
+        '{"b": {"c": 2}}',
+        "{}",
+    ]
+    assert list(raw_batches_to_json([batch])) == [
+        '{"a": 1, "b": {"c": 2}}',
+        '{"a": 3}',
+    ]
@@ -0,0 +1,41 @@
+def test_delete_one_archives_exactly_the_deleted_document(make_collection):
+    coll = make_collection("soft_one_coll", soft_delete=True)
+    coll.insert_many([{"group": "a", "id": 1}, {"group": "a", "id": 2}])
+    res = coll.delete_one({"group": "a"})
+    assert res.deleted_count == 1
+    archive = coll.client["deleted__mock_data"]["soft_one_coll"]
+    archived = list(archive.find({}))
+    assert len(archived) == 1
+    assert archived[0]["id"] == 1
+    assert "on" in archived[0]["deleted"]
+    assert coll.delete_one({"group": "missing"}).deleted_count == 0
+
+
+def test_delete_many_archives_in_bounded_batches(make_collection):
+    coll = make_collection("soft_many_coll", soft_delete=True)
+    coll.insert_many([{"id": i, "even": i % 2 == 0} for i in range(25)])
+    res = coll.delete_many({"even": True}, batch_size=4)
+    assert res.deleted_count == 13
+    archive = coll.client["deleted__mock_data"]["soft_many_coll"]
+    assert sorted(archive.distinct("id")) == list(range(0, 25, 2))
+    assert coll.find_count({}) == 12
+
+
+def test_delete_many_keeps_documents_changed_after_archiving(make_collection):
+    coll = make_collection("soft_race_coll", soft_delete=True)
+    coll.insert_many([{"id": i, "even": i % 2 == 0} for i in range(6)])
+    archive = coll._archive_collection()
+    archive_batch = archive.bulk_write
+
+    def concurrent_update(operations, **kwargs):
+        # another writer changes a document between the archive and the delete
+        coll.update_one({"id": 0}, {"even": False})
+        return archive_batch(operations, **kwargs)
+
+    archive.bulk_write = concurrent_update
+    coll._archive_collection = lambda: archive
+    assert coll.delete_many({"even": True}).deleted_count == 2
+    # the changed document is kept with its update, its archived copy is an extra one
+    assert coll.find_one({"id": 0}) == {"id": 0, "even": False}
+    assert sorted(archive.distinct("id")) == [0, 2, 4]
+    assert sorted(coll.distinct("id", {})) == [0, 1, 3, 5]